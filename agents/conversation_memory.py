@@ -0,0 +1,253 @@
+import os
+import threading
+from concurrent.futures import wait
+from functools import lru_cache
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+
+# Бюджет кратковременной памяти агента (саммари + дословные ходы), в токенах
+MEMORY_MAX_TOKENS = int(os.environ.get("MEMORY_MAX_TOKENS", "3000"))
+# Сколько последних ходов (реплика пользователя + ответ) всегда хранится дословно
+MEMORY_KEEP_TURNS = int(os.environ.get("MEMORY_KEEP_TURNS", "6"))
+# Старые ходы сворачиваются в саммари пачками, чтобы не звать LLM на каждом ходу
+MEMORY_FOLD_TURNS = int(os.environ.get("MEMORY_FOLD_TURNS", "4"))
+MEMORY_SUMMARY_MAX_TOKENS = int(os.environ.get("MEMORY_SUMMARY_MAX_TOKENS", "400"))
+
+MEMORY_SUMMARY_PROMPT = (
+    "Ты ведешь краткое резюме диалога пользователя с ассистентом. Обнови резюме, добавив в него новые реплики. "
+    "Сохрани факты о пользователе, его цели, эмоции, договоренности и выводы; опусти приветствия и повторы. "
+    "Пиши в третьем лице, не длиннее 150 слов. Верни ТОЛЬКО текст резюме."
+)
+
+
+@lru_cache(maxsize=1)
+def _tiktoken_encoding():
+    """Кодировка cl100k_base или None, если tiktoken не установлен или словарь недоступен офлайн."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"tiktoken недоступен, токены оцениваются по длине текста: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Локальный подсчет токенов (tiktoken; без него — оценка ~3 символа на токен)."""
+    encoding = _tiktoken_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 2) // 3
+
+
+class ConversationMemory:
+    """
+    Кратковременная память диалога с бюджетом токенов.
+
+    Последние keep_turns ходов хранятся дословно. Более старые ходы пачками
+    по fold_turns сворачиваются в инкрементально обновляемое саммари (LLM
+    получает прежнее саммари и только новые реплики). Если саммари и дословные
+    ходы не укладываются в max_tokens, сворачивается столько старых ходов,
+    сколько нужно (последний ход остается всегда).
+
+    Свернутые ходы убираются из дословной части только после того, как саммари
+    сохранено: если LLM упал или вернул пустой ответ, ходы остаются дословно
+    (бюджет временно превышен) до следующей попытки. Без llm старые ходы
+    сворачиваются в саммари из обрезанных реплик.
+
+    executor — пул (submit(fn) -> Future), в котором идет свертка, чтобы вызов
+    LLM не задерживал ответ пользователю; None — свертка в вызывающем потоке.
+    """
+    def __init__(self, llm=None, max_tokens: int = MEMORY_MAX_TOKENS, keep_turns: int = MEMORY_KEEP_TURNS,
+                 fold_turns: int = MEMORY_FOLD_TURNS, summary_max_tokens: int = MEMORY_SUMMARY_MAX_TOKENS,
+                 executor=None):
+        self.llm = llm
+        self.executor = executor
+        self.max_tokens = max_tokens
+        self.keep_turns = max(1, keep_turns)
+        self.fold_turns = max(1, fold_turns)
+        self.summary_max_tokens = summary_max_tokens
+
+        self.summary = ""
+        self._messages = []  # [(сообщение, число токенов)]
+        self._lock = threading.Lock()
+        self._folding = False  # одновременно идет не больше одной свертки
+        self._generation = 0  # растет при clear(): результат свертки старой памяти отбрасывается
+        self._fold_future = None
+
+    # --- Содержимое ---
+
+    @property
+    def messages(self) -> list:
+        """Дословно хранимые сообщения (без саммари)."""
+        with self._lock:
+            return [message for message, _ in self._messages]
+
+    def context_messages(self) -> list:
+        """Сообщения для промпта: саммари старой части диалога и последние ходы."""
+        with self._lock:
+            messages = [message for message, _ in self._messages]
+            if self.summary:
+                messages.insert(0, SystemMessage(content=f"Краткое содержание начала диалога: {self.summary}"))
+            return messages
+
+    def transcript(self) -> str:
+        """Весь известный диалог текстом (саммари + дословные ходы), например для анализа сессии."""
+        lines = [f"{m.type}: {m.content}" for m in self.messages]
+        if self.summary:
+            lines.insert(0, f"summary: {self.summary}")
+        return "\n".join(lines)
+
+    def token_count(self) -> int:
+        with self._lock:
+            return self._token_count()
+
+    def _token_count(self) -> int:
+        return count_tokens(self.summary) + sum(tokens for _, tokens in self._messages)
+
+    # --- Запись ---
+
+    def add_user_message(self, text: str):
+        self._add(HumanMessage(content=text))
+
+    def add_ai_message(self, text: str):
+        self._add(AIMessage(content=text))
+
+    def _add(self, message):
+        with self._lock:
+            self._messages.append((message, count_tokens(message.content)))
+
+    def add_turn(self, text: str, answer: str):
+        """Добавляет ход и при необходимости сворачивает старые ходы (в executor, если он задан)."""
+        self.add_user_message(text)
+        self.add_ai_message(answer)
+        if self.executor is not None:
+            self._schedule_fold()
+        else:
+            self._fold()
+
+    async def aadd_turn(self, text: str, answer: str):
+        """Асинхронный вариант add_turn."""
+        self.add_user_message(text)
+        self.add_ai_message(answer)
+        if self.executor is not None:
+            self._schedule_fold()
+        else:
+            await self._afold()
+
+    def clear(self):
+        with self._lock:
+            self._messages = []
+            self.summary = ""
+            self._generation += 1
+
+    def wait_for_fold(self, timeout: float = None) -> bool:
+        """Дожидается фоновой свертки. Возвращает False по таймауту."""
+        future = self._fold_future
+        if future is None:
+            return True
+        _, not_done = wait([future], timeout=timeout)
+        return not not_done
+
+    # --- Свертка старых ходов ---
+
+    def _schedule_fold(self):
+        with self._lock:
+            if self._folding or not self._turns_to_fold():
+                return
+        self._fold_future = self.executor.submit(self._fold)
+
+    def _fold(self):
+        folded, generation = self._begin_fold()
+        if folded:
+            self._finish_fold(folded, generation, self._summarize(folded))
+
+    async def _afold(self):
+        folded, generation = self._begin_fold()
+        if folded:
+            self._finish_fold(folded, generation, await self._asummarize(folded))
+
+    def _begin_fold(self):
+        """
+        Ходы, которые пора свернуть (из дословной части пока не удаляются), и поколение
+        памяти. Пустой список — сворачивать нечего или свертка уже идет.
+        """
+        with self._lock:
+            if self._folding:
+                return [], self._generation
+            folded = self._turns_to_fold()
+            self._folding = bool(folded)
+            return folded, self._generation
+
+    def _finish_fold(self, folded: list, generation: int, summary: str):
+        """Сохраняет саммари и только после этого убирает свернутые ходы из дословной части."""
+        summary = self._trim_summary(summary) if summary else ""
+        with self._lock:
+            self._folding = False
+            if not summary:
+                print("Саммари диалога не получено, старые ходы остаются дословно до следующей свертки.")
+                return
+            if generation != self._generation:
+                # Память очищена, пока шла свертка
+                return
+            self.summary = summary
+            self._messages = self._messages[len(folded):]
+
+    def _turn_starts(self) -> list:
+        """Индексы сообщений пользователя — начала ходов."""
+        return [i for i, (message, _) in enumerate(self._messages) if message.type == "human"]
+
+    def _turns_to_fold(self) -> list:
+        """Начало дословной части, которое пора свернуть в саммари (вызывается под блокировкой)."""
+        starts = self._turn_starts()
+        fold = 0
+        if len(starts) >= self.keep_turns + self.fold_turns:
+            fold = len(starts) - self.keep_turns
+        # Бюджет: сворачиваем, пока не уложимся (последний ход не трогаем)
+        while fold < len(starts) - 1 and self._tokens_after_fold(starts, fold) > self.max_tokens:
+            fold += 1
+        if fold == 0:
+            return []
+        cut = starts[fold] if fold < len(starts) else len(self._messages)
+        return [message for message, _ in self._messages[:cut]]
+
+    def _tokens_after_fold(self, starts: list, fold: int) -> int:
+        cut = starts[fold] if fold < len(starts) else len(self._messages)
+        # Саммари после свертки не длиннее summary_max_tokens
+        summary_tokens = self.summary_max_tokens if fold else count_tokens(self.summary)
+        return summary_tokens + sum(tokens for _, tokens in self._messages[cut:])
+
+    def _summary_messages(self, folded: list) -> list:
+        dialogue = "\n".join(f"{m.type}: {m.content}" for m in folded)
+        return [
+            SystemMessage(content=MEMORY_SUMMARY_PROMPT),
+            HumanMessage(content=f"Текущее резюме:\n{self.summary or '(пусто)'}\n\nНовые реплики:\n{dialogue}"),
+        ]
+
+    def _summarize(self, folded: list) -> str:
+        """Новое саммари или пустая строка, если LLM недоступен."""
+        if self.llm is None:
+            return self._fallback_summary(folded)
+        try:
+            return self.llm.invoke(self._summary_messages(folded)).content.strip()
+        except Exception as e:
+            print(f"Ошибка при обновлении саммари диалога: {e}")
+            return ""
+
+    async def _asummarize(self, folded: list) -> str:
+        if self.llm is None:
+            return self._fallback_summary(folded)
+        try:
+            return (await self.llm.ainvoke(self._summary_messages(folded))).content.strip()
+        except Exception as e:
+            print(f"Ошибка при обновлении саммари диалога: {e}")
+            return ""
+
+    def _fallback_summary(self, folded: list) -> str:
+        """Саммари без LLM: прежнее саммари и начала свернутых реплик."""
+        lines = [f"{m.type}: {m.content[:100]}" for m in folded]
+        return "\n".join(filter(None, [self.summary, *lines]))
+
+    def _trim_summary(self, summary: str) -> str:
+        # Саммари не должно съедать бюджет: обрезаем начало, свежие факты в конце
+        while summary and count_tokens(summary) > self.summary_max_tokens:
+            summary = summary[len(summary) // 10 + 1:]
+        return summary
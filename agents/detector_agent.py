@@ -1,54 +1,128 @@
 import os
 import json
 import logging
-from langchain_openai import ChatOpenAI
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from agents.llm_clients import get_chat_model
+from agents.response_cache import cached_invoke
 from langchain_core.messages import SystemMessage, HumanMessage
-from knowledge_base.bias_store import CognitiveBiasStore
+from knowledge_base.bias_store import get_bias_store
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Верификация найденных искажений: batch — все гипотезы одним запросом (по умолчанию),
+# concurrent — отдельный запрос на гипотезу, параллельно; serial — по очереди
+DETECTOR_VERIFY_MODE = os.environ.get("DETECTOR_VERIFY_MODE", "batch")
+DETECTOR_VERIFY_CONCURRENCY = int(os.environ.get("DETECTOR_VERIFY_CONCURRENCY", "5"))
+
+# Пул для параллельной синхронной верификации, общий для всех детекторов процесса
+_verify_pool = None
+_verify_pool_lock = threading.Lock()
+
+
+def _get_verify_pool() -> ThreadPoolExecutor:
+    global _verify_pool
+    with _verify_pool_lock:
+        if _verify_pool is None:
+            _verify_pool = ThreadPoolExecutor(max_workers=DETECTOR_VERIFY_CONCURRENCY, thread_name_prefix="verify")
+        return _verify_pool
+
 class DetectorAgent:
     """
     Агент для диагностики (Контур Б).
     Использует дешевую/быструю модель через OpenRouter.
+
+    Асинхронного варианта analyze нет намеренно: анализ не лежит на пути ответа.
+    Оркестратор и в синхронном, и в асинхронном пайплайне (aprocess_input) ставит
+    analyze в ограниченный пул analysis_pool, так что цикл событий его не ждет,
+    а число одновременных запросов к API ограничено размером пула.
     """
-    def __init__(self, model_name: str = "google/gemini-2.0-flash-exp:free"):
+    def __init__(self, model_name: str = "google/gemini-2.0-flash-exp:free", verify_mode: str = DETECTOR_VERIFY_MODE):
+        self.verify_mode = verify_mode
         try:
-            self.llm = ChatOpenAI(
-                base_url="https://openrouter.ai/api/v1",
-                api_key=os.environ.get('OPENROUTER_API_KEY'),
-                model=model_name,
+            self.llm = get_chat_model(
+                model_name,
                 temperature=0.1, # Низкая температура для анализа
                 default_headers={
                     "HTTP-Referer": "https://github.com/ai-thinker",
                     "X-Title": "AI Thinker Detector"
                 }
             )
-            self.bias_store = CognitiveBiasStore()
+            # База искажений одна на процесс: клиент Chroma и эмбеддинги не создаются заново
+            self.bias_store = get_bias_store()
             logging.info(f"DetectorAgent инициализирован ({model_name}).")
         except Exception as e:
             logging.error(f"Ошибка инициализации DetectorAgent: {e}")
             self.llm = None
             self.bias_store = None
 
-    def _verify_bias(self, text, suspected_bias):
-        """Верификация гипотезы (Адвокат Дьявола)."""
+    def _verification_messages(self, text, suspected_bias) -> list:
         verification_prompt = (
             f"Текст: «{text}»\n"
             f"Гипотеза: Здесь есть искажение '{suspected_bias}'.\n"
             "Твоя задача — найти аргументы ПРОТИВ этой гипотезы. "
             "Если сомнения сильны, верни FALSE. Если искажение очевидно, верни TRUE."
         )
+        return [
+            SystemMessage(content="You are a skeptical psychologist. Output only TRUE or FALSE."),
+            HumanMessage(content=verification_prompt)
+        ]
+
+    @staticmethod
+    def _is_verdict(content: str) -> bool:
+        content = content.upper()
+        return "TRUE" in content or "FALSE" in content
+
+    def _verify_bias(self, text, suspected_bias):
+        """Верификация гипотезы (Адвокат Дьявола)."""
         try:
-            messages = [
-                SystemMessage(content="You are a skeptical psychologist. Output only TRUE or FALSE."),
-                HumanMessage(content=verification_prompt)
-            ]
-            res = self.llm.invoke(messages)
-            return "TRUE" in res.content.strip().upper()
+            content = cached_invoke(self.llm, self._verification_messages(text, suspected_bias), "verify", self._is_verdict)
+            return "TRUE" in content.strip().upper()
         except Exception:
             return False
 
+    def _batch_verification_messages(self, text, suspected_biases: list) -> list:
+        hypotheses = "\n".join(f"{i}. {name}" for i, name in enumerate(suspected_biases, 1))
+        verification_prompt = (
+            f"Текст: «{text}»\n"
+            f"Гипотезы: здесь есть искажения:\n{hypotheses}\n"
+            "Для КАЖДОЙ гипотезы отдельно найди аргументы ПРОТИВ нее. "
+            "Если сомнения сильны, verdict — false. Если искажение очевидно, verdict — true.\n"
+            'Верни только JSON: {"verdicts": [{"id": 1, "verdict": true}]}'
+        )
+        return [
+            SystemMessage(content="You are a skeptical psychologist. Output only JSON."),
+            HumanMessage(content=verification_prompt)
+        ]
+
+    def _parse_verdicts(self, raw_content: str, count: int) -> list:
+        """Вердикты по порядку гипотез; ответ без вердикта для какой-то гипотезы — ошибка."""
+        verdicts = {}
+        for item in self._parse_analysis(raw_content)["verdicts"]:
+            verdict = item["verdict"]
+            verdicts[int(item["id"])] = verdict is True or str(verdict).strip().upper() == "TRUE"
+        return [verdicts[i] for i in range(1, count + 1)]
+
+    def _verify_biases(self, text, biases: list) -> list:
+        """Оставляет подтвержденные искажения (режим — verify_mode)."""
+        names = [b.get("name") for b in biases]
+        if not names:
+            return []
+        if self.verify_mode == "batch":
+            try:
+                content = cached_invoke(self.llm, self._batch_verification_messages(text, names), "verify",
+                                        lambda c: self._parse_verdicts(c, len(names)))
+                verdicts = self._parse_verdicts(content, len(names))
+            except Exception as e:
+                # Ответ не разобран — проверяем гипотезы по одной, параллельно
+                logging.warning(f"Пакетная верификация не удалась, проверяю по одной: {e}")
+                verdicts = list(_get_verify_pool().map(lambda name: self._verify_bias(text, name), names))
+        elif self.verify_mode == "concurrent":
+            verdicts = list(_get_verify_pool().map(lambda name: self._verify_bias(text, name), names))
+        else:
+            verdicts = [self._verify_bias(text, name) for name in names]
+        return [b for b, verdict in zip(biases, verdicts) if verdict]
+
     def _create_system_prompt(self, relevant_biases: list) -> str:
         if relevant_biases:
             biases_desc = "\n".join([f"- {b['name']}: {b['description']}" for b in relevant_biases])
@@ -61,7 +135,7 @@ class DetectorAgent:
 
 **1. Анализ мышления (Патопсихология):**
 Ищи не просто "ошибки", а структурные нарушения мышления по списку:
-{bias_instruction}
+{instruction}
 
 **2. Анализ аффекта (Выготский):**
 Единство аффекта и интеллекта. Если видишь сильный аффект (Гнев, Страх), отметь: "Когнитивная способность снижена из-за аффективного блока".
@@ -79,6 +153,22 @@ class DetectorAgent:
 }}
 """
 
+    def _analysis_messages(self, text: str, relevant_biases: list) -> list:
+        system_prompt = self._create_system_prompt(relevant_biases)
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=f"Проанализируй: \"{text}\"")
+        ]
+
+    def _parse_analysis(self, raw_content: str) -> dict:
+        # Очистка JSON от markdown
+        if "```json" in raw_content:
+            raw_content = raw_content.split("```json")[1].split("```")[0].strip()
+        elif "```" in raw_content:
+            raw_content = raw_content.split("```")[1].split("```")[0].strip()
+
+        return json.loads(raw_content)
+
     def analyze(self, text: str) -> dict:
         default_response = {"cognitive_biases": [], "emotional_tone": "Нейтральный", "communication_style": "Аналитический"}
 
@@ -86,29 +176,14 @@ class DetectorAgent:
             return default_response
 
         relevant_biases = self.bias_store.query_biases(text, n_results=5)
-        system_prompt = self._create_system_prompt(relevant_biases)
-
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=f"Проанализируй: \"{text}\"")
-        ]
+        messages = self._analysis_messages(text, relevant_biases)
 
         try:
-            res = self.llm.invoke(messages)
-            raw_content = res.content
-
-            # Очистка JSON от markdown
-            if "```json" in raw_content:
-                raw_content = raw_content.split("```json")[1].split("```")[0].strip()
-            elif "```" in raw_content:
-                raw_content = raw_content.split("```")[1].split("```")[0].strip()
-
-            analysis_data = json.loads(raw_content)
+            analysis_data = self._parse_analysis(cached_invoke(self.llm, messages, "analysis", self._parse_analysis))
 
             # Верификация
             if "cognitive_biases" in analysis_data:
-                verified = [b for b in analysis_data["cognitive_biases"] if self._verify_bias(text, b.get("name"))]
-                analysis_data["cognitive_biases"] = verified
+                analysis_data["cognitive_biases"] = self._verify_biases(text, analysis_data["cognitive_biases"])
 
             return analysis_data
 
@@ -0,0 +1,157 @@
+import os
+import weakref
+import threading
+import httpx
+from langchain_openai import ChatOpenAI
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+# Общий пул HTTP-соединений с OpenRouter для всех клиентов ChatOpenAI процесса:
+# keep-alive вместо нового TLS-рукопожатия на каждую сессию и модель
+LLM_HTTP_MAX_CONNECTIONS = int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS", "20"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.environ.get("LLM_HTTP_MAX_KEEPALIVE", "10"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP_TIMEOUT = float(os.environ.get("LLM_HTTP_TIMEOUT", "60"))
+LLM_HTTP_CONNECT_TIMEOUT = float(os.environ.get("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+# HTTP/2 включается, только если установлен пакет h2 (pip install httpx[http2])
+LLM_HTTP2 = os.environ.get("LLM_HTTP2", "1") == "1"
+
+# Клиенты ChatOpenAI не хранят состояния диалога, поэтому один клиент
+# на (модель, температура, заголовки) переиспользуется всеми сессиями процесса.
+_chat_models = {}
+_lock = threading.Lock()
+
+
+def _http2_available() -> bool:
+    if not LLM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ConnectionStats:
+    """
+    Счетчики переиспользования соединений общего пула.
+
+    Новое соединение узнается по сетевому потоку ответа (extension
+    network_stream httpcore), которого пул раньше не отдавал.
+    """
+    def __init__(self):
+        self._streams = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.http2_responses = 0
+
+    def record(self, response: httpx.Response):
+        stream = response.extensions.get("network_stream")
+        with self._lock:
+            self.requests += 1
+            if response.http_version == "HTTP/2":
+                self.http2_responses += 1
+            if stream is not None and stream not in self._streams:
+                self._streams.add(stream)
+                self.new_connections += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused": reused,
+                "reuse_rate": reused / self.requests if self.requests else 0.0,
+                "http2_responses": self.http2_responses,
+            }
+
+
+connection_stats = ConnectionStats()
+_http_client = None
+_async_http_client = None
+
+
+def _client_options() -> dict:
+    return {
+        "http2": _http2_available(),
+        "limits": httpx.Limits(
+            max_connections=LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(LLM_HTTP_TIMEOUT, connect=LLM_HTTP_CONNECT_TIMEOUT),
+        "follow_redirects": True,
+    }
+
+
+def get_http_client() -> httpx.Client:
+    """Общий для процесса синхронный HTTP-клиент (потокобезопасен)."""
+    global _http_client
+    with _lock:
+        if _http_client is None or _http_client.is_closed:
+            _http_client = httpx.Client(event_hooks={"response": [connection_stats.record]}, **_client_options())
+        return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Общий для процесса асинхронный HTTP-клиент. Соединения привязаны к циклу
+    событий, в котором открыты, поэтому клиент рассчитан на один цикл (бот).
+    """
+    global _async_http_client
+
+    async def record(response: httpx.Response):
+        connection_stats.record(response)
+
+    with _lock:
+        if _async_http_client is None or _async_http_client.is_closed:
+            _async_http_client = httpx.AsyncClient(event_hooks={"response": [record]}, **_client_options())
+        return _async_http_client
+
+
+def http_stats() -> dict:
+    """Метрики общего пула: запросы, новые и переиспользованные соединения."""
+    return connection_stats.snapshot()
+
+
+def close_http_clients():
+    """Закрывает синхронный пул (после остановки фоновых задач)."""
+    global _http_client
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+        _chat_models.clear()
+
+
+async def aclose_http_clients():
+    """Закрывает асинхронный пул (в цикле событий, где он работал)."""
+    global _async_http_client
+    with _lock:
+        client, _async_http_client = _async_http_client, None
+        _chat_models.clear()
+    if client is not None:
+        await client.aclose()
+
+
+def get_chat_model(model_name: str, temperature: float, default_headers: dict = None) -> ChatOpenAI:
+    """Возвращает общий для процесса клиент OpenRouter с заданными параметрами."""
+    headers = default_headers or {}
+    key = (model_name, temperature, tuple(sorted(headers.items())))
+    http_client, async_http_client = get_http_client(), get_async_http_client()
+    with _lock:
+        chat = _chat_models.get(key)
+        if chat is None:
+            chat = ChatOpenAI(
+                base_url=OPENROUTER_BASE_URL,
+                api_key=os.environ.get('OPENROUTER_API_KEY'),
+                model=model_name,
+                temperature=temperature,
+                default_headers=headers,
+                http_client=http_client,
+                http_async_client=async_http_client
+            )
+            _chat_models[key] = chat
+        return chat
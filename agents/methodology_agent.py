@@ -1,21 +1,15 @@
-import os
-from langchain_openai import ChatOpenAI
+import asyncio
+from agents.llm_clients import get_chat_model
 from langchain_core.messages import HumanMessage, SystemMessage
-from database.db_connector import chroma_client
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-
-# Оставляем локальные эмбеддинги (они бесплатные и быстрые)
-embedding_function = SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+from database.db_connector import chroma_client, default_embedding
 
 class MethodologyAgent:
     """
     Агент-Партнер (использует 'умную' модель с Reasoning, если доступна).
     """
     def __init__(self, user_id: str = "default_user", model_name: str = "deepseek/deepseek-r1:free"):
-        self.chat = ChatOpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=os.environ.get('OPENROUTER_API_KEY'),
-            model=model_name,
+        self.chat = get_chat_model(
+            model_name,
             temperature=0.6,
             default_headers={"HTTP-Referer": "https://github.com/ai-thinker"}
         )
@@ -23,48 +17,113 @@ class MethodologyAgent:
         collection_name = f"methodology_memory_{user_id}"
         self.collection = chroma_client.get_or_create_collection(
             name=collection_name,
-            embedding_function=embedding_function
+            embedding_function=default_embedding
         )
         self.message_history = []
         print(f"MethodologyAgent инициализирован ({model_name}).")
 
-    def execute(self, system_prompt: str, user_prompt: str) -> str:
-        try:
-            # RAG (поиск контекста)
-            results = self.collection.query(query_texts=[user_prompt], n_results=3)
-            relevant_contexts = results["documents"][0] if results["documents"] else []
+    def _recall_contexts(self, user_prompt: str) -> list:
+        """RAG: ищет похожие фрагменты прошлых сессий."""
+        results = self.collection.query(query_texts=[user_prompt], n_results=3)
+        return results["documents"][0] if results["documents"] else []
+
+    def _build_messages(self, system_prompt: str, user_prompt: str, relevant_contexts: list) -> list:
+        context_block = ""
+        if relevant_contexts:
+            context_block = "📌 Контекст из прошлого:\n" + "\n".join([f"- {ctx}" for ctx in relevant_contexts])
 
-            context_block = ""
-            if relevant_contexts:
-                context_block = "📌 Контекст из прошлого:\n" + "\n".join([f"- {ctx}" for ctx in relevant_contexts])
+        messages = [SystemMessage(content=system_prompt + "\n" + context_block)]
 
-            messages = [SystemMessage(content=system_prompt + "\n" + context_block)]
+        # Краткая история текущей сессии
+        for role, content in self.message_history[-4:]:
+            if role == "user":
+                messages.append(HumanMessage(content=content))
+            else:
+                messages.append(SystemMessage(content=content)) # Или AIMessage
 
-            # Краткая история текущей сессии
-            for role, content in self.message_history[-4:]:
-                if role == "user":
-                    messages.append(HumanMessage(content=content))
-                else:
-                    messages.append(SystemMessage(content=content)) # Или AIMessage
+        messages.append(HumanMessage(content=user_prompt))
+        return messages
 
-            messages.append(HumanMessage(content=user_prompt))
+    def _remember(self, user_prompt: str, answer: str):
+        """Сохраняет ход в векторную память и в историю сессии."""
+        self.collection.add(
+            ids=[f"turn_{len(self.message_history)}"],
+            documents=[user_prompt + " -> " + answer],
+            metadatas=[{"type": "interaction"}]
+        )
+        self.message_history.append(("user", user_prompt))
+        self.message_history.append(("ai", answer))
+
+    def execute(self, system_prompt: str, user_prompt: str) -> str:
+        try:
+            relevant_contexts = self._recall_contexts(user_prompt)
+            messages = self._build_messages(system_prompt, user_prompt, relevant_contexts)
 
             response = self.chat.invoke(messages)
 
-            # Сохраняем в память
-            self.collection.add(
-                ids=[f"turn_{len(self.message_history)}"],
-                documents=[user_prompt + " -> " + response.content],
-                metadatas=[{"type": "interaction"}]
-            )
-            self.message_history.append(("user", user_prompt))
-            self.message_history.append(("ai", response.content))
+            self._remember(user_prompt, response.content)
+            return response.content
+
+        except Exception as e:
+            print(f"MethodologyAgent Error: {e}")
+            return "Ошибка методологического ядра."
+
+    async def aexecute(self, system_prompt: str, user_prompt: str) -> str:
+        """
+        Асинхронный вариант execute. Запрос к LLM идет через ainvoke,
+        а короткие локальные операции с ChromaDB — в пуле потоков.
+        """
+        try:
+            relevant_contexts = await asyncio.to_thread(self._recall_contexts, user_prompt)
+            messages = self._build_messages(system_prompt, user_prompt, relevant_contexts)
+
+            response = await self.chat.ainvoke(messages)
 
+            await asyncio.to_thread(self._remember, user_prompt, response.content)
             return response.content
 
         except Exception as e:
             print(f"MethodologyAgent Error: {e}")
             return "Ошибка методологического ядра."
 
+    def stream_execute(self, system_prompt: str, user_prompt: str):
+        """
+        Потоковый вариант execute: отдает ответ токенами по мере генерации.
+        В память ход сохраняется целиком после завершения потока.
+        """
+        parts = []
+        try:
+            relevant_contexts = self._recall_contexts(user_prompt)
+            messages = self._build_messages(system_prompt, user_prompt, relevant_contexts)
+
+            for chunk in self.chat.stream(messages):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+
+            self._remember(user_prompt, "".join(parts))
+
+        except Exception as e:
+            print(f"MethodologyAgent Error: {e}")
+            yield "Ошибка методологического ядра."
+
+    async def astream_execute(self, system_prompt: str, user_prompt: str):
+        """Асинхронный потоковый вариант execute."""
+        parts = []
+        try:
+            relevant_contexts = await asyncio.to_thread(self._recall_contexts, user_prompt)
+            messages = self._build_messages(system_prompt, user_prompt, relevant_contexts)
+
+            async for chunk in self.chat.astream(messages):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+
+            await asyncio.to_thread(self._remember, user_prompt, "".join(parts))
+
+        except Exception as e:
+            print(f"MethodologyAgent Error: {e}")
+            yield "Ошибка методологического ядра."
+
     def clear_memory(self):
         self.message_history = []
@@ -0,0 +1,254 @@
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+
+# Кэш ответов LLM для детерминированных служебных вызовов (верификация искажений,
+# оценка значимости, диагностика): одинаковые запросы не уходят в сеть повторно
+LLM_CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", "2000"))
+# Срок жизни ответа в секундах
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", "86400"))
+# Файл дискового уровня (SQLite); пустая строка — только память процесса
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "")
+# Типы вызовов, для которых кэш включен (через запятую); пустая строка — кэш выключен.
+# Полный анализ сообщения ("analysis") по умолчанию не кэшируется: его результат
+# зависит от найденных в базе искажений и пишется в профиль пользователя
+LLM_CACHE_CALLS = os.environ.get("LLM_CACHE_CALLS", "verify,significance,diagnosis")
+
+
+def normalize_messages(messages: list) -> list:
+    """Роль и текст сообщения без лишних пробелов и переводов строк."""
+    return [(m.type, " ".join(str(m.content).split())) for m in messages]
+
+
+class ResponseCache:
+    """
+    Кэш ответов LLM по ключу (модель, параметры, нормализованные сообщения).
+
+    Уровень в памяти — LRU на max_entries ответов с TTL. Необязательный
+    дисковый уровень — таблица SQLite: переживает перезапуск процесса,
+    найденные там ответы поднимаются в LRU. Кэшируются только типы вызовов
+    из calls; пустые ответы и ошибки не кэшируются.
+
+    Блокировка защищает только LRU и счетчики. К SQLite каждый поток ходит
+    через свое соединение (WAL), поэтому чтение с диска в одном потоке
+    не задерживает обращения к кэшу из других.
+    """
+    def __init__(self, max_entries: int = LLM_CACHE_SIZE, ttl: float = LLM_CACHE_TTL,
+                 disk_path: str = LLM_CACHE_PATH, calls: str = LLM_CACHE_CALLS):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.calls = {c.strip() for c in calls.split(",") if c.strip()}
+        self._memory = OrderedDict()  # key -> (ответ, момент истечения)
+        self._lock = threading.Lock()
+
+        self.disk_path = disk_path or None
+        self._local = threading.local()
+        self._connections = []  # все открытые соединения потоков, чтобы закрыть их в close()
+        if self.disk_path:
+            connection = self._disk()
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, call_type TEXT NOT NULL, content TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.commit()
+
+        # Метрики: {тип вызова: {"memory_hits": .., "disk_hits": .., "misses": ..}}
+        self._counters = defaultdict(lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+
+    def _disk(self):
+        """Соединение с дисковым уровнем для текущего потока или None, если диска нет."""
+        if self.disk_path is None:
+            return None
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # check_same_thread=False только ради close() из другого потока
+            connection = sqlite3.connect(self.disk_path, timeout=5, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def enabled(self, call_type: str) -> bool:
+        return call_type in self.calls
+
+    @staticmethod
+    def key(llm, messages: list):
+        """Ключ запроса или None, если модель не опознать (например, заглушка в тестах)."""
+        model = getattr(llm, "model_name", None)
+        if not isinstance(model, str):
+            return None
+        params = {name: getattr(llm, name, None) for name in ("temperature", "max_tokens", "top_p")}
+        payload = json.dumps([model, params, normalize_messages(messages)], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, call_type: str, key: str):
+        """Сохраненный ответ или None. Считает попадания и промахи по типу вызова."""
+        content = self._memory_get(call_type, key)
+        if content is not None:
+            return content
+        return self._disk_get(call_type, key)
+
+    async def aget(self, call_type: str, key: str):
+        """Асинхронный get: уровень в памяти — сразу, запрос к SQLite — в пуле потоков."""
+        content = self._memory_get(call_type, key)
+        if content is not None:
+            return content
+        if self.disk_path is None:
+            return self._disk_get(call_type, key)  # без диска — только учет промаха
+        return await asyncio.to_thread(self._disk_get, call_type, key)
+
+    def put(self, call_type: str, key: str, content: str):
+        expires_at = self._memory_put(key, content)
+        self._disk_put(call_type, key, content, expires_at)
+
+    async def aput(self, call_type: str, key: str, content: str):
+        """Асинхронный put: запись в SQLite с коммитом не блокирует цикл событий."""
+        expires_at = self._memory_put(key, content)
+        if self.disk_path is not None:
+            await asyncio.to_thread(self._disk_put, call_type, key, content, expires_at)
+
+    def _memory_get(self, call_type: str, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                self._counters[call_type]["memory_hits"] += 1
+                return entry[0]
+            if entry is not None:
+                del self._memory[key]
+        return None
+
+    def _disk_get(self, call_type: str, key: str):
+        """Поиск на диске после промаха в памяти; без диска — просто учет промаха."""
+        row = None
+        disk = self._disk()
+        if disk is not None:
+            row = disk.execute("SELECT content, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] <= time.time():
+                disk.execute("DELETE FROM responses WHERE key = ?", (key,))
+                disk.commit()
+                row = None
+
+        with self._lock:
+            if row is not None:
+                self._remember(key, row[0], row[1])
+                self._counters[call_type]["disk_hits"] += 1
+                return row[0]
+            self._counters[call_type]["misses"] += 1
+            return None
+
+    def _memory_put(self, key: str, content: str) -> float:
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, content, expires_at)
+        return expires_at
+
+    def _disk_put(self, call_type: str, key: str, content: str, expires_at: float):
+        disk = self._disk()
+        if disk is not None:
+            disk.execute(
+                "INSERT OR REPLACE INTO responses (key, call_type, content, expires_at) VALUES (?, ?, ?, ?)",
+                (key, call_type, content, expires_at)
+            )
+            disk.commit()
+
+    def _remember(self, key: str, content: str, expires_at: float):
+        # Вызывается под self._lock
+        self._memory[key] = (content, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_call = {call: dict(counters) for call, counters in self._counters.items()}
+            memory_hits = sum(c["memory_hits"] for c in by_call.values())
+            disk_hits = sum(c["disk_hits"] for c in by_call.values())
+            misses = sum(c["misses"] for c in by_call.values())
+            lookups = memory_hits + disk_hits + misses
+            return {
+                "memory_hits": memory_hits,
+                "disk_hits": disk_hits,
+                "misses": misses,
+                "hit_rate": (memory_hits + disk_hits) / lookups if lookups else 0.0,
+                "size": len(self._memory),
+                "by_call": by_call,
+            }
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self.disk_path = None
+        for connection in connections:
+            connection.close()
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Общий для процесса кэш ответов LLM."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
+
+
+def _lookup(llm, messages: list, call_type: str):
+    cache = get_response_cache()
+    if call_type is None or not cache.enabled(call_type):
+        return cache, None, None
+    key = cache.key(llm, messages)
+    return cache, key, cache.get(call_type, key) if key else None
+
+
+async def _alookup(llm, messages: list, call_type: str):
+    cache = get_response_cache()
+    if call_type is None or not cache.enabled(call_type):
+        return cache, None, None
+    key = cache.key(llm, messages)
+    return cache, key, await cache.aget(call_type, key) if key else None
+
+
+def _cacheable(content: str, validate) -> bool:
+    if not content.strip():
+        return False
+    try:
+        return validate is None or bool(validate(content))
+    except Exception:
+        return False
+
+
+def cached_invoke(llm, messages: list, call_type: str = None, validate=None) -> str:
+    """
+    llm.invoke(messages).content с кэшем ответов для включенных типов вызовов.
+    validate(content) — необязательная проверка ответа: непрошедшие не кэшируются.
+    Ошибки LLM пробрасываются вызывающему, как у обычного invoke.
+    """
+    cache, key, content = _lookup(llm, messages, call_type)
+    if content is not None:
+        return content
+    content = llm.invoke(messages).content
+    if key and _cacheable(content, validate):
+        cache.put(call_type, key, content)
+    return content
+
+
+async def acached_invoke(llm, messages: list, call_type: str = None, validate=None) -> str:
+    """Асинхронный вариант cached_invoke: дисковый уровень кэша читается и пишется вне цикла событий."""
+    cache, key, content = await _alookup(llm, messages, call_type)
+    if content is not None:
+        return content
+    content = (await llm.ainvoke(messages)).content
+    if key and _cacheable(content, validate):
+        await cache.aput(call_type, key, content)
+    return content
@@ -1,30 +1,33 @@
 import os
 import traceback
-from langchain_openai import ChatOpenAI
+from agents.llm_clients import get_chat_model
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_classic.memory import ConversationBufferMemory
+from agents.conversation_memory import ConversationMemory
+from agents.response_cache import cached_invoke, acached_invoke
+
+# Служебный канал (оценки, извлечение JSON, саммари): своя модель и температура,
+# без персоны и без памяти диалога
+UTILITY_MODEL = os.environ.get("UTILITY_MODEL", "google/gemini-2.0-flash-exp:free")
+UTILITY_TEMPERATURE = float(os.environ.get("UTILITY_TEMPERATURE", "0.1"))
 
 class TaskAgent:
     """
     Агент для выполнения конкретных задач (режим "Копилот").
     Использует OpenRouter.
     """
-    def __init__(self, system_prompt: str = None, model_name: str = "google/gemini-2.0-flash-exp:free"):
+    def __init__(self, system_prompt: str = None, model_name: str = "google/gemini-2.0-flash-exp:free",
+                 memory_executor=None):
         api_key = os.environ.get('OPENROUTER_API_KEY')
         if not api_key:
             raise ValueError("Переменная окружения OPENROUTER_API_KEY не установлена.")
 
-        # Инициализация через OpenRouter
-        self.chat = ChatOpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=api_key,
-            model=model_name,
-            temperature=0.7,
-            default_headers={
-                "HTTP-Referer": "https://github.com/ai-thinker",
-                "X-Title": "AI Thinker Prototype"
-            }
-        )
+        # Общий для процесса клиент OpenRouter
+        headers = {
+            "HTTP-Referer": "https://github.com/ai-thinker",
+            "X-Title": "AI Thinker Prototype"
+        }
+        self.chat = get_chat_model(model_name, temperature=0.7, default_headers=headers)
+        self.utility_chat = get_chat_model(UTILITY_MODEL, temperature=UTILITY_TEMPERATURE, default_headers=headers)
 
         # Системный промпт по умолчанию
         self.system_prompt = system_prompt or (
@@ -38,29 +41,107 @@ class TaskAgent:
             "Ассертивный, но направляющий. Ты не слуга, а старший научный сотрудник, помогающий коллеге разобраться в хаосе мыслей."
         )
 
-        self.memory = ConversationBufferMemory(return_messages=True)
+        # Последние ходы дословно, более старые — в саммари (бюджет токенов, см. ConversationMemory).
+        # memory_executor — пул, в котором саммари обновляется вне пути ответа
+        self.memory = ConversationMemory(llm=self.utility_chat, executor=memory_executor)
         print(f"TaskAgent инициализирован на модели: {model_name}")
 
-    def process(self, text: str, context_memory: str = "") -> str:
-        try:
-            full_system_prompt = self.system_prompt
-            if context_memory.strip():
-                full_system_prompt += "\n\n" + context_memory.strip()
+    def _build_messages(self, text: str, context_memory: str) -> list:
+        """Собирает системный промпт, историю диалога и новое сообщение."""
+        full_system_prompt = self.system_prompt
+        if context_memory.strip():
+            full_system_prompt += "\n\n" + context_memory.strip()
 
-            messages = [SystemMessage(content=full_system_prompt)]
-            messages.extend(self.memory.chat_memory.messages)
-            messages.append(HumanMessage(content=text))
+        messages = [SystemMessage(content=full_system_prompt)]
+        messages.extend(self.memory.context_messages())
+        messages.append(HumanMessage(content=text))
+        return messages
 
-            response = self.chat.invoke(messages)
+    def _remember(self, text: str, answer: str):
+        self.memory.add_turn(text, answer)
 
-            self.memory.chat_memory.add_user_message(text)
-            self.memory.chat_memory.add_ai_message(response.content)
+    async def _aremember(self, text: str, answer: str):
+        await self.memory.aadd_turn(text, answer)
 
+    def process(self, text: str, context_memory: str = "") -> str:
+        try:
+            response = self.chat.invoke(self._build_messages(text, context_memory))
+            self._remember(text, response.content)
             return response.content
         except Exception as e:
             print(f"Ошибка при обращении к LLM: {e}")
             traceback.print_exc()
             return "Извините, произошла ошибка сети или API."
 
+    async def aprocess(self, text: str, context_memory: str = "") -> str:
+        """Асинхронный вариант process: не занимает поток на время ожидания LLM."""
+        try:
+            response = await self.chat.ainvoke(self._build_messages(text, context_memory))
+            await self._aremember(text, response.content)
+            return response.content
+        except Exception as e:
+            print(f"Ошибка при обращении к LLM: {e}")
+            traceback.print_exc()
+            return "Извините, произошла ошибка сети или API."
+
+    def stream(self, text: str, context_memory: str = ""):
+        """
+        Потоковый вариант process: отдает ответ по мере генерации (токенами).
+        В память диалога ответ попадает целиком, когда поток завершен.
+        """
+        parts = []
+        try:
+            for chunk in self.chat.stream(self._build_messages(text, context_memory)):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+            self._remember(text, "".join(parts))
+        except Exception as e:
+            print(f"Ошибка при обращении к LLM: {e}")
+            traceback.print_exc()
+            yield "Извините, произошла ошибка сети или API."
+
+    async def astream(self, text: str, context_memory: str = ""):
+        """Асинхронный потоковый вариант process."""
+        parts = []
+        try:
+            async for chunk in self.chat.astream(self._build_messages(text, context_memory)):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+            await self._aremember(text, "".join(parts))
+        except Exception as e:
+            print(f"Ошибка при обращении к LLM: {e}")
+            traceback.print_exc()
+            yield "Извините, произошла ошибка сети или API."
+
+    @staticmethod
+    def _utility_messages(text: str, instructions: str) -> list:
+        if not text:
+            # Задание целиком в инструкции (данные подставлены в промпт)
+            return [HumanMessage(content=instructions)]
+        return [SystemMessage(content=instructions), HumanMessage(content=text)]
+
+    def complete(self, text: str, instructions: str, call_type: str = None) -> str:
+        """
+        Служебный запрос без состояния: только instructions и text, без персоны
+        и истории диалога; в память диалога ничего не записывается.
+        call_type — тип вызова для кэша ответов (см. LLM_CACHE_CALLS); None — без кэша.
+        При ошибке возвращает пустую строку.
+        """
+        try:
+            return cached_invoke(self.utility_chat, self._utility_messages(text, instructions), call_type)
+        except Exception as e:
+            print(f"Ошибка служебного запроса к LLM: {e}")
+            return ""
+
+    async def acomplete(self, text: str, instructions: str, call_type: str = None) -> str:
+        """Асинхронный вариант complete."""
+        try:
+            return await acached_invoke(self.utility_chat, self._utility_messages(text, instructions), call_type)
+        except Exception as e:
+            print(f"Ошибка служебного запроса к LLM: {e}")
+            return ""
+
     def clear_memory(self):
-        self.memory.chat_memory.clear()
+        self.memory.clear()
@@ -0,0 +1,81 @@
+"""
+Бенчмарк верификации найденных искажений в DetectorAgent: по одной гипотезе
+последовательно (как было), одним пакетным запросом и параллельными запросами.
+
+LLM имитируется: ответ приходит через BENCH_LLM_LATENCY_MS плюс
+BENCH_LLM_VERDICT_MS на каждый вердикт в ответе (генерация более длинного
+пакетного ответа). Сеть не нужна, кэш ответов не задействуется.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_bias_verification.py
+    BENCH_LLM_LATENCY_MS=800 python benchmarks/bench_bias_verification.py
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from langchain_core.messages import AIMessage  # noqa: E402
+from agents.detector_agent import DetectorAgent  # noqa: E402
+
+CANDIDATES = [1, 3, 5]
+MODES = ["serial", "batch", "concurrent"]
+LATENCY_MS = int(os.environ.get("BENCH_LLM_LATENCY_MS", "400"))
+VERDICT_MS = int(os.environ.get("BENCH_LLM_VERDICT_MS", "15"))
+TEXT = "Я опять все испортил, у меня никогда ничего не получается, и коллеги точно считают меня неудачником."
+
+
+class _FakeLLM:
+    """Подтверждает все гипотезы; без model_name, поэтому ответы не кэшируются."""
+    def __init__(self):
+        self.calls = 0
+
+    def _answer(self, messages):
+        self.calls += 1
+        prompt = messages[-1].content
+        ids = [int(i) for i in re.findall(r"^(\d+)\. ", prompt, flags=re.MULTILINE)]
+        if not ids:
+            return 1, AIMessage(content="TRUE")
+        verdicts = ", ".join(f'{{"id": {i}, "verdict": true}}' for i in ids)
+        return len(ids), AIMessage(content=f'{{"verdicts": [{verdicts}]}}')
+
+    def invoke(self, messages):
+        count, answer = self._answer(messages)
+        time.sleep((LATENCY_MS + VERDICT_MS * count) / 1000)
+        return answer
+
+
+def make_detector(mode: str) -> DetectorAgent:
+    detector = DetectorAgent.__new__(DetectorAgent)  # без клиента OpenRouter и базы искажений
+    detector.llm = _FakeLLM()
+    detector.verify_mode = mode
+    return detector
+
+
+def measure(mode: str, count: int) -> tuple:
+    """(мс на сообщение, число запросов к LLM)."""
+    detector = make_detector(mode)
+    biases = [{"name": f"Искажение {i}"} for i in range(count)]
+    start = time.perf_counter()
+    verified = detector._verify_biases(TEXT, biases)
+    elapsed = (time.perf_counter() - start) * 1000
+    assert len(verified) == count
+    return elapsed, detector.llm.calls
+
+
+def main():
+    print(f"Задержка LLM: {LATENCY_MS} мс + {VERDICT_MS} мс на вердикт")
+    header = " | ".join(f"{mode:>17}" for mode in MODES)
+    print(f"{'гипотез':>7} | {header}")
+    for count in CANDIDATES:
+        cells = []
+        for mode in MODES:
+            elapsed, calls = measure(mode, count)
+            cells.append(f"{elapsed:>6.0f} мс, {calls} запр.")
+        print(f"{count:>7} | " + " | ".join(f"{c:>17}" for c in cells))
+
+
+if __name__ == "__main__":
+    main()
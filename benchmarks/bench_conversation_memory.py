@@ -0,0 +1,64 @@
+"""
+Бенчмарк размера промпта TaskAgent в зависимости от числа ходов сессии:
+неограниченная история (как было с ConversationBufferMemory) против
+ConversationMemory с бюджетом токенов и саммари старых ходов.
+
+Ответы модели и саммари имитируются, сеть не нужна. Токены считаются
+локально (agents.conversation_memory.count_tokens).
+
+Запуск из корня репозитория:
+    python benchmarks/bench_conversation_memory.py
+    MEMORY_MAX_TOKENS=1500 MEMORY_KEEP_TURNS=4 python benchmarks/bench_conversation_memory.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from langchain_core.messages import AIMessage  # noqa: E402
+from agents.conversation_memory import ConversationMemory, count_tokens  # noqa: E402
+
+CHECKPOINTS = [5, 10, 25, 50, 100, 200]
+
+USER_MESSAGE = "Я снова отложил подготовку отчета на вечер, хотя собирался сделать его утром. Почему так выходит? (ход {i})"
+AI_ANSWER = (
+    "Давай разберемся. Что именно ты почувствовал утром, когда собирался начать? "
+    "Попробуй описать первую мысль, которая появилась перед тем, как ты переключился. (ход {i})"
+)
+
+
+class _FakeSummaryLLM:
+    """Саммари фиксированного размера, как у модели с ограничением в 150 слов."""
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        return AIMessage(content="Пользователь обсуждает прокрастинацию с отчетом и утреннюю тревогу. " * 8)
+
+
+def prompt_tokens(messages) -> int:
+    return sum(count_tokens(m.content) for m in messages)
+
+
+def main():
+    llm = _FakeSummaryLLM()
+    memory = ConversationMemory(llm=llm)
+    unbounded = []  # полная история, как в ConversationBufferMemory
+
+    print(f"Бюджет: {memory.max_tokens} токенов, дословно последних ходов: {memory.keep_turns}")
+    print(f"{'ходов':>6} | {'вся история, токенов':>21} | {'с бюджетом, токенов':>20} | {'вызовов саммари':>16}")
+    start = time.perf_counter()
+    for i in range(1, max(CHECKPOINTS) + 1):
+        text, answer = USER_MESSAGE.format(i=i), AI_ANSWER.format(i=i)
+        unbounded.append(count_tokens(text) + count_tokens(answer))
+        memory.add_turn(text, answer)
+        if i in CHECKPOINTS:
+            print(f"{i:>6} | {sum(unbounded):>21} | {prompt_tokens(memory.context_messages()):>20} | {llm.calls:>16}")
+    elapsed = (time.perf_counter() - start) / max(CHECKPOINTS) * 1000
+    print(f"Накладные расходы памяти (без LLM): {elapsed:.2f} мс на ход")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Бенчмарк расчета весов когнитивных паттернов.
+
+Сравнивает прежний путь (загрузка всех наблюдений каждого паттерна в Python,
+по запросу на паттерн) с агрегацией в SQL (DynamicMemory.get_pattern_weights)
+на 1k / 10k / 100k наблюдений у одного пользователя. Активность за окно
+одинакова (WINDOW_OBSERVATIONS наблюдений за последние WINDOW_DAYS дней),
+растет только старая история: агрегация должна оставаться плоской, потому что
+индекс (user_id, observed_at, pattern_name) отсекает все, что старше окна.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_pattern_weights.py
+
+База создается во временном каталоге, рабочие данные не затрагиваются.
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(tempfile.mkdtemp(prefix="bench_patterns_"))  # agent_memory.db и chroma создаются здесь
+
+import database.db_connector  # noqa: E402  (инициализирует подключения до моделей)
+from database.db_connector import session_scope, engine  # noqa: E402
+from database.models import CognitivePattern  # noqa: E402
+from orchestrator.dynamic_memory import DynamicMemory  # noqa: E402
+
+PATTERNS = ["black_and_white_thinking", "catastrophizing", "overgeneralization", "personalization"]
+SIZES = [1_000, 10_000, 100_000]
+HISTORY_DAYS = 365
+WINDOW_DAYS = 30
+WINDOW_OBSERVATIONS = 500
+REPEATS = 5
+
+
+class _NoLLM:
+    """DynamicMemory в бенчмарке не обращается к LLM."""
+    def process(self, *args, **kwargs):
+        return "0.0"
+
+
+def populate(user_id: int, count: int):
+    """WINDOW_OBSERVATIONS наблюдений внутри окна, остальные — старше окна."""
+    now = datetime.utcnow()
+    window_minutes = WINDOW_DAYS * 24 * 60
+    rows = [
+        {
+            "user_id": user_id,
+            "pattern_name": random.choice(PATTERNS),
+            "context": "",
+            "confidence_score": 80,
+            "observed_at": now - timedelta(minutes=(
+                random.randint(0, window_minutes - 1) if i < WINDOW_OBSERVATIONS
+                else random.randint(window_minutes + 24 * 60, HISTORY_DAYS * 24 * 60)
+            )),
+        }
+        for i in range(count)
+    ]
+    with engine.begin() as connection:
+        connection.execute(CognitivePattern.__table__.insert(), rows)
+
+
+def legacy_report(memory: DynamicMemory, window_days: int = WINDOW_DAYS) -> dict:
+    """Прежний путь: все паттерны, затем по запросу и циклу в Python на каждый."""
+    with session_scope() as session:
+        names = sorted({p.pattern_name for p in session.query(CognitivePattern).filter_by(user_id=memory.user_id)})
+    weights = {}
+    now = datetime.utcnow()
+    for name in names:
+        with session_scope() as session:
+            observed = [
+                p.observed_at for p in session.query(CognitivePattern)
+                .filter_by(user_id=memory.user_id, pattern_name=name).all()
+            ]
+        total = 0.0
+        for observed_at in observed:
+            days_ago = (now - observed_at).days
+            if days_ago <= window_days:
+                total += 0.9 ** (days_ago / 7)
+        weights[name] = round(total, 2)
+    return weights
+
+
+def measure(fn) -> float:
+    """Медиана времени выполнения в миллисекундах."""
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)[len(timings) // 2]
+
+
+def main():
+    random.seed(42)
+    print(f"{'наблюдений':>12} | {'прежний путь, мс':>17} | {'SQL-агрегация, мс':>18}")
+    for size in SIZES:
+        memory = DynamicMemory(f"bench_{size}", _NoLLM())
+        populate(memory.user_id, size)
+
+        legacy = legacy_report(memory)
+        aggregated = memory.get_pattern_weights(window_days=WINDOW_DAYS)
+        assert all(abs(legacy[name] - aggregated.get(name, 0.0)) < 0.05 for name in legacy), (legacy, aggregated)
+
+        legacy_ms = measure(lambda: legacy_report(memory))
+        aggregated_ms = measure(lambda: memory.get_pattern_weights(window_days=WINDOW_DAYS))
+        print(f"{size:>12} | {legacy_ms:>17.1f} | {aggregated_ms:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
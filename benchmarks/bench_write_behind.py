@@ -0,0 +1,79 @@
+"""
+Бенчмарк пропускной способности записи ходов диалога: обычные транзакции
+против буфера групповой фиксации (write-behind).
+
+Ход = реплика пользователя + ответ агента + обнаруженный паттерн, как в
+Orchestrator.process_input. Несколько потоков имитируют одновременных
+пользователей Telegram.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_write_behind.py
+    BENCH_SIGNIFICANCE_LATENCY_MS=200 python benchmarks/bench_write_behind.py  # с "медленным" LLM
+
+База создается во временном каталоге, рабочие данные не затрагиваются.
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(tempfile.mkdtemp(prefix="bench_write_behind_"))  # agent_memory.db и chroma создаются здесь
+os.environ.setdefault("DIALOGUE_COMPACTION_THRESHOLD", "1000000")  # компактизация не мешает замеру
+
+import database.db_connector  # noqa: E402  (инициализирует подключения до моделей)
+from database.write_buffer import WriteBehindBuffer  # noqa: E402
+from orchestrator.dynamic_memory import DynamicMemory  # noqa: E402
+from orchestrator.background import post_response_executor  # noqa: E402
+
+USERS = [1, 8, 32]
+TURNS_PER_USER = 50
+# Задержка LLM-дооценки значимости (только при SIGNIFICANCE_LLM_FALLBACK); 0 — замерять только SQLite
+SIGNIFICANCE_LATENCY_MS = int(os.environ.get("BENCH_SIGNIFICANCE_LATENCY_MS", "0"))
+
+
+class _FakeLLM:
+    """Все реплики незначимы; ответ приходит через SIGNIFICANCE_LATENCY_MS."""
+    def complete(self, *args, **kwargs):
+        time.sleep(SIGNIFICANCE_LATENCY_MS / 1000)
+        return "0.0"
+
+
+def run_turns(memory: DynamicMemory, turns: int):
+    for i in range(turns):
+        memory.save_interaction(f"Сообщение пользователя {i}", is_user=True)
+        memory.save_interaction(f"Ответ агента {i}", is_user=False)
+        memory.save_cognitive_pattern("catastrophizing", 80, f"контекст {i}")
+
+
+def measure(users: int, write_buffer) -> float:
+    """Ходов в секунду для users одновременных пользователей."""
+    tag = "wb" if write_buffer else "tx"
+    memories = [DynamicMemory(f"bench_{tag}_{users}_{n}", _FakeLLM()) for n in range(users)]
+    for memory in memories:
+        memory.write_buffer = write_buffer
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(lambda m: run_turns(m, TURNS_PER_USER), memories))
+    if write_buffer:
+        write_buffer.flush()
+    # Отложенная после коммита работа (векторная память) входит в замер
+    post_response_executor.wait()
+    return users * TURNS_PER_USER / (time.perf_counter() - start)
+
+
+def main():
+    print(f"Задержка LLM: {SIGNIFICANCE_LATENCY_MS} мс")
+    print(f"{'пользователей':>13} | {'транзакции, ходов/с':>20} | {'write-behind, ходов/с':>22}")
+    for users in USERS:
+        direct = measure(users, None)
+        buffer = WriteBehindBuffer()
+        buffered = measure(users, buffer)
+        buffer.close()
+        print(f"{users:>13} | {direct:>20.0f} | {buffered:>22.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Офлайн-оценка локального скорера значимости против решений LLM.
+
+Разметка — JSONL, по строке на реплику: {"text": "...", "llm_score": 0.8}
+(решение LLM — llm_score > 0.6, как в DynamicMemory._parse_significance).
+Порог SIGNIFICANCE_THRESHOLD подбирается только по такой разметке реальных
+реплик: сначала --label-from-db записывает оценки LLM, затем оценка считает
+по ним согласие и полноту для сетки порогов.
+
+Реплики, которые оркестратор обрабатывает как команды (запрос отчета о памяти),
+до скорера не доходят и в оценку не входят.
+
+Запуск из корня репозитория:
+    python benchmarks/eval_significance.py labels.jsonl --label-from-db agent_memory.db
+        # дописать в labels.jsonl оценки LLM для реплик пользователей из базы
+        # (нужен OPENROUTER_API_KEY; уже размеченные тексты повторно не отправляются)
+    python benchmarks/eval_significance.py labels.jsonl             # оценка по записанной разметке
+    python benchmarks/eval_significance.py                          # встроенная выборка: только проверка запуска
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from orchestrator.significance import SignificanceScorer, SIGNIFICANCE_THRESHOLD, SIGNIFICANCE_BORDERLINE  # noqa: E402
+from orchestrator.intent_matcher import get_intent_matcher, INTENT_REPORT_MEMORY  # noqa: E402
+
+THRESHOLDS = [0.35, 0.4, 0.45, 0.5, 0.55, 0.6]
+# Пропущенный значимый факт хуже лишней записи в память: порог выбирается
+# по лучшему согласию среди порогов с полнотой не ниже MIN_RECALL
+MIN_RECALL = 0.8
+
+# Встроенная выборка, размеченная вручную по критериям SIGNIFICANCE_PROMPT.
+# Для подбора порога мала — годится только для проверки, что оценка запускается
+SAMPLE = [
+    ("Привет, как дела?", 0.1),
+    ("ок спасибо", 0.0),
+    ("да, наверное, не знаю", 0.1),
+    ("Ну ладно, давай дальше", 0.1),
+    ("Хорошо, понял тебя", 0.1),
+    ("Спасибо большое, было полезно", 0.2),
+    ("Расскажи анекдот про котов", 0.3),
+    ("Меня зовут Оля, я работаю дизайнером в Москве", 0.9),
+    ("Я очень боюсь, что провалю собеседование в понедельник", 0.9),
+    ("Почему я все время откладываю важные дела?", 0.8),
+    ("У меня дедлайн 15 марта по проекту для Сбербанка", 0.9),
+    ("Я устал и не хочу ничего делать", 0.7),
+    ("Мне кажется, начальник специально дает мне самые скучные задачи", 0.8),
+    ("Как перестать сравнивать себя с другими?", 0.8),
+    ("Вчера поссорился с братом из-за наследства, до сих пор злюсь", 0.9),
+    ("Угу, ясно", 0.0),
+]
+
+
+def load_labels(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [(row["text"], float(row["llm_score"])) for row in map(json.loads, filter(str.strip, f))]
+
+
+def is_command(text: str) -> bool:
+    """Реплика, которую оркестратор обрабатывает сам, не оценивая значимость."""
+    return INTENT_REPORT_MEMORY in get_intent_matcher().match(text)
+
+
+def label_from_db(db_path: str, labels_path: str):
+    """Размечает реплики пользователей из базы вызовом LLM с тем же промптом, что и в DynamicMemory."""
+    from agents.task_agent import TaskAgent
+    import database.db_connector  # noqa: F401  (инициализирует подключения до моделей)
+    from orchestrator.dynamic_memory import SIGNIFICANCE_PROMPT
+
+    labelled = {text for text, _ in load_labels(labels_path)} if os.path.exists(labels_path) else set()
+    with sqlite3.connect(db_path) as connection:
+        texts = [row[0] for row in connection.execute("SELECT DISTINCT content FROM dialogue_entries WHERE is_user = 1")]
+
+    agent = TaskAgent()
+    added = 0
+    with open(labels_path, "a", encoding="utf-8") as f:
+        for text in texts:
+            if text in labelled or len(text.split()) < 3 or is_command(text):
+                continue
+            response = agent.complete(text, SIGNIFICANCE_PROMPT)
+            try:
+                score = float(response.strip())
+            except (ValueError, TypeError):
+                continue
+            f.write(json.dumps({"text": text, "llm_score": score}, ensure_ascii=False) + "\n")
+            added += 1
+    print(f"Размечено LLM: {added} новых реплик -> {labels_path}")
+
+
+def evaluate(samples: list, threshold: float) -> dict:
+    scorer = SignificanceScorer(threshold=threshold, borderline=SIGNIFICANCE_BORDERLINE)
+    tp = fp = fn = tn = borderline = 0
+    for text, llm_score in samples:
+        local_score = scorer.score(text)
+        local, llm = scorer.is_significant(local_score), llm_score > 0.6
+        tp += local and llm
+        fp += local and not llm
+        fn += llm and not local
+        tn += not local and not llm
+        borderline += scorer.is_borderline(local_score)
+    return {
+        "agreement": (tp + tn) / len(samples),
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+        "recall": tp / (tp + fn) if tp + fn else 0.0,
+        "borderline": borderline / len(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("labels", nargs="?", help="JSONL с полями text и llm_score")
+    parser.add_argument("--label-from-db", metavar="DB", help="дописать разметку LLM по репликам из базы SQLite")
+    args = parser.parse_args()
+
+    if args.label_from_db:
+        if not args.labels:
+            parser.error("для --label-from-db нужен путь к файлу разметки")
+        label_from_db(args.label_from_db, args.labels)
+
+    samples = load_labels(args.labels) if args.labels else SAMPLE
+    commands = [text for text, _ in samples if is_command(text)]
+    samples = [(text, score) for text, score in samples if not is_command(text)]
+    if not samples:
+        print("Разметка пуста.")
+        return
+    if not args.labels:
+        print("Встроенная выборка размечена вручную: порог по ней не подбирается, нужна разметка LLM.")
+
+    scorer = SignificanceScorer()
+    start = time.perf_counter()
+    for text, _ in samples:
+        scorer.score(text)
+    per_message_us = (time.perf_counter() - start) / len(samples) * 1e6
+
+    significant = sum(score > 0.6 for _, score in samples)
+    print(f"Реплик: {len(samples)} (значимых по разметке: {significant}, команд исключено: {len(commands)}), "
+          f"локальная оценка: {per_message_us:.1f} мкс/реплику")
+    print(f"{'порог':>6} | {'согласие':>8} | {'точность':>8} | {'полнота':>7} | {'пограничных':>11}")
+    best = None
+    for threshold in sorted({*THRESHOLDS, SIGNIFICANCE_THRESHOLD}):
+        m = evaluate(samples, threshold)
+        marker = " *" if threshold == SIGNIFICANCE_THRESHOLD else ""
+        print(f"{threshold:>6.2f} | {m['agreement']:>8.0%} | {m['precision']:>8.0%} | "
+              f"{m['recall']:>7.0%} | {m['borderline']:>11.0%}{marker}")
+        if m["recall"] >= MIN_RECALL and (best is None or m["agreement"] > best[1]):
+            best = (threshold, m["agreement"])
+    print("* — текущий SIGNIFICANCE_THRESHOLD; пограничные уходят в LLM при SIGNIFICANCE_LLM_FALLBACK=true")
+    if best:
+        print(f"Лучшее согласие при полноте >= {MIN_RECALL:.0%}: порог {best[0]:.2f} ({best[1]:.0%})")
+    else:
+        print(f"Ни один порог не дает полноты {MIN_RECALL:.0%} — локальный скорер без LLM-дооценки не включать.")
+
+
+if __name__ == "__main__":
+    main()
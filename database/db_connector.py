@@ -1,11 +1,13 @@
+import threading
 import sqlalchemy
 import chromadb
 from sqlalchemy.orm import sessionmaker
-from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from typing import Optional
+from .embedding_service import SharedEmbeddingFunction, get_embedding_service
 
 # --- SQLite (замена для PostgreSQL) ---
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
 
 DB_FILE = "agent_memory.db"
 engine = sqlalchemy.create_engine(f"sqlite:///{DB_FILE}", connect_args={"check_same_thread": False})
@@ -29,6 +31,25 @@ def session_scope():
     finally:
         session.close()
 
+# --- Асинхронный слой (aiosqlite) ---
+# Используется асинхронным пайплайном (Orchestrator.aprocess_input), чтобы
+# ожидание базы не занимало поток из пула по умолчанию.
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{DB_FILE}")
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+@asynccontextmanager
+async def async_session_scope():
+    """Асинхронный аналог session_scope."""
+    session = AsyncSessionLocal()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
 def get_db_session():
     """Возвращает сессию для работы с базой данных SQLite."""
     db = SessionLocal()
@@ -39,8 +60,22 @@ def get_db_session():
 
 # --- ChromaDB (локальная) ---
 CHROMA_PATH = "chroma_storage"
-chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
-default_embedding = DefaultEmbeddingFunction()
+
+_chroma_clients = {}
+_resources_lock = threading.Lock()
+
+def get_chroma_client(path: str = CHROMA_PATH):
+    """Возвращает общий для процесса клиент Chroma для каталога path."""
+    with _resources_lock:
+        client = _chroma_clients.get(path)
+        if client is None:
+            client = chromadb.PersistentClient(path=path)
+            _chroma_clients[path] = client
+        return client
+
+chroma_client = get_chroma_client(CHROMA_PATH)
+# Единственная функция эмбеддингов на процесс — для всех коллекций (см. embedding_service)
+default_embedding = SharedEmbeddingFunction(get_embedding_service())
 
 # Пример коллекции
 # В реальном приложении коллекции будут создаваться и управляться динамически
@@ -0,0 +1,148 @@
+import os
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Кэш эмбеддингов: одна и та же реплика за ход эмбеддится детектором, RAG,
+# записью в память и агентом-методологом — модель считает ее один раз
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "10000"))
+# Файл дискового уровня (SQLite); пустая строка — только память процесса
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "")
+
+
+class EmbeddingCache:
+    """
+    Кэш векторов по ключу (модель, sha256 текста).
+
+    Уровень в памяти — LRU на max_entries векторов. Необязательный дисковый
+    уровень — таблица SQLite: переживает перезапуск процесса, найденные там
+    векторы поднимаются в LRU.
+
+    Блокировка защищает только LRU и счетчики. К SQLite каждый поток ходит
+    через свое соединение (WAL), поэтому чтение с диска в одном потоке
+    не задерживает попадания в память в других.
+    """
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_SIZE, disk_path: str = EMBEDDING_CACHE_PATH):
+        self.max_entries = max(1, max_entries)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.disk_path = disk_path or None
+        self._local = threading.local()
+        self._connections = []  # все открытые соединения потоков, чтобы закрыть их в close()
+        if self.disk_path:
+            connection = self._disk()
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+            connection.commit()
+
+        # Метрики
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+    def _disk(self):
+        """Соединение с дисковым уровнем для текущего потока или None, если диска нет."""
+        if self.disk_path is None:
+            return None
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # check_same_thread=False только ради close() из другого потока
+            connection = sqlite3.connect(self.disk_path, timeout=5, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    @staticmethod
+    def key(model: str, text: str) -> tuple:
+        return model, hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list) -> list:
+        """Векторы для ключей (None — промах). Считает попадания и промахи."""
+        found = [None] * len(keys)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self._memory_hits += 1
+                    found[i] = vector
+                else:
+                    missing.append(i)
+
+        from_disk = []
+        disk = self._disk() if missing else None
+        if disk is not None:
+            for i in missing:
+                row = disk.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND text_hash = ?", keys[i]
+                ).fetchone()
+                if row is not None:
+                    found[i] = np.frombuffer(row[0], dtype=np.float32)
+                    from_disk.append(i)
+
+        with self._lock:
+            for i in from_disk:
+                self._remember(keys[i], found[i])
+            self._disk_hits += len(from_disk)
+            self._misses += len(missing) - len(from_disk)
+        return found
+
+    def put_many(self, keys: list, vectors: list):
+        rows = []
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((*key, vector.tobytes()))
+        disk = self._disk() if rows else None
+        if disk is not None:
+            disk.executemany("INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)", rows)
+            disk.commit()
+
+    def _remember(self, key: tuple, vector):
+        # Вызывается под self._lock
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._memory_hits + self._disk_hits
+            lookups = hits + self._misses
+            return {
+                "memory_hits": self._memory_hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "size": len(self._memory),
+            }
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self.disk_path = None
+        for connection in connections:
+            connection.close()
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Общий для процесса кэш эмбеддингов."""
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+        return _embedding_cache
@@ -0,0 +1,146 @@
+import os
+import threading
+from functools import cached_property
+import numpy as np
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+from .embedding_cache import EmbeddingCache, get_embedding_cache
+
+# Единый сервис эмбеддингов для всех коллекций и роутеров.
+# Бэкенд по умолчанию — ONNX (onnxruntime, без PyTorch)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "onnx")
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# Потоки внутри одного вызова модели; 0 — выбор рантайма (все ядра)
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", "0"))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "32"))
+
+
+class OnnxBackend:
+    """all-MiniLM-L6-v2 в onnxruntime (та же модель, что у DefaultEmbeddingFunction Chroma)."""
+    name = "onnx"
+
+    def __init__(self, threads: int = EMBEDDING_THREADS):
+        from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+
+        class _ThreadLimitedMiniLM(ONNXMiniLM_L6_V2):
+            @cached_property
+            def model(self):
+                options = self.ort.SessionOptions()
+                options.log_severity_level = 3
+                options.graph_optimization_level = self.ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                if threads:
+                    options.intra_op_num_threads = threads
+                    options.inter_op_num_threads = 1
+                return self.ort.InferenceSession(
+                    os.path.join(self.DOWNLOAD_PATH, self.EXTRACTED_FOLDER_NAME, "model.onnx"),
+                    providers=["CPUExecutionProvider"],
+                    sess_options=options,
+                )
+
+        self._model = _ThreadLimitedMiniLM(preferred_providers=["CPUExecutionProvider"])
+
+    def embed(self, texts: list) -> np.ndarray:
+        return np.asarray(self._model(texts), dtype=np.float32)
+
+
+class SentenceTransformerBackend:
+    """Та же модель в sentence-transformers (PyTorch). Пакет в образ не входит — ставится отдельно."""
+    name = "sentence_transformers"
+
+    def __init__(self, threads: int = EMBEDDING_THREADS):
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("Для EMBEDDING_BACKEND=sentence_transformers установите sentence-transformers.") from e
+        if threads:
+            torch.set_num_threads(threads)
+        self._model = SentenceTransformer(EMBEDDING_MODEL)
+
+    def embed(self, texts: list) -> np.ndarray:
+        return self._model.encode(texts, convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
+
+
+EMBEDDING_BACKENDS = {
+    OnnxBackend.name: OnnxBackend,
+    SentenceTransformerBackend.name: SentenceTransformerBackend,
+}
+
+
+class EmbeddingService:
+    """
+    Эмбеддинги текстов: батчами по batch_size, через кэш векторов.
+    Модель бэкенда загружается при первом обращении.
+    """
+    def __init__(self, backend: str = EMBEDDING_BACKEND, threads: int = EMBEDDING_THREADS,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, cache: EmbeddingCache = None):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Неизвестный бэкенд эмбеддингов: {backend}. Доступны: {', '.join(EMBEDDING_BACKENDS)}")
+        self.backend_name = backend
+        self.threads = threads
+        self.batch_size = max(1, batch_size)
+        self.cache = cache
+        self.model_key = f"{backend}:{EMBEDDING_MODEL}"
+        self._backend = None
+        self._backend_lock = threading.Lock()
+
+    @property
+    def backend(self):
+        with self._backend_lock:
+            if self._backend is None:
+                self._backend = EMBEDDING_BACKENDS[self.backend_name](threads=self.threads)
+            return self._backend
+
+    def _compute(self, texts: list) -> np.ndarray:
+        batches = [
+            self.backend.embed(texts[i:i + self.batch_size])
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        return np.concatenate(batches)
+
+    def embed_many(self, texts: list) -> np.ndarray:
+        """Матрица (len(texts), dim) нормированных векторов. Модель считает только промахи кэша."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        if self.cache is None:
+            return self._compute(list(texts))
+
+        keys = [self.cache.key(self.model_key, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Повторы внутри одного батча тоже считаем один раз
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            computed = dict(zip(unique, self._compute(unique)))
+            for i in missing:
+                vectors[i] = computed[texts[i]]
+            self.cache.put_many([keys[i] for i in missing], [vectors[i] for i in missing])
+        return np.stack(vectors).astype(np.float32, copy=False)
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.embed_many([text])[0]
+
+
+class SharedEmbeddingFunction(DefaultEmbeddingFunction):
+    """
+    Функция эмбеддингов Chroma поверх EmbeddingService.
+    Имя "default" сохраняется, поэтому существующие коллекции (в том числе
+    созданные с sentence_transformer той же модели) открываются без конфликтов.
+    """
+    def __init__(self, service: EmbeddingService):
+        self.service = service
+
+    def __call__(self, input):
+        return list(self.service.embed_many(list(input)))
+
+
+_embedding_service = None
+_embedding_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Общий для процесса сервис эмбеддингов."""
+    global _embedding_service
+    with _embedding_service_lock:
+        if _embedding_service is None:
+            _embedding_service = EmbeddingService(cache=get_embedding_cache())
+        return _embedding_service
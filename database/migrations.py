@@ -0,0 +1,87 @@
+"""
+Версионирование схемы SQLite.
+
+Версия схемы хранится в PRAGMA user_version. При старте upgrade_schema:
+  1. создает недостающие таблицы по моделям (новые таблицы сразу получают
+     актуальную схему со всеми индексами);
+  2. применяет к существующей базе все миграции с номером больше текущей версии.
+
+Миграции должны быть идемпотентными (CREATE INDEX IF NOT EXISTS, проверка
+наличия колонки и т.п.): их может применить и база, созданная до появления
+миграций (user_version = 0), и свежая база, где таблицы уже актуальны.
+"""
+from sqlalchemy import MetaData
+from sqlalchemy.engine import Connection, Engine
+
+
+def _create_composite_indexes(connection: Connection):
+    # Горячие запросы фильтруют по user_id и сортируют/фильтруют по времени
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_dialogue_entries_user_timestamp "
+        "ON dialogue_entries (user_id, timestamp)"
+    )
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_cognitive_patterns_user_pattern_observed "
+        "ON cognitive_patterns (user_id, pattern_name, observed_at)"
+    )
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_session_analyses_user_ended "
+        "ON session_analyses (user_id, ended_at)"
+    )
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_user_traits_user_description "
+        "ON user_traits (user_id, trait_description)"
+    )
+
+
+def _has_column(connection: Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in connection.exec_driver_sql(f"PRAGMA table_info({table})"))
+
+
+def _add_dialogue_counter(connection: Connection):
+    # Счетчик реплик пользователя вместо COUNT(*) по dialogue_entries на каждое сообщение
+    if not _has_column(connection, "users", "dialogue_count"):
+        connection.exec_driver_sql("ALTER TABLE users ADD COLUMN dialogue_count INTEGER NOT NULL DEFAULT 0")
+    connection.exec_driver_sql(
+        "UPDATE users SET dialogue_count = "
+        "(SELECT COUNT(*) FROM dialogue_entries WHERE dialogue_entries.user_id = users.id)"
+    )
+
+
+def _create_pattern_window_index(connection: Connection):
+    # Веса паттернов за окно: диапазон по observed_at читается из индекса целиком,
+    # без обхода всей истории пользователя
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_cognitive_patterns_user_observed_pattern "
+        "ON cognitive_patterns (user_id, observed_at, pattern_name)"
+    )
+
+
+# (версия, описание, функция миграции) — строго по возрастанию версии
+MIGRATIONS = [
+    (1, "составные индексы для запросов по пользователю", _create_composite_indexes),
+    (2, "счетчик реплик пользователя users.dialogue_count", _add_dialogue_counter),
+    (3, "индекс наблюдений паттернов по окну времени", _create_pattern_window_index),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(connection: Connection) -> int:
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def upgrade_schema(engine: Engine, metadata: MetaData) -> int:
+    """Приводит базу к актуальной версии схемы. Возвращает итоговую версию."""
+    with engine.begin() as connection:
+        version = get_schema_version(connection)
+        metadata.create_all(bind=connection)
+
+        for migration_version, description, apply in MIGRATIONS:
+            if migration_version > version:
+                apply(connection)
+                print(f"Миграция схемы {migration_version}: {description}.")
+
+        if version < SCHEMA_VERSION:
+            connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return max(version, SCHEMA_VERSION)
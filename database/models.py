@@ -1,8 +1,9 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime, Boolean, Index
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func
 import datetime
 from .db_connector import engine
+from .migrations import upgrade_schema
 
 Base = declarative_base()
 
@@ -11,6 +12,8 @@ class User(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id_stub = Column(String, unique=True, index=True, default="default_user")
+    # Число записей в dialogue_entries; поддерживается DynamicMemory при вставке и компактизации
+    dialogue_count = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     cognitive_patterns = relationship("CognitivePattern", back_populates="user")
@@ -20,6 +23,10 @@ class User(Base):
 
 class CognitivePattern(Base):
     __tablename__ = 'cognitive_patterns'
+    __table_args__ = (
+        Index('ix_cognitive_patterns_user_pattern_observed', 'user_id', 'pattern_name', 'observed_at'),
+        Index('ix_cognitive_patterns_user_observed_pattern', 'user_id', 'observed_at', 'pattern_name'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -32,6 +39,9 @@ class CognitivePattern(Base):
 
 class DialogueEntry(Base):
     __tablename__ = 'dialogue_entries'
+    __table_args__ = (
+        Index('ix_dialogue_entries_user_timestamp', 'user_id', 'timestamp'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -63,6 +73,9 @@ User.profile = relationship("UserProfile", uselist=False, back_populates="user")
 
 class UserTrait(Base):
     __tablename__ = 'user_traits'
+    __table_args__ = (
+        Index('ix_user_traits_user_description', 'user_id', 'trait_description'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -81,6 +94,9 @@ User.traits = relationship("UserTrait", back_populates="user")
 
 class SessionAnalysis(Base):
     __tablename__ = 'session_analyses'
+    __table_args__ = (
+        Index('ix_session_analyses_user_ended', 'user_id', 'ended_at'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -94,9 +110,20 @@ class SessionAnalysis(Base):
 # Добавляем связь в User
 User.session_analyses = relationship("SessionAnalysis", back_populates="user")
 
+class SessionStrategy(Base):
+    __tablename__ = 'session_strategies'
 
-# --- Создание таблиц ---
-# Этот код будет выполнен при первом импорте, создавая таблицы, если их нет
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
+    # Анализ сессии, на основе которого выработана стратегия: пока нового анализа нет, она актуальна
+    based_on_analysis_id = Column(Integer, ForeignKey('session_analyses.id'))
+    note = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=datetime.datetime.utcnow)
+
+
+# --- Создание таблиц и миграции ---
+# Этот код будет выполнен при первом импорте: создает недостающие таблицы
+# и обновляет схему существующей базы (см. database/migrations.py)
 
-Base.metadata.create_all(bind=engine)
-print("Модели SQLAlchemy и таблицы созданы.")
+schema_version = upgrade_schema(engine, Base.metadata)
+print(f"Модели SQLAlchemy и таблицы созданы (версия схемы: {schema_version}).")
@@ -0,0 +1,137 @@
+import os
+import atexit
+import threading
+from concurrent.futures import Future
+from .db_connector import session_scope
+
+# Режим write-behind: записи диалога, паттернов и черт копятся в очереди
+# и коммитятся пачками — одна транзакция (и один fsync) на много записей
+WRITE_BEHIND_ENABLED = os.environ.get("DB_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+WRITE_BEHIND_INTERVAL_MS = int(os.environ.get("DB_WRITE_BEHIND_INTERVAL_MS", "50"))
+WRITE_BEHIND_MAX_ROWS = int(os.environ.get("DB_WRITE_BEHIND_MAX_ROWS", "200"))
+
+
+class WriteBehindBuffer:
+    """
+    Буфер групповой фиксации записей в SQLite.
+
+    submit(op, *args) ставит операцию op(session, *args) в очередь и сразу
+    возвращает Future. Фоновый поток коммитит накопленные операции одной
+    транзакцией каждые interval_ms или при накоплении max_rows операций.
+    Future получает результат op после коммита.
+
+    Если транзакция пачки падает, операции повторяются по одной, чтобы
+    одна ошибочная запись не откатила остальные.
+
+    Чтение, которое должно видеть свои записи, вызывает flush() перед запросом.
+    """
+    def __init__(self, interval_ms: int = WRITE_BEHIND_INTERVAL_MS, max_rows: int = WRITE_BEHIND_MAX_ROWS,
+                 session_factory=session_scope):
+        self.interval = interval_ms / 1000
+        self.max_rows = max(1, max_rows)
+        self.session_factory = session_factory
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # пачки коммитятся строго по очереди
+        self._closed = False
+
+        # Метрики
+        self._batches = 0
+        self._rows = 0
+        self._failed = 0
+
+        self._thread = threading.Thread(target=self._flusher_loop, name="db-write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, op, *args) -> Future:
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Буфер записи уже закрыт.")
+            self._pending.append((future, op, args))
+            if len(self._pending) >= self.max_rows:
+                self._cond.notify()
+        return future
+
+    def _flusher_loop(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.max_rows:
+                    # Пачка добирает записи до конца интервала (или до max_rows)
+                    self._cond.wait(self.interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def flush(self) -> int:
+        """Коммитит все накопленные операции в вызывающем потоке. Возвращает их число."""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+
+            try:
+                with self.session_factory() as session:
+                    results = [op(session, *args) for _, op, args in batch]
+            except Exception as e:
+                print(f"Ошибка групповой записи ({len(batch)} операций), повторяем по одной: {e}")
+                self._commit_one_by_one(batch)
+            else:
+                for (future, _, _), result in zip(batch, results):
+                    future.set_result(result)
+
+            self._batches += 1
+            self._rows += len(batch)
+            return len(batch)
+
+    def _commit_one_by_one(self, batch: list):
+        for future, op, args in batch:
+            try:
+                with self.session_factory() as session:
+                    result = op(session, *args)
+            except Exception as e:
+                print(f"Ошибка отложенной записи: {e}")
+                self._failed += 1
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        with self._cond:
+            queued = len(self._pending)
+        return {"queued": queued, "batches": self._batches, "rows": self._rows, "failed": self._failed}
+
+    def close(self):
+        """Останавливает фоновый поток и коммитит остаток очереди."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
+
+
+_write_buffer = None
+_write_buffer_lock = threading.Lock()
+
+
+def get_write_buffer():
+    """Общий для процесса буфер записи или None, если режим write-behind выключен."""
+    global _write_buffer
+    if not WRITE_BEHIND_ENABLED:
+        return None
+    with _write_buffer_lock:
+        if _write_buffer is None:
+            _write_buffer = WriteBehindBuffer()
+            atexit.register(_write_buffer.close)
+        return _write_buffer
+
+
+def close_write_buffer():
+    """Штатное завершение: дописывает очередь на диск."""
+    if _write_buffer is not None:
+        _write_buffer.close()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+# The compiled catalogue lives next to the knowledge base: <path>.npy holds the
+# normalized embedding matrix (memory-mapped on load), <path>.json the entries.
+BIAS_INDEX_PATH = os.environ.get(
+    "BIAS_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bias_index")
+)
+
+
+def bias_document(bias: dict) -> str:
+    """Text that is embedded for a catalogue entry."""
+    return f"Название: {bias['name']}. Описание: {bias['description']}"
+
+
+def entry_hash(bias: dict) -> str:
+    """Content hash of a catalogue entry: changes whenever its embedded text changes."""
+    return hashlib.sha256(bias_document(bias).encode("utf-8")).hexdigest()
+
+
+def catalogue_version(entries: list, model: str) -> str:
+    """Version of the compiled catalogue: entry hashes in order plus the embedding model."""
+    digest = hashlib.sha256(model.encode("utf-8"))
+    for bias in entries:
+        digest.update(entry_hash(bias).encode("ascii"))
+    return digest.hexdigest()
+
+
+class BiasIndex:
+    """
+    Cosine top-k over a small static catalogue.
+
+    The matrix rows are L2-normalized, so a query is one matrix-vector
+    product followed by a partial sort. No Chroma client or SQLite handles.
+    """
+    def __init__(self, matrix: np.ndarray, entries: list, model: str = ""):
+        if len(matrix) != len(entries):
+            raise ValueError(f"Index has {len(matrix)} vectors for {len(entries)} entries.")
+        self.matrix = matrix
+        self.entries = entries
+        self.model = model
+        self.hashes = [entry_hash(bias) for bias in entries]
+        self.version = catalogue_version(entries, model)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @classmethod
+    def build(cls, entries: list, embed_many, model: str = "", previous: "BiasIndex" = None):
+        """
+        Compiles entries with embed_many(list[str]) -> (n, dim) array.
+
+        Vectors of entries whose content hash is already in `previous` (built
+        with the same model) are reused; only added or changed entries are
+        embedded, removed ones are dropped. Returns (index, stats).
+        """
+        reusable = {}
+        if previous is not None and previous.model == model:
+            reusable = dict(zip(previous.hashes, previous.matrix))
+        previous_names = {bias["name"] for bias in previous.entries} if previous is not None else set()
+
+        hashes = [entry_hash(bias) for bias in entries]
+        missing = [i for i, h in enumerate(hashes) if h not in reusable]
+        computed = cls._normalize(embed_many([bias_document(entries[i]) for i in missing])) if missing else []
+        vectors = dict(zip(missing, computed))
+        matrix = np.array([vectors[i] if i in vectors else reusable[h] for i, h in enumerate(hashes)], dtype=np.float32)
+
+        names = {bias["name"] for bias in entries}
+        changed = sum(1 for i in missing if entries[i]["name"] in previous_names)
+        stats = {
+            "embedded": len(missing),
+            "added": len(missing) - changed,
+            "changed": changed,
+            "removed": len(previous_names - names),
+        }
+        return cls(matrix, list(entries), model), stats
+
+    def save(self, path: str = BIAS_INDEX_PATH):
+        """
+        Writes both files atomically, so a concurrent load never sees a half-written
+        index. Temp files get unique names: concurrent rebuilds do not clobber each other.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.basename(path) + "."
+        npy_fd, npy_tmp = tempfile.mkstemp(prefix=prefix, suffix=".npy.tmp", dir=directory)
+        json_fd, json_tmp = tempfile.mkstemp(prefix=prefix, suffix=".json.tmp", dir=directory)
+        try:
+            with os.fdopen(npy_fd, "wb") as f:
+                np.save(f, np.ascontiguousarray(self.matrix, dtype=np.float32))
+            with os.fdopen(json_fd, "w", encoding="utf-8") as f:
+                json.dump({"version": self.version, "model": self.model, "hashes": self.hashes, "entries": self.entries},
+                          f, ensure_ascii=False)
+            os.replace(npy_tmp, f"{path}.npy")
+            os.replace(json_tmp, f"{path}.json")
+        finally:
+            for tmp in (npy_tmp, json_tmp):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    @classmethod
+    def load(cls, path: str = BIAS_INDEX_PATH) -> "BiasIndex":
+        """Loads a saved index; the matrix is memory-mapped read-only."""
+        with open(f"{path}.json", encoding="utf-8") as f:
+            metadata = json.load(f)
+        return cls(np.load(f"{path}.npy", mmap_mode="r"), metadata["entries"], metadata.get("model", ""))
+
+    def top_k_many(self, query_vectors: np.ndarray, k: int = 5) -> list:
+        """For each query vector, the indices of the k most similar entries, best first."""
+        scores = self._normalize(np.atleast_2d(query_vectors)) @ self.matrix.T
+        k = min(k, len(self.entries))
+        if k <= 0:
+            return [[] for _ in scores]
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+        return np.take_along_axis(top, order, axis=1).tolist()
+
+    def query_many(self, query_vectors: np.ndarray, k: int = 5) -> list:
+        """For each query vector, the k most similar catalogue entries."""
+        return [[self.entries[i] for i in row] for row in self.top_k_many(query_vectors, k)]
+
+    def query(self, query_vector: np.ndarray, k: int = 5) -> list:
+        return self.query_many(query_vector, k)[0]
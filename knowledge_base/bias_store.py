@@ -1,60 +1,58 @@
 # -*- coding: utf-8 -*-
-import chromadb
-from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
-from knowledge_base.cognitive_biases import COGNITIVE_BIASES
 import os
+import time
+import threading
+from database.embedding_service import get_embedding_service
+from knowledge_base.cognitive_biases import COGNITIVE_BIASES
+from knowledge_base.bias_index import BiasIndex, BIAS_INDEX_PATH, catalogue_version
+
+# After a failed build (e.g. the embedding model cannot be downloaded offline)
+# new agents get the same error for this many seconds instead of retrying it
+BIAS_STORE_RETRY_INTERVAL = float(os.environ.get("BIAS_STORE_RETRY_INTERVAL", "300"))
 
 class CognitiveBiasStore:
     """
-    Manages a ChromaDB vector store for cognitive biases.
-    """
-    def __init__(self, collection_name="cognitive_biases", persist_directory="chroma_db/biases"):
-        self.collection_name = collection_name
-        self.persist_directory = persist_directory
+    Semantic lookup over the static cognitive bias catalogue.
 
-        # Ensure the persist directory exists
-        if not os.path.exists(self.persist_directory):
-            os.makedirs(self.persist_directory)
-
-        # Use the default, built-in embedding function for simplicity and stability
-        self.embedding_function = DefaultEmbeddingFunction()
-
-        # Initialize the ChromaDB client
-        self.client = chromadb.PersistentClient(path=self.persist_directory)
-
-        # Get or create the collection
-        self.collection = self.client.get_or_create_collection(
-            name=self.collection_name,
-            embedding_function=self.embedding_function # Pass the function instance here
-        )
-        self._populate_if_empty()
+    The catalogue is compiled once into a memory-mapped embedding matrix
+    (see bias_index.py); a lookup embeds the query and ranks all entries
+    with a single matrix-vector product.
+    """
+    def __init__(self, index_path=BIAS_INDEX_PATH, embedding_service=None):
+        self.index_path = index_path
+        self.embedding_service = embedding_service or get_embedding_service()
+        self.index = self._load_or_build()
 
-    def _populate_if_empty(self):
+    def _load_or_build(self) -> BiasIndex:
         """
-        Populates the vector store with cognitive biases if it's empty.
-        This is a one-time operation.
+        Loads the compiled index and brings it in sync with COGNITIVE_BIASES.
+        Only added or changed entries are re-embedded; an unchanged catalogue
+        (same catalogue version) is used as is, without any embedding work.
         """
-        if self.collection.count() == 0:
-            print("Populating cognitive biases vector store...")
-            documents = []
-            metadatas = []
-            ids = []
-            for i, bias in enumerate(COGNITIVE_BIASES):
-                content = f"Название: {bias['name']}. Описание: {bias['description']}"
-                documents.append(content)
-                metadatas.append({"name": bias['name'], "description": bias['description']})
-                ids.append(str(i + 1))
-
-            self.collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
-            print("Vector store populated successfully.")
+        model = self.embedding_service.model_key
+        try:
+            index = BiasIndex.load(self.index_path)
+        except (OSError, ValueError, KeyError) as e:
+            # OSError also covers a truncated or partially copied .npy
+            if not isinstance(e, FileNotFoundError):
+                print(f"Cognitive biases index is unreadable, rebuilding: {e}")
+            index = None
+
+        if index is not None and index.version == catalogue_version(COGNITIVE_BIASES, model):
+            return index
+
+        print("Updating cognitive biases index...")
+        updated, stats = BiasIndex.build(COGNITIVE_BIASES, self.embedding_service.embed_many, model, previous=index)
+        updated.save(self.index_path)
+        print(
+            f"Cognitive biases index updated: {stats['added']} added, {stats['changed']} changed, "
+            f"{stats['removed']} removed ({stats['embedded']} embedded)."
+        )
+        return BiasIndex.load(self.index_path)
 
     def query_biases(self, query_text: str, n_results: int = 5):
         """
-        Queries the vector store to find the most relevant cognitive biases.
+        Finds the most relevant cognitive biases.
 
         Args:
             query_text: The user's input text.
@@ -65,21 +63,50 @@ class CognitiveBiasStore:
         """
         if not query_text:
             return []
+        return self.query_biases_many([query_text], n_results)[0]
 
-        results = self.collection.query(
-            query_texts=[query_text],
-            n_results=n_results
-        )
+    def query_biases_many(self, query_texts: list, n_results: int = 5) -> list:
+        """Batch variant of query_biases: one embedding call and one matrix product for all texts."""
+        results = [[] for _ in query_texts]
+        texts = [(i, text) for i, text in enumerate(query_texts) if text]
+        if texts:
+            vectors = self.embedding_service.embed_many([text for _, text in texts])
+            for (i, _), biases in zip(texts, self.index.query_many(vectors, n_results)):
+                results[i] = biases
+        return results
+
+_bias_store = None
+_bias_store_error = None  # (exception, time.monotonic() of the failure)
+_bias_store_lock = threading.Lock()
 
-        # The query returns a list of lists for metadatas, so we take the first element.
-        return results['metadatas'][0] if results['metadatas'] else []
+
+def get_bias_store() -> CognitiveBiasStore:
+    """
+    Returns the process-wide bias store. The catalogue is static, so every
+    DetectorAgent shares one instance instead of reopening and re-checking it.
+    A failure is remembered too: for BIAS_STORE_RETRY_INTERVAL seconds callers
+    get the same exception without another model download or index build.
+    """
+    global _bias_store, _bias_store_error
+    with _bias_store_lock:
+        if _bias_store is not None:
+            return _bias_store
+        if _bias_store_error is not None and time.monotonic() - _bias_store_error[1] < BIAS_STORE_RETRY_INTERVAL:
+            raise _bias_store_error[0]
+        try:
+            _bias_store = CognitiveBiasStore()
+        except Exception as e:
+            _bias_store_error = (e, time.monotonic())
+            raise
+        _bias_store_error = None
+        return _bias_store
 
 # Example usage (can be run for testing)
 if __name__ == '__main__':
     bias_store = CognitiveBiasStore()
 
     # Test population
-    print(f"Collection count: {bias_store.collection.count()}")
+    print(f"Index size: {len(bias_store.index)}")
 
     # Test query
     test_query = "Я думаю, что мой новый проект точно будет успешным, все знаки на это указывают."
@@ -1,5 +1,9 @@
+import os
 from orchestrator.orchestrator import Orchestrator, AgentMode
 
+# Потоковый вывод ответа (токенами по мере генерации)
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "1") == "1"
+
 def main():
     print("Добро пожаловать в AI-Мыслитель!")
     print("Команды: /partner, /copilot, /reset, /memory, /exit")
@@ -18,7 +22,7 @@ def main():
 
             # 💬 Обработка команд
             if user_input.lower() == '/exit':
-                orchestrator._analyze_and_save_session()
+                orchestrator.end_session()
                 print("Агент: До свидания! Был рад помочь.")
                 break
 
@@ -53,8 +57,14 @@ def main():
                     continue
 
             # 🚀 Обработка ввода
-            response = orchestrator.process_input(user_input)
-            print(f"Агент: {response}")
+            if STREAM_RESPONSES:
+                print("Агент: ", end="", flush=True)
+                for chunk in orchestrator.process_input_stream(user_input):
+                    print(chunk, end="", flush=True)
+                print()
+            else:
+                response = orchestrator.process_input(user_input)
+                print(f"Агент: {response}")
 
     except KeyboardInterrupt:
         orchestrator.end_session()
@@ -1,9 +1,40 @@
 from agents.methodology_agent import MethodologyAgent
 
+RUBBER_DUCK_PROMPT = (
+    "Твоя роль — фасилитатор этапа 'Громкой речи' (по Гальперину). "
+    "Пользователь находится на этапе материализации действия. Ему нужно проговорить проблему вслух, чтобы перевести её во внутренний план.\n"
+    "Твоя задача: Слушать и возвращать ему его же тезисы, но структурированными. "
+    "Не давай решений! Дай ему завершить интериоризацию самостоятельно."
+    "\n\n**Важное правило безопасности:** Если пользователь хочет остановиться, верни `[STOP_TECHNIQUE]`."
+)
+
+FIVE_WHYS_PROMPT = (
+    "Твоя роль — коуч, использующий технику 'Пять почему'. "
+    "Задавай вопрос 'Почему?' к каждому утверждению пользователя, пока не найдешь корневую причину. "
+    "В конце подрезюмируй."
+    "\n\n**Важное правило безопасности:** Для выхода верни `[STOP_TECHNIQUE]`."
+)
+
+CONSTRAINED_BRAINSTORMING_PROMPT = (
+    "Твоя роль — фасилитатор мозгового штурма. Введи неожиданное ограничение (бюджет 100р, время 1 час и т.д.) "
+    "и попроси накидать идеи."
+    "\n\n**Важное правило безопасности:** Для выхода верни `[STOP_TECHNIQUE]`."
+)
+
+# Название техники (для логов) и ее системный промпт — для потоковых вызовов
+TECHNIQUES = {
+    "run_rubber_duck_debugging": ("Метод утёнка", RUBBER_DUCK_PROMPT),
+    "run_five_whys": ("Пять почему", FIVE_WHYS_PROMPT),
+    "run_constrained_brainstorming": ("Мозговой штурм с ограничениями", CONSTRAINED_BRAINSTORMING_PROMPT),
+}
+
+
 class ActionLibrary:
     """
     Репозиторий конкретных мыслительных техник, которые Оркестратор может предлагать пользователю.
     Каждая техника — это отдельный метод, который вызывает MethodologyAgent с особым системным промптом.
+    У каждой техники есть асинхронный двойник с префиксом `a` (например, `arun_five_whys`),
+    а потоковые вызовы идут через stream_technique/astream_technique по имени техники.
     """
     def __init__(self, methodology_agent: MethodologyAgent):
         self.methodology_agent = methodology_agent
@@ -13,37 +44,43 @@ class ActionLibrary:
         """
         Проводит пользователя через "Метод утёнка".
         """
-        system_prompt = (
-            "Твоя роль — фасилитатор этапа 'Громкой речи' (по Гальперину). "
-            "Пользователь находится на этапе материализации действия. Ему нужно проговорить проблему вслух, чтобы перевести её во внутренний план.\n"
-            "Твоя задача: Слушать и возвращать ему его же тезисы, но структурированными. "
-            "Не давай решений! Дай ему завершить интериоризацию самостоятельно."
-            "\n\n**Важное правило безопасности:** Если пользователь хочет остановиться, верни `[STOP_TECHNIQUE]`."
-        )
         print("Запуск техники 'Метод утёнка'...")
-        return self.methodology_agent.execute(system_prompt, problem_description)
+        return self.methodology_agent.execute(RUBBER_DUCK_PROMPT, problem_description)
+
+    async def arun_rubber_duck_debugging(self, problem_description: str) -> str:
+        print("Запуск техники 'Метод утёнка'...")
+        return await self.methodology_agent.aexecute(RUBBER_DUCK_PROMPT, problem_description)
 
     def run_five_whys(self, initial_problem: str) -> str:
         """
         Проводит пользователя через технику "Пять почему" для поиска корневой причины.
         """
-        system_prompt = (
-            "Твоя роль — коуч, использующий технику 'Пять почему'. "
-            "Задавай вопрос 'Почему?' к каждому утверждению пользователя, пока не найдешь корневую причину. "
-            "В конце подрезюмируй."
-            "\n\n**Важное правило безопасности:** Для выхода верни `[STOP_TECHNIQUE]`."
-        )
         print("Запуск техники 'Пять почему'...")
-        return self.methodology_agent.execute(system_prompt.format(initial_problem=initial_problem), initial_problem)
+        return self.methodology_agent.execute(FIVE_WHYS_PROMPT, initial_problem)
+
+    async def arun_five_whys(self, initial_problem: str) -> str:
+        print("Запуск техники 'Пять почему'...")
+        return await self.methodology_agent.aexecute(FIVE_WHYS_PROMPT, initial_problem)
 
     def run_constrained_brainstorming(self, topic: str) -> str:
         """
         Проводит сессию мозгового штурма с искусственными ограничениями для стимулирования креативности.
         """
-        system_prompt = (
-            "Твоя роль — фасилитатор мозгового штурма. Введи неожиданное ограничение (бюджет 100р, время 1 час и т.д.) "
-            "и попроси накидать идеи."
-            "\n\n**Важное правило безопасности:** Для выхода верни `[STOP_TECHNIQUE]`."
-        )
         print("Запуск техники 'Мозговой штурм с ограничениями'...")
-        return self.methodology_agent.execute(system_prompt.format(topic=topic), topic)
+        return self.methodology_agent.execute(CONSTRAINED_BRAINSTORMING_PROMPT, topic)
+
+    async def arun_constrained_brainstorming(self, topic: str) -> str:
+        print("Запуск техники 'Мозговой штурм с ограничениями'...")
+        return await self.methodology_agent.aexecute(CONSTRAINED_BRAINSTORMING_PROMPT, topic)
+
+    def stream_technique(self, action_name: str, text: str):
+        """Запускает технику в потоковом режиме: возвращает генератор токенов."""
+        label, system_prompt = TECHNIQUES[action_name]
+        print(f"Запуск техники '{label}'...")
+        return self.methodology_agent.stream_execute(system_prompt, text)
+
+    def astream_technique(self, action_name: str, text: str):
+        """Асинхронный вариант stream_technique: возвращает асинхронный генератор токенов."""
+        label, system_prompt = TECHNIQUES[action_name]
+        print(f"Запуск техники '{label}'...")
+        return self.methodology_agent.astream_execute(system_prompt, text)
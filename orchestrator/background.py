@@ -0,0 +1,215 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, wait
+
+# Сколько фоновых задач "после ответа" (вывод черт и т.п.) выполняется одновременно
+POST_RESPONSE_WORKERS = int(os.environ.get("POST_RESPONSE_WORKERS", "4"))
+POST_RESPONSE_QUEUE_SIZE = int(os.environ.get("POST_RESPONSE_QUEUE_SIZE", "200"))
+
+# Психолингвистический анализ: ограничиваем число одновременных запросов к OpenRouter
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", "2"))
+ANALYSIS_QUEUE_SIZE = int(os.environ.get("ANALYSIS_QUEUE_SIZE", "100"))
+ANALYSIS_OVERFLOW_POLICY = os.environ.get("ANALYSIS_OVERFLOW_POLICY", "defer")
+
+# Завершение вытесненных сессий (анализ сессии через LLM) — отдельный пул,
+# чтобы ожидание их фоновых задач не занимало воркеры остальных пулов
+SESSION_CLOSE_WORKERS = int(os.environ.get("SESSION_CLOSE_WORKERS", "1"))
+SESSION_CLOSE_QUEUE_SIZE = int(os.environ.get("SESSION_CLOSE_QUEUE_SIZE", "500"))
+
+# Компактизация старых диалогов (суммаризация через LLM) — один поток на процесс,
+# чтобы запись в SQLite не конкурировала сама с собой
+COMPACTION_WORKERS = int(os.environ.get("COMPACTION_WORKERS", "1"))
+COMPACTION_QUEUE_SIZE = int(os.environ.get("COMPACTION_QUEUE_SIZE", "100"))
+
+OVERFLOW_DROP = "drop"
+OVERFLOW_DEFER = "defer"
+
+
+class WorkerPool:
+    """
+    Ограниченный пул потоков с очередью для фоновой работы, результат которой
+    пользователь не ждет.
+
+    Если очередь заполнена, срабатывает политика переполнения:
+      - "drop": новая задача отбрасывается (ее Future отменяется);
+      - "defer": задача откладывается и выполняется, когда основная очередь
+        опустеет. Отложенных задач не больше max_deferred, лишние отбрасываются.
+
+    Незавершенные задачи отслеживаются, чтобы тесты и штатное завершение
+    могли дождаться их выполнения.
+    """
+    def __init__(self, max_workers: int, name: str, max_queue: int = 100,
+                 overflow: str = OVERFLOW_DEFER, max_deferred: int = None):
+        if overflow not in (OVERFLOW_DROP, OVERFLOW_DEFER):
+            raise ValueError(f"Неизвестная политика переполнения: {overflow}")
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(1, max_queue)
+        self.overflow = overflow
+        self.max_deferred = self.max_queue if max_deferred is None else max_deferred
+
+        self._queue = deque()
+        self._deferred = deque()
+        self._pending = set()
+        self._workers = []
+        self._active = 0
+        self._shutdown = False
+        self._cond = threading.Condition()
+
+        # Метрики
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._dropped = 0
+        self._deferred_total = 0
+        self._max_depth_seen = 0
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Ставит задачу в очередь. Всегда возвращает Future; если задача
+        отброшена политикой переполнения, Future уже отменен.
+        """
+        future = Future()
+        job = (future, fn, args, kwargs)
+
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError(f"Пул '{self.name}' уже остановлен.")
+            self._submitted += 1
+
+            if len(self._queue) < self.max_queue:
+                self._queue.append(job)
+            elif self.overflow == OVERFLOW_DEFER and len(self._deferred) < self.max_deferred:
+                self._deferred.append(job)
+                self._deferred_total += 1
+            else:
+                self._dropped += 1
+                future.cancel()
+                print(f"⚠️ Пул '{self.name}' переполнен, задача отброшена (очередь: {len(self._queue)}).")
+                return future
+
+            self._pending.add(future)
+            self._max_depth_seen = max(self._max_depth_seen, len(self._queue) + len(self._deferred))
+            self._ensure_workers()
+            self._cond.notify()
+
+        future.add_done_callback(self._discard)
+        return future
+
+    def _ensure_workers(self):
+        # Потоки поднимаются лениво, по мере появления задач
+        if len(self._workers) < self.max_workers and len(self._workers) < self._active + len(self._queue) + len(self._deferred):
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"{self.name}-{len(self._workers)}",
+                daemon=True
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_job(self):
+        with self._cond:
+            while not self._queue and not self._deferred and not self._shutdown:
+                self._cond.wait()
+            if self._queue:
+                job = self._queue.popleft()
+            elif self._deferred:
+                # Основная очередь пуста — время для отложенных задач
+                job = self._deferred.popleft()
+            else:
+                return None
+            self._active += 1
+            return job
+
+    def _worker_loop(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            future, fn, args, kwargs = job
+            running = future.set_running_or_notify_cancel()
+            result, error = None, None
+            if running:
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    # Фоновая задача не должна молча "ронять" поток пула
+                    print(f"Ошибка в фоновой задаче ({self.name}): {e}")
+                    error = e
+            # Счетчики обновляются до того, как Future станет done: ожидающий
+            # pool.wait() видит уже согласованные метрики
+            with self._cond:
+                self._active -= 1
+                if error is not None:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+            if running:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def _discard(self, future: Future):
+        with self._cond:
+            self._pending.discard(future)
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self) -> dict:
+        """Метрики пула: глубина очередей, активные задачи и счетчики."""
+        with self._cond:
+            return {
+                "queue_depth": len(self._queue),
+                "deferred": len(self._deferred),
+                "active": self._active,
+                "workers": len(self._workers),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "dropped": self._dropped,
+                "deferred_total": self._deferred_total,
+                "max_depth_seen": self._max_depth_seen,
+            }
+
+    def wait(self, timeout: float = None) -> bool:
+        """Ждет завершения всех отправленных задач. Возвращает False по таймауту."""
+        with self._cond:
+            pending = list(self._pending)
+        _, not_done = wait(pending, timeout=timeout)
+        return not not_done
+
+    def shutdown(self, wait: bool = True):
+        """Останавливает пул. Уже поставленные задачи дорабатываются."""
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+            workers = list(self._workers)
+        if wait:
+            for worker in workers:
+                worker.join()
+
+
+# Общий для процесса пул пост-обработки ответа
+post_response_executor = WorkerPool(POST_RESPONSE_WORKERS, "post-response", max_queue=POST_RESPONSE_QUEUE_SIZE)
+
+# Общий для процесса пул фонового анализа сообщений (DetectorAgent)
+analysis_pool = WorkerPool(ANALYSIS_WORKERS, "analysis", max_queue=ANALYSIS_QUEUE_SIZE, overflow=ANALYSIS_OVERFLOW_POLICY)
+
+# Общий для процесса пул завершения сессий (end_session для вытесненных оркестраторов)
+session_close_pool = WorkerPool(SESSION_CLOSE_WORKERS, "session-close", max_queue=SESSION_CLOSE_QUEUE_SIZE)
+
+# Общий для процесса пул компактизации диалогов. Отброшенная задача не страшна:
+# следующая реплика пользователя поставит ее снова.
+compaction_pool = WorkerPool(COMPACTION_WORKERS, "compaction", max_queue=COMPACTION_QUEUE_SIZE, overflow=OVERFLOW_DROP)
+
+
+def shutdown_background_pools(wait: bool = True):
+    """Штатное завершение: дорабатываем очереди всех общих пулов."""
+    analysis_pool.shutdown(wait=wait)
+    post_response_executor.shutdown(wait=wait)
+    session_close_pool.shutdown(wait=wait)
+    compaction_pool.shutdown(wait=wait)
@@ -1,13 +1,37 @@
 # В начале файла
 from sqlalchemy.orm import Session, joinedload
-from database.models import User, CognitivePattern, DialogueEntry, UserProfile, UserTrait, SessionAnalysis
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-from database.db_connector import SessionLocal, get_chroma_collection, add_user_trait, get_user_traits, session_scope
-from datetime import datetime
-from sqlalchemy import desc
+from database.models import User, CognitivePattern, DialogueEntry, UserProfile, UserTrait, SessionAnalysis, SessionStrategy
+from database.db_connector import SessionLocal, get_chroma_collection, add_user_trait, get_user_traits, session_scope, async_session_scope
+from database.write_buffer import get_write_buffer
+from datetime import datetime, timedelta
+from sqlalchemy import desc, func, cast, Integer
+import asyncio
+import threading
+from concurrent.futures import Future
+import os
+from orchestrator.user_context import UserContextSnapshot, context_snapshots
+from orchestrator.background import compaction_pool, post_response_executor
+from orchestrator.significance import significance_scorer, SIGNIFICANCE_LLM_FALLBACK, SIGNIFICANCE_NOVELTY
 # Импортируем TaskAgent для оценки значимости
 from agents.task_agent import TaskAgent
 
+SIGNIFICANCE_PROMPT = (
+    "Оцени информационную плотность и важность следующего сообщения по шкале от 0.0 до 1.0. "
+    "Информативные сообщения, содержащие факты, вопросы, размышления или сильные эмоции, должны иметь высокий балл. "
+    "Простые приветствия, благодарности или ничего не значащие фразы ('ага', 'ок', 'не знаю') должны иметь низкий балл. "
+    "В ответ верни ТОЛЬКО число, например: 0.8"
+)
+
+# Когда у пользователя накапливается больше COMPACTION_THRESHOLD реплик,
+# фоновая задача суммаризирует COMPACTION_WINDOW самых старых
+COMPACTION_THRESHOLD = int(os.environ.get("DIALOGUE_COMPACTION_THRESHOLD", "50"))
+COMPACTION_WINDOW = int(os.environ.get("DIALOGUE_COMPACTION_WINDOW", "20"))
+
+DIALOGUE_SUMMARY_PROMPT = (
+    "Суммаризируй следующий диалог в одно-два предложения, сохранив ключевые темы и выводы. "
+    "Это саммари будет использоваться как долгосрочная память."
+)
+
 
 class DynamicMemory:
     def __init__(self, user_id_stub: str, task_agent: TaskAgent):
@@ -19,8 +43,79 @@ class DynamicMemory:
 
         # Векторная память — история диалогов
         self.vector_collection = get_chroma_collection(f"dialogue_vector_{user_id_stub}")
+
+        # Кэш контекста пользователя, общий для всех экземпляров (см. _get_context_snapshot)
+        self.context_snapshots = context_snapshots
+
+        # Буфер групповой фиксации (None — записи коммитятся сразу)
+        self.write_buffer = get_write_buffer()
+
+        # Фоновая компактизация диалогов: не больше одной задачи на пользователя
+        self._compaction_future = None
+        self._compaction_lock = threading.Lock()
         print(f"Пользователь {user_id_stub} инициализирован.")
 
+    # --- Запись через буфер write-behind ---
+
+    def _write(self, op, *args) -> Future:
+        """
+        Выполняет запись op(session, *args). В режиме write-behind операция уходит
+        в буфер групповой фиксации, иначе коммитится сразу. В обоих случаях
+        возвращается Future с результатом op.
+        """
+        if self.write_buffer is not None:
+            return self.write_buffer.submit(op, *args)
+        future = Future()
+        with session_scope() as session:
+            future.set_result(op(session, *args))
+        return future
+
+    def _flush_pending_writes(self):
+        """Read-your-writes: перед чтением буферизуемых таблиц дописываем очередь на диск."""
+        if self.write_buffer is not None:
+            self.write_buffer.flush()
+
+    async def _aflush_pending_writes(self):
+        if self.write_buffer is not None:
+            await asyncio.to_thread(self.write_buffer.flush)
+
+    # --- Снимок контекста пользователя ---
+    # Имя, резюме, паттерны, число сообщений, черты и психолингвистика читаются
+    # из снимка в памяти. Методы записи обновляют его после коммита (write-through),
+    # поэтому на теплом кэше приветствие, /memory и промпт не обращаются к БД.
+    # Снимок хранится по user_id в общем для процесса ContextSnapshotStore.
+
+    def _get_context_snapshot(self) -> UserContextSnapshot:
+        snapshot, version = self.context_snapshots.get(self.user_id)
+        if snapshot is not None:
+            return snapshot
+        self._flush_pending_writes()
+        with session_scope() as session:
+            snapshot = UserContextSnapshot.load(session, self.user_id)
+        return self._store_context_snapshot(snapshot, version)
+
+    async def _aget_context_snapshot(self) -> UserContextSnapshot:
+        snapshot, version = self.context_snapshots.get(self.user_id)
+        if snapshot is not None:
+            return snapshot
+        await self._aflush_pending_writes()
+        async with async_session_scope() as session:
+            snapshot = await session.run_sync(UserContextSnapshot.load, self.user_id)
+        return self._store_context_snapshot(snapshot, version)
+
+    def _store_context_snapshot(self, snapshot: UserContextSnapshot, version: int) -> UserContextSnapshot:
+        return self.context_snapshots.store(self.user_id, snapshot, version)
+
+    def _update_context_snapshot(self, change=None):
+        """
+        Применяет change(snapshot) -> snapshot к загруженному снимку.
+        Без change снимок просто сбрасывается и будет перечитан при следующем обращении.
+        """
+        self.context_snapshots.update(self.user_id, change)
+
+    def _count_new_message(self):
+        self._update_context_snapshot(lambda s: s.with_changes(message_count=s.message_count + 1))
+
     def _init_vector_collection(self):
         """Создаёт или получает коллекцию Chroma для хранения диалогов."""
         collection_name = f"dialogue_vector_{self.user_id_stub}"
@@ -43,77 +138,181 @@ class DynamicMemory:
 
             return user.id # Возвращаем только ID
 
+    def _nearest_memory_similarity(self, text: str):
+        """Косинусное сходство с ближайшей сохраненной репликой или None (выключено / память пуста)."""
+        if not SIGNIFICANCE_NOVELTY:
+            return None
+        try:
+            if self.vector_collection.count() == 0:
+                return None
+            results = self.vector_collection.query(query_texts=[text], n_results=1, include=["distances"])
+            # Chroma по умолчанию возвращает квадрат L2 между нормированными векторами
+            return 1 - results["distances"][0][0] / 2
+        except Exception as e:
+            print(f"Ошибка при оценке новизны сообщения: {e}")
+            return None
+
+    def _local_significance(self, text: str, max_similarity=None):
+        """
+        Локальная оценка значимости. Возвращает (значимо, нужен_llm):
+        LLM дооценивает только пограничные сообщения и только при SIGNIFICANCE_LLM_FALLBACK.
+        """
+        score = significance_scorer.score(text, max_similarity)
+        ask_llm = SIGNIFICANCE_LLM_FALLBACK and significance_scorer.is_borderline(score)
+        return significance_scorer.is_significant(score), ask_llm
+
     def _is_significant(self, text: str) -> bool:
         """
-        Оценивает информационную значимость сообщения с помощью LLM.
+        Оценивает информационную значимость сообщения локальным скорером (без сети).
         Возвращает True, если сообщение стоит сохранить в долгосрочную память.
         """
-        # Простое правило: слишком короткие сообщения отсекаем сразу
-        if len(text.split()) < 3:
-            return False
-
-        prompt = (
-            "Оцени информационную плотность и важность следующего сообщения по шкале от 0.0 до 1.0. "
-            "Информативные сообщения, содержащие факты, вопросы, размышления или сильные эмоции, должны иметь высокий балл. "
-            "Простые приветствия, благодарности или ничего не значащие фразы ('ага', 'ок', 'не знаю') должны иметь низкий балл. "
-            "В ответ верни ТОЛЬКО число, например: 0.8"
-        )
+        significant, ask_llm = self._local_significance(text, self._nearest_memory_similarity(text))
+        if not ask_llm:
+            return significant
+
+        response = self.task_agent.complete(text, SIGNIFICANCE_PROMPT, call_type="significance")
+        return self._parse_significance(response)
+
+    async def _ais_significant(self, text: str) -> bool:
+        """Асинхронный вариант _is_significant."""
+        max_similarity = None
+        if SIGNIFICANCE_NOVELTY:
+            max_similarity = await asyncio.to_thread(self._nearest_memory_similarity, text)
+        significant, ask_llm = self._local_significance(text, max_similarity)
+        if not ask_llm:
+            return significant
+
+        response = await self.task_agent.acomplete(text, SIGNIFICANCE_PROMPT, call_type="significance")
+        return self._parse_significance(response)
+
+    @staticmethod
+    def _parse_significance(response: str) -> bool:
         try:
-            response = self.task_agent.process(text, context_memory=prompt)
             score = float(response.strip())
             return score > 0.6
         except (ValueError, TypeError):
             # В случае ошибки от LLM, считаем сообщение незначимым
             return False
 
-    def save_interaction(self, text: str, is_user: bool):
+    def _insert_dialogue_entry(self, session: Session, text: str, is_user: bool):
         """
-        Сохраняет взаимодействие в SQLite, а в ChromaDB — только если оно
-        признано информационно значимым.
+        Добавляет реплику в SQLite и увеличивает счетчик реплик пользователя.
+        Возвращает (id, timestamp, dialogue_count).
         """
-        with session_scope() as session:
+        entry = DialogueEntry(user_id=self.user_id, is_user=is_user, content=text)
+        session.add(entry)
+        session.flush() # To get entry.id
+        session.query(User).filter(User.id == self.user_id).update(
+            {User.dialogue_count: User.dialogue_count + 1}, synchronize_session=False
+        )
+        dialogue_count = session.query(User.dialogue_count).filter(User.id == self.user_id).scalar()
+        return entry.id, entry.timestamp, dialogue_count
+
+    def _add_to_vector_memory(self, entry_id: int, text: str, timestamp):
+        self.vector_collection.add(
+            ids=[str(entry_id)],
+            documents=[text],
+            metadatas=[{
+                "user_id": self.user_id,
+                "type": "user_input",
+                "timestamp": timestamp.isoformat() if timestamp else ""
+            }]
+        )
+        print(f"Сохранена значимая реплика в ChromaDB: '{text[:50]}...'")
+
+    def _after_user_entry(self, inserted, text: str, significant: bool):
+        """Компактизация и векторная память — после того, как реплика пользователя записана."""
+        entry_id, timestamp, dialogue_count = inserted
+        # Компактизацию запускаем только после реплики пользователя
+        self._schedule_compaction(dialogue_count)
+        # Сохраняем в векторную базу только значимые реплики пользователя
+        if significant:
+            self._add_to_vector_memory(entry_id, text, timestamp)
+
+    def _defer_user_entry(self, written: Future, text: str, significant: bool):
+        """
+        Режим write-behind: ход не ждет коммита пачки. Когда пачка зафиксирована
+        и у реплики появился id, векторная запись уходит в пул пост-обработки,
+        чтобы не задерживать поток фиксации.
+        """
+        def on_written(future: Future):
+            if future.exception() is not None:
+                print(f"Реплика не записана, векторная память не обновлена: {future.exception()}")
+                return
             try:
-                # 1. Всегда сохраняем в SQLite для полной истории
-                entry = DialogueEntry(user_id=self.user_id, is_user=is_user, content=text)
-                session.add(entry)
-                session.flush() # To get entry.id
-
-                # После сохранения проверяем, не пора ли суммаризировать
-                if is_user: # Суммаризацию запускаем только после реплики пользователя
-                    self.summarize_old_dialogues()
-
-                # 2. Сохраняем в векторную базу только значимые реплики пользователя
-                if is_user and self._is_significant(text):
-                    self.vector_collection.add(
-                        ids=[str(entry.id)],
-                        documents=[text],
-                        metadatas=[{
-                            "user_id": self.user_id,
-                            "type": "user_input",
-                            "timestamp": entry.timestamp.isoformat() if entry.timestamp else ""
-                        }]
-                    )
-                    print(f"Сохранена значимая реплика в ChromaDB: '{text[:50]}...'")
-
+                post_response_executor.submit(self._after_user_entry, future.result(), text, significant)
             except Exception as e:
-                print(f"Ошибка при сохранении взаимодействия: {e}")
-                raise
+                print(f"Ошибка при постановке записи в векторную память: {e}")
+
+        written.add_done_callback(on_written)
+
+    def save_interaction(self, text: str, is_user: bool, significant: bool = None):
+        """
+        Сохраняет взаимодействие в SQLite, а в ChromaDB — только если оно
+        признано информационно значимым. significant задает решение заранее
+        (например, для команд, распознанных оркестратором) — скорер не вызывается.
+        """
+        try:
+            # 1. Всегда сохраняем в SQLite для полной истории
+            written = self._write(self._insert_dialogue_entry, text, is_user)
+            self._count_new_message()
+
+            if is_user:
+                # Пока запись ждет своей пачки, оцениваем значимость
+                if significant is None:
+                    significant = self._is_significant(text)
+                if self.write_buffer is not None:
+                    self._defer_user_entry(written, text, significant)
+                else:
+                    # 2. Векторная база и компактизация — сразу после коммита
+                    self._after_user_entry(written.result(), text, significant)
+
+        except Exception as e:
+            print(f"Ошибка при сохранении взаимодействия: {e}")
+            raise
+
+    async def asave_interaction(self, text: str, is_user: bool, significant: bool = None):
+        """
+        Асинхронный вариант save_interaction. Запись в SQLite идет через aiosqlite,
+        вызовы LLM — через ainvoke; транзакция не держится открытой во время ожидания LLM.
+        """
+        try:
+            written = None
+            if self.write_buffer is not None:
+                written = self.write_buffer.submit(self._insert_dialogue_entry, text, is_user)
+            else:
+                async with async_session_scope() as session:
+                    inserted = await session.run_sync(self._insert_dialogue_entry, text, is_user)
+            self._count_new_message()
+
+            if is_user:
+                if significant is None:
+                    significant = await self._ais_significant(text)
+                if written is not None:
+                    self._defer_user_entry(written, text, significant)
+                else:
+                    await asyncio.to_thread(self._after_user_entry, inserted, text, significant)
+        except Exception as e:
+            print(f"Ошибка при сохранении взаимодействия: {e}")
+            raise
+
+    def _add_cognitive_pattern(self, session: Session, pattern_name: str, confidence: int, context: str):
+        session.add(CognitivePattern(
+            user_id=self.user_id,
+            pattern_name=pattern_name,
+            confidence_score=confidence,
+            context=context
+        ))
 
     def save_cognitive_pattern(self, pattern_name: str, confidence: int, context: str):
-        """Сохраняет обнаруженный когнитивный паттерн в базу данных."""
-        with session_scope() as session:
-            try:
-                new_pattern = CognitivePattern(
-                    user_id=self.user_id,
-                    pattern_name=pattern_name,
-                    confidence_score=confidence,
-                    context=context
-                )
-                session.add(new_pattern)
-                print(f"✅ Сохранён паттерн '{pattern_name}' (уверенность: {confidence})")
-            except Exception as e:
-                print(f"❌ Ошибка при сохранении паттерна: {e}")
-                raise
+        """Сохраняет обнаруженный когнитивный паттерн в базу данных (или в буфер write-behind)."""
+        try:
+            self._write(self._add_cognitive_pattern, pattern_name, confidence, context)
+            print(f"✅ Сохранён паттерн '{pattern_name}' (уверенность: {confidence})")
+        except Exception as e:
+            print(f"❌ Ошибка при сохранении паттерна: {e}")
+            raise
+        self._update_context_snapshot(lambda s: s.with_pattern(pattern_name))
 
     
     def search_memories(self, query: str, n_results: int = 3) -> list:
@@ -129,6 +328,10 @@ class DynamicMemory:
             print(f"Ошибка при поиске в памяти: {e}")
             return []
 
+    async def asearch_memories(self, query: str, n_results: int = 3) -> list:
+        """Асинхронный вариант search_memories (ChromaDB локальна, поэтому — в пуле потоков)."""
+        return await asyncio.to_thread(self.search_memories, query, n_results)
+
     def get_last_session_summary_for_prompt(self) -> str:
         summary = self.get_last_session_summary()
         if summary:
@@ -137,6 +340,7 @@ class DynamicMemory:
 
     def get_pattern_frequency(self, pattern_name: str) -> int:
         """Возвращает количество раз, сколько встречался паттерн."""
+        self._flush_pending_writes()
         with session_scope() as session:
             count = session.query(CognitivePattern).filter_by(
                 user_id=self.user_id,
@@ -146,6 +350,7 @@ class DynamicMemory:
 
     def get_user_patterns(self):
         """Возвращает все когнитивные паттерны для текущего пользователя."""
+        self._flush_pending_writes()
         try:
             with session_scope() as session:
                 return session.query(CognitivePattern).filter_by(user_id=self.user_id).all()
@@ -153,49 +358,58 @@ class DynamicMemory:
             print(f"Ошибка при получении паттернов: {e}")
             return []
 
-    def get_pattern_weight(self, pattern_name: str) -> float:
-        with session_scope() as session:
-            patterns = session.query(CognitivePattern).filter(...).all()
-            weight = 0
-            for p in patterns:
-                days_ago = (datetime.utcnow() - p.observed_at).days
-                decay = 0.9 ** (days_ago / 7)  # Затухание на 10% в неделю
-                weight += decay
-            return weight
+    def _select_pattern_day_counts(self, session: Session, window_days: int = None, pattern_name: str = None, now: datetime = None) -> list:
+        """
+        Агрегирует наблюдения в SQL: (pattern_name, days_ago, count) — по одной строке
+        на паттерн и день. Число строк ограничено окном, а не числом наблюдений.
+        """
+        now = now or datetime.utcnow()
+        days_ago = cast(func.julianday(now) - func.julianday(CognitivePattern.observed_at), Integer)
+        query = session.query(
+            CognitivePattern.pattern_name, days_ago, func.count(CognitivePattern.id)
+        ).filter(CognitivePattern.user_id == self.user_id)
+        if pattern_name is not None:
+            query = query.filter(CognitivePattern.pattern_name == pattern_name)
+        if window_days is not None:
+            # Грубое отсечение по индексу, точное — по целому числу дней
+            query = query.filter(
+                CognitivePattern.observed_at >= now - timedelta(days=window_days + 1),
+                days_ago <= window_days
+            )
+        return query.group_by(CognitivePattern.pattern_name, days_ago).all()
 
-    def get_pattern_weight_over_time(self, pattern_name: str, window_days: int = 30):
+    def get_pattern_weights(self, window_days: int = 30, pattern_name: str = None) -> dict:
         """
-        Возвращает "вес" паттерна за последние N дней с учётом затухания.
+        Возвращает {pattern_name: вес} для всех паттернов пользователя за последние
+        window_days дней (None — за все время) с учётом затухания на 10% в неделю.
         Используется для отслеживания прогресса (ЗБР).
         """
+        self._flush_pending_writes()
         with session_scope() as session:
-            patterns = (
-                session.query(CognitivePattern)
-                .filter_by(user_id=self.user_id, pattern_name=pattern_name)
-                .order_by(CognitivePattern.observed_at)
-                .all()
-            )
-
-        if not patterns:
-            return 0.0
+            rows = self._select_pattern_day_counts(session, window_days, pattern_name)
 
-        total_weight = 0.0
-        now = datetime.utcnow()
-
-        for p in patterns:
-            days_ago = (now - p.observed_at).days
-            if days_ago > window_days:
-                continue  # вне окна
+        weights = {}
+        for name, days_ago, count in rows:
             decay = 0.9 ** (days_ago / 7)  # экспоненциальное затухание (10% в неделю)
-            total_weight += decay
+            weights[name] = weights.get(name, 0.0) + count * decay
+        return {name: round(weight, 2) for name, weight in sorted(weights.items())}
+
+    def get_pattern_weight(self, pattern_name: str) -> float:
+        """Вес паттерна за все время наблюдений."""
+        return self.get_pattern_weights(window_days=None, pattern_name=pattern_name).get(pattern_name, 0.0)
 
-        return round(total_weight, 2)
+    def get_pattern_weight_over_time(self, pattern_name: str, window_days: int = 30):
+        """
+        Возвращает "вес" паттерна за последние N дней с учётом затухания.
+        """
+        return self.get_pattern_weights(window_days, pattern_name).get(pattern_name, 0.0)
 
     def get_pattern_history(self, pattern_name: str, limit: int = 10):
         """
         Возвращает последние N наблюдений за паттерном.
         Полезно для анализа динамики.
         """
+        self._flush_pending_writes()
         with session_scope() as session:
             patterns = (
                 session.query(CognitivePattern)
@@ -211,6 +425,7 @@ class DynamicMemory:
         Возвращает общее количество наблюдений за паттерном.
         Уже есть — оставляем как есть.
         """
+        self._flush_pending_writes()
         with session_scope() as session:
             count = session.query(CognitivePattern).filter_by(
                 user_id=self.user_id,
@@ -219,97 +434,62 @@ class DynamicMemory:
             return count
 
     def get_user_profile_summary(self) -> str:
-        """Возвращает краткое резюме того, что знает о пользователе."""
-        summary_parts = []
-        from sqlalchemy.orm import joinedload
-        with session_scope() as session:
-            user = session.query(User).options(joinedload(User.profile)).get(self.user_id)
-            # Имя
-            name = self.get_user_name()
-            if name:
-                summary_parts.append(f"Тебя зовут {name}.")
-
-            # Последнее резюме
-            last_summary = self.get_last_session_summary()
-            if last_summary:
-                summary_parts.append(f"В прошлый раз мы говорили о: {last_summary}")
-
-            # Паттерны
-            patterns = self.get_user_patterns()
-            if patterns:
-                unique_biases = {p.pattern_name for p in patterns}
-                bias_names = {
-                    "black_and_white_thinking": "черно-белое мышление",
-                    "catastrophizing": "катастрофизация",
-                    "overgeneralization": "чрезмерное обобщение",
-                    "personalization": "персонализация"
-                }
-                human_biases = [bias_names.get(b, b) for b in unique_biases]
-                if human_biases:
-                    summary_parts.append(f"Я отмечал у тебя паттерны: {', '.join(human_biases)}.")
-
-            # Число диалогов
-            recent_messages = session.query(DialogueEntry).filter_by(user_id=self.user_id).count()
-            if recent_messages > 0:
-                summary_parts.append(f"Мы уже обменялись {recent_messages} сообщениями.")
-
-            # Черты пользователя
-            traits_summary = self.get_user_traits_summary()
-            if traits_summary:
-                summary_parts.append(traits_summary)
-
-            # Новые психолингвистические данные
-            if user.profile and user.profile.last_emotional_tone:
-                summary_parts.append(f"Твой последний эмоциональный тон был '{user.profile.last_emotional_tone}'.")
-            if user.profile and user.profile.dominant_communication_style:
-                summary_parts.append(f"Твой доминирующий стиль общения — '{user.profile.dominant_communication_style}'.")
-
-        return " ".join(summary_parts) if summary_parts else "Пока что я мало о тебе знаю."
+        """Возвращает краткое резюме того, что знает о пользователе (из снимка контекста)."""
+        return self._get_context_snapshot().profile_summary()
+
+    async def aget_user_profile_summary(self) -> str:
+        """Асинхронный вариант get_user_profile_summary."""
+        return (await self._aget_context_snapshot()).profile_summary()
+
+    def _reinforce_trait(self, session: Session, trait_type: str, trait_description: str, confidence: int):
+        # Ищем существующую гипотезу
+        existing_trait = session.query(UserTrait).filter_by(
+            user_id=self.user_id,
+            trait_description=trait_description
+        ).first()
+
+        if existing_trait:
+            # Если нашли, и это все еще гипотеза, увеличиваем счетчик
+            if existing_trait.status == 'hypothesis':
+                existing_trait.confirmation_count += 1
+                existing_trait.confidence = max(existing_trait.confidence, confidence) # Обновляем уверенность
+
+                # Проверяем, не пора ли сделать гипотезу фактом
+                if existing_trait.confirmation_count >= 3:
+                    existing_trait.status = 'fact'
+                    print(f"🔥 Гипотеза подтверждена как факт: '{trait_description}'")
+                else:
+                    print(f"🔄 Гипотеза усилена: '{trait_description}' (подтверждений: {existing_trait.confirmation_count})")
+        else:
+            # Если не нашли, создаем новую гипотезу
+            new_trait = UserTrait(
+                user_id=self.user_id,
+                trait_type=trait_type,
+                trait_description=trait_description,
+                confidence=confidence,
+                status='hypothesis',
+                confirmation_count=1
+            )
+            session.add(new_trait)
+            # Следующая операция той же пачки должна увидеть эту гипотезу
+            session.flush()
+            print(f"💡 Новая гипотеза: '{trait_description}'")
 
     def reinforce_user_trait(self, trait_type: str, trait_description: str, confidence: int):
         """
         Сохраняет или усиливает "гипотезу" о черте пользователя.
         Если гипотеза подтверждается достаточное количество раз, она становится "фактом".
         """
-        with session_scope() as session:
-            try:
-                # Ищем существующую гипотезу
-                existing_trait = session.query(UserTrait).filter_by(
-                    user_id=self.user_id,
-                    trait_description=trait_description
-                ).first()
-
-                if existing_trait:
-                    # Если нашли, и это все еще гипотеза, увеличиваем счетчик
-                    if existing_trait.status == 'hypothesis':
-                        existing_trait.confirmation_count += 1
-                        existing_trait.confidence = max(existing_trait.confidence, confidence) # Обновляем уверенность
-
-                        # Проверяем, не пора ли сделать гипотезу фактом
-                        if existing_trait.confirmation_count >= 3:
-                            existing_trait.status = 'fact'
-                            print(f"🔥 Гипотеза подтверждена как факт: '{trait_description}'")
-                        else:
-                            print(f"🔄 Гипотеза усилена: '{trait_description}' (подтверждений: {existing_trait.confirmation_count})")
-                else:
-                    # Если не нашли, создаем новую гипотезу
-                    new_trait = UserTrait(
-                        user_id=self.user_id,
-                        trait_type=trait_type,
-                        trait_description=trait_description,
-                        confidence=confidence,
-                        status='hypothesis',
-                        confirmation_count=1
-                    )
-                    session.add(new_trait)
-                    print(f"💡 Новая гипотеза: '{trait_description}'")
-
-            except Exception as e:
-                print(f"❌ Ошибка при усилении черты пользователя: {e}")
-                raise
+        try:
+            self._write(self._reinforce_trait, trait_type, trait_description, confidence)
+        except Exception as e:
+            print(f"❌ Ошибка при усилении черты пользователя: {e}")
+            raise
+        self._update_context_snapshot(lambda s: s.with_trait(trait_type, trait_description))
 
     def get_user_traits_summary(self) -> str:
         """Возвращает форматированную строку с чертами пользователя."""
+        self._flush_pending_writes()
         with session_scope() as session:
             try:
                 traits = get_user_traits(session, self.user_id)
@@ -374,11 +554,13 @@ class DynamicMemory:
                 user.profile = UserProfile(user_id=self.user_id)
                 session.add(user.profile)
             user.profile.name = name
+        self._update_context_snapshot(lambda s: s.with_changes(name=name))
 
     def get_user_name(self) -> str:
-        with session_scope() as session:
-            user = session.query(User).options(joinedload(User.profile)).get(self.user_id)
-            return user.profile.name if user.profile and user.profile.name else None
+        return self._get_context_snapshot().name or None
+
+    async def aget_user_name(self) -> str:
+        return (await self._aget_context_snapshot()).name or None
 
     def save_session_analysis(self, summary: str, topics: list, patterns: list):
         """
@@ -396,15 +578,55 @@ class DynamicMemory:
             except Exception as e:
                 print(f"Ошибка при сохранении анализа сессии: {e}")
                 raise
+        # Итоги сессии могут менять все, что известно о пользователе, — перечитываем снимок
+        self._update_context_snapshot()
 
     def get_recent_session_analyses(self, limit: int = 5) -> list:
         """
         Возвращает последние N записей анализа сессий для выработки стратегии.
+        Записи возвращаются словарями: после закрытия сессии ORM-объекты уже недоступны.
         """
         with session_scope() as session:
-            return session.query(SessionAnalysis).filter_by(
+            analyses = session.query(SessionAnalysis).filter_by(
                 user_id=self.user_id
             ).order_by(desc(SessionAnalysis.ended_at)).limit(limit).all()
+            return [
+                {
+                    "ended_at": a.ended_at,
+                    "key_topics": a.key_topics,
+                    "identified_patterns": a.identified_patterns,
+                    "session_summary": a.session_summary,
+                }
+                for a in analyses
+            ]
+
+    def get_session_strategy(self) -> tuple:
+        """
+        Возвращает (id последнего анализа сессии, стратегия для него или None).
+        Если анализов еще нет, возвращает (None, None).
+        """
+        with session_scope() as session:
+            latest = session.query(SessionAnalysis.id).filter_by(
+                user_id=self.user_id
+            ).order_by(desc(SessionAnalysis.ended_at), desc(SessionAnalysis.id)).first()
+            if latest is None:
+                return None, None
+            strategy = session.query(SessionStrategy.note).filter_by(
+                user_id=self.user_id, based_on_analysis_id=latest.id
+            ).order_by(desc(SessionStrategy.created_at)).first()
+            return latest.id, strategy.note if strategy else None
+
+    def save_session_strategy(self, analysis_id: int, note: str):
+        """
+        Сохраняет стратегию, выработанную по анализу analysis_id.
+        Устаревшие стратегии пользователя удаляются: нужна только последняя.
+        """
+        with session_scope() as session:
+            session.query(SessionStrategy).filter(
+                SessionStrategy.user_id == self.user_id,
+                SessionStrategy.based_on_analysis_id != analysis_id
+            ).delete(synchronize_session=False)
+            session.add(SessionStrategy(user_id=self.user_id, based_on_analysis_id=analysis_id, note=note))
 
     def save_session_summary(self, summary: str):
         with session_scope() as session:
@@ -413,61 +635,99 @@ class DynamicMemory:
                 user.profile = UserProfile(user_id=self.user_id)
                 session.add(user.profile)
             user.profile.last_session_summary = summary
+        self._update_context_snapshot(lambda s: s.with_changes(last_session_summary=summary))
 
     def get_last_session_summary(self) -> str:
-        with session_scope() as session:
-            user = session.query(User).options(joinedload(User.profile)).get(self.user_id)
-            return user.profile.last_session_summary if user.profile and user.profile.last_session_summary else None
+        return self._get_context_snapshot().last_session_summary or None
+
+    async def aget_last_session_summary(self) -> str:
+        return (await self._aget_context_snapshot()).last_session_summary or None
 
-    def summarize_old_dialogues(self, window_size: int = 20, summarization_threshold: int = 50):
+    def _select_dialogues_to_summarize(self, session: Session, window_size: int, summarization_threshold: int) -> list:
         """
-        Проверяет количество диалоговых записей и, если оно превышает порог,
-        суммаризирует самые старые из них.
+        Если число записей диалога (счетчик users.dialogue_count) превышает порог,
+        возвращает самые старые из них в виде списка (id, is_user, content).
+        Иначе — пустой список.
         """
-        with session_scope() as session:
-            dialogue_count = session.query(DialogueEntry).filter_by(user_id=self.user_id).count()
-
-            if dialogue_count > summarization_threshold:
-                # 1. Получаем самые старые записи для суммаризации
-                entries_to_summarize = (
-                    session.query(DialogueEntry)
-                    .filter_by(user_id=self.user_id)
-                    .order_by(DialogueEntry.timestamp)
-                    .limit(window_size)
-                    .all()
-                )
-
-                if not entries_to_summarize:
-                    return
-
-                # 2. Создаем текст для суммаризации
-                dialogue_text = "\n".join(
-                    [f"{'User' if e.is_user else 'Agent'}: {e.content}" for e in entries_to_summarize]
-                )
+        dialogue_count = session.query(User.dialogue_count).filter(User.id == self.user_id).scalar() or 0
+        if dialogue_count <= summarization_threshold:
+            return []
 
-                # 3. Вызываем LLM для создания саммари
-                summary_prompt = (
-                    "Суммаризируй следующий диалог в одно-два предложения, сохранив ключевые темы и выводы. "
-                    "Это саммари будет использоваться как долгосрочная память."
-                )
-                summary = self.task_agent.process(dialogue_text, context_memory=summary_prompt)
+        entries = (
+            session.query(DialogueEntry.id, DialogueEntry.is_user, DialogueEntry.content)
+            .filter_by(user_id=self.user_id)
+            .order_by(DialogueEntry.timestamp)
+            .limit(window_size)
+            .all()
+        )
+        return [(entry_id, is_user, content) for entry_id, is_user, content in entries]
 
-                # 4. Добавляем саммари в профиль пользователя
-                user = session.query(User).options(joinedload(User.profile)).get(self.user_id)
-                if not user.profile:
-                    user.profile = UserProfile(user_id=self.user_id)
-                    session.add(user.profile)
+    @staticmethod
+    def _format_dialogue(entries: list) -> str:
+        return "\n".join(
+            [f"{'User' if is_user else 'Agent'}: {content}" for _, is_user, content in entries]
+        )
 
-                # Обновляем long_term_summary, добавляя новое саммари к существующему
-                existing_summary = user.profile.long_term_summary or ""
-                user.profile.long_term_summary = f"{existing_summary}\n- {summary}".strip()
+    def _store_dialogue_summary(self, session: Session, summary: str, entry_ids: list) -> int:
+        """
+        Удаляет суммаризированные записи, уменьшает счетчик и дописывает саммари
+        в long_term_summary. Возвращает число удаленных записей: если их уже
+        удалила другая задача, саммари не дописывается.
+        """
+        deleted = session.query(DialogueEntry).filter(
+            DialogueEntry.user_id == self.user_id, DialogueEntry.id.in_(entry_ids)
+        ).delete(synchronize_session=False)
+        if not deleted:
+            return 0
+
+        session.query(User).filter(User.id == self.user_id).update(
+            {User.dialogue_count: User.dialogue_count - deleted}, synchronize_session=False
+        )
 
-                # 5. Удаляем старые записи
-                for entry in entries_to_summarize:
-                    session.delete(entry)
+        user = session.query(User).options(joinedload(User.profile)).get(self.user_id)
+        if not user.profile:
+            user.profile = UserProfile(user_id=self.user_id)
+            session.add(user.profile)
+
+        # Обновляем long_term_summary, добавляя новое саммари к существующему
+        existing_summary = user.profile.long_term_summary or ""
+        user.profile.long_term_summary = f"{existing_summary}\n- {summary}".strip()
+        return deleted
+
+    def _schedule_compaction(self, dialogue_count: int):
+        """Ставит компактизацию в фоновый пул, если порог превышен и задача еще не запущена."""
+        if dialogue_count <= COMPACTION_THRESHOLD:
+            return
+        with self._compaction_lock:
+            if self._compaction_future is not None and not self._compaction_future.done():
+                return
+            self._compaction_future = compaction_pool.submit(self.summarize_old_dialogues)
+
+    def summarize_old_dialogues(self, window_size: int = COMPACTION_WINDOW, summarization_threshold: int = COMPACTION_THRESHOLD) -> int:
+        """
+        Компактизация: если записей диалога больше порога, суммаризирует самые старые.
+        Вызов LLM идет вне транзакции; саммари и удаление записей коммитятся
+        атомарно после него. Возвращает число суммаризированных записей.
+        """
+        # 1. Получаем самые старые записи для суммаризации (короткая читающая транзакция)
+        self._flush_pending_writes()
+        with session_scope() as session:
+            entries_to_summarize = self._select_dialogues_to_summarize(session, window_size, summarization_threshold)
+        if not entries_to_summarize:
+            return 0
 
-                print(f"✅ Суммаризировано и удалено {len(entries_to_summarize)} старых записей диалога.")
+        # 2. Вызываем LLM для создания саммари — блокировка записи SQLite не удерживается
+        summary = self.task_agent.complete(self._format_dialogue(entries_to_summarize), DIALOGUE_SUMMARY_PROMPT)
+        if not summary.strip():
+            # LLM недоступен — записи останутся до следующей попытки
+            return 0
 
+        # 3. Одной транзакцией добавляем саммари в профиль и удаляем старые записи
+        with session_scope() as session:
+            deleted = self._store_dialogue_summary(session, summary, [e[0] for e in entries_to_summarize])
+        self._update_context_snapshot()
+        print(f"✅ Суммаризировано и удалено {deleted} старых записей диалога.")
+        return deleted
 
     def save_psycholinguistic_features(self, emotional_tone: str, communication_style: str):
         """
@@ -486,3 +746,6 @@ class DynamicMemory:
             except Exception as e:
                 print(f"❌ Ошибка при сохранении психолингвистических метрик: {e}")
                 raise
+        self._update_context_snapshot(lambda s: s.with_changes(
+            emotional_tone=emotional_tone, communication_style=communication_style
+        ))
@@ -0,0 +1,126 @@
+import os
+import re
+import json
+from collections import deque
+from functools import lru_cache
+
+# JSON-файл с наборами триггеров: {"название_намерения": ["фраза", ...], ...}.
+# Наборы из файла заменяют встроенные с тем же названием, новые — добавляются.
+INTENT_TRIGGERS_PATH = os.environ.get("INTENT_TRIGGERS_PATH", "")
+
+INTENT_RETRIEVE_MEMORY = "retrieve_memory"
+INTENT_THINKING_CYCLE = "thinking_cycle"
+INTENT_REPORT_MEMORY = "report_memory"
+INTENT_SWITCH_CONTEXT = "switch_context"
+
+DEFAULT_TRIGGERS = {
+    INTENT_RETRIEVE_MEMORY: [
+        "о чём мы говорили", "что было", "напомни", "раньше говорил",
+        "прошлый раз", "уже обсуждали", "говорили ли", "помнит"
+    ],
+    INTENT_THINKING_CYCLE: [
+        "давай подумаем", "помоги решить", "что мне делать",
+        "не могу понять", "нужен совет", "помоги разобраться"
+    ],
+    INTENT_REPORT_MEMORY: [
+        "расскажи про меня", "что ты обо мне знаешь", "что ты обо мне помнишь",
+        "что ты помнишь", "что ты знаешь", "напомни", "о чём мы говорили",
+        "что было", "уже обсуждали", "что обо мне"
+    ],
+    INTENT_SWITCH_CONTEXT: [
+        "на работе", "офис", "заебал", "придурок", "идиот",
+        "хватит", "стоп", "не то", "говно", "ссанина"
+    ],
+}
+
+
+def normalize(text: str) -> str:
+    """Убирает знаки препинания и приводит к нижнему регистру."""
+    return re.sub(r'[^\w\s]', '', text.lower().strip())
+
+
+def load_triggers(path: str = None) -> dict:
+    """
+    Возвращает наборы триггеров: встроенные, дополненные/переопределенные
+    наборами из JSON-файла (если путь задан и файл существует).
+    """
+    triggers = {intent: list(phrases) for intent, phrases in DEFAULT_TRIGGERS.items()}
+    path = INTENT_TRIGGERS_PATH if path is None else path
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for intent, phrases in json.load(f).items():
+                triggers[intent] = list(phrases)
+        print(f"Наборы триггеров загружены из {path}.")
+    return triggers
+
+
+class IntentMatcher:
+    """
+    Классифицирует сообщение по всем наборам триггеров за один проход.
+
+    Все фразы компилируются в один автомат Ахо-Корасик, поэтому стоимость
+    проверки зависит от длины сообщения, а не от числа наборов и фраз.
+    Текст и фразы нормализуются одинаково (см. normalize).
+    """
+    def __init__(self, triggers: dict):
+        # Узел автомата: переходы, суффиксная ссылка и намерения, которые в нем срабатывают
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [frozenset()]
+        self.intents = frozenset(triggers)
+
+        pending_output = [set()]
+        for intent, phrases in triggers.items():
+            for phrase in phrases:
+                phrase = normalize(phrase)
+                if not phrase:
+                    continue
+                node = 0
+                for char in phrase:
+                    next_node = self._goto[node].get(char)
+                    if next_node is None:
+                        next_node = len(self._goto)
+                        self._goto[node][char] = next_node
+                        self._goto.append({})
+                        self._fail.append(0)
+                        pending_output.append(set())
+                    node = next_node
+                pending_output[node].add(intent)
+
+        # Суффиксные ссылки строим обходом в ширину; выходы наследуются по ним
+        self._output = [frozenset(o) for o in pending_output]
+        queue = deque(self._goto[0].values())  # у детей корня ссылка ведет в корень
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] | self._output[self._fail[child]]
+
+    @classmethod
+    def from_file(cls, path: str) -> "IntentMatcher":
+        return cls(load_triggers(path))
+
+    def match(self, text: str) -> set:
+        """Возвращает множество всех сработавших намерений."""
+        goto, fail, output = self._goto, self._fail, self._output
+        fired = set()
+        node = 0
+        for char in normalize(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                fired |= output[node]
+                if len(fired) == len(self.intents):
+                    break  # Сработали все намерения — дальше читать незачем
+        return fired
+
+
+@lru_cache(maxsize=None)
+def get_intent_matcher() -> IntentMatcher:
+    """Общий для процесса автомат, собранный из встроенных триггеров и INTENT_TRIGGERS_PATH."""
+    return IntentMatcher(load_triggers())
@@ -1,14 +1,18 @@
 import uuid
 import json
-import threading
-import time
+import asyncio
+from concurrent.futures import wait
 from agents.task_agent import TaskAgent
 from agents.detector_agent import DetectorAgent
 from agents.methodology_agent import MethodologyAgent
 from agents.bias_mapping import RUSSIAN_TO_INTERNAL_BIAS_MAP
 from orchestrator.dynamic_memory import DynamicMemory
 from orchestrator.action_library import ActionLibrary
-from database.db_connector import get_chroma_collection, chroma_client
+from orchestrator.background import post_response_executor, analysis_pool
+from orchestrator.intent_matcher import (
+    get_intent_matcher, normalize,
+    INTENT_RETRIEVE_MEMORY, INTENT_THINKING_CYCLE, INTENT_REPORT_MEMORY, INTENT_SWITCH_CONTEXT
+)
 import re
 from .agent_mode import AgentMode
 
@@ -19,37 +23,109 @@ MODEL_LITE = "meituan/longcat-flash-chat:free"
 # Smart: Модель с "Reasoning" (мышлением) для режима Партнера
 MODEL_SMART = "alibaba/tongyi-deepresearch-30b-a3b:free"
 
+STOP_MARKER = "[STOP_TECHNIQUE]"
+STOP_TECHNIQUE_REPLY = "Хорошо, без проблем. Возвращаемся в обычный режим. Чем еще могу помочь?"
+
+
+class _StopMarkerFilter:
+    """
+    Фильтр потока ответа техники: придерживает хвост, который может оказаться
+    началом маркера [STOP_TECHNIQUE], чтобы маркер не попал к пользователю.
+    С hide_marker=False части проходят как есть — фильтр только собирает ответ,
+    чтобы все потоковые пути шли через один релей (_relay_turn / _arelay_turn).
+    """
+    def __init__(self, hide_marker: bool = True):
+        self.hide_marker = hide_marker
+        self.buffer = ""
+        self.emitted = 0
+        self.stopped = False
+
+    def feed(self, chunk: str) -> str:
+        self.buffer += chunk
+        if not self.hide_marker:
+            self.emitted = len(self.buffer)
+            return chunk
+        if self.stopped or STOP_MARKER in self.buffer:
+            self.stopped = True
+            return ""
+        safe_end = len(self.buffer)
+        for size in range(min(len(STOP_MARKER) - 1, len(self.buffer)), 0, -1):
+            if STOP_MARKER.startswith(self.buffer[-size:]):
+                safe_end -= size
+                break
+        visible = self.buffer[self.emitted:safe_end]
+        self.emitted = max(self.emitted, safe_end)
+        return visible
+
+    def finish(self) -> str:
+        """Возвращает остаток, который нужно показать после окончания потока."""
+        if self.stopped:
+            return ("\n\n" if self.emitted else "") + STOP_TECHNIQUE_REPLY
+        return self.buffer[self.emitted:]
+
+    @property
+    def response(self) -> str:
+        """Итоговый ответ хода (то, что сохраняется в историю)."""
+        return STOP_TECHNIQUE_REPLY if self.stopped else self.buffer
+
+
+async def _single_chunk(text: str):
+    """Асинхронный поток из одной части (ответ без генерации)."""
+    yield text
+
+
 class Orchestrator:
     def __init__(self, user_id_stub: str):
         self.user_id_stub = user_id_stub
 
         # --- РОУТИНГ МОДЕЛЕЙ ---
-        self.task_agent = TaskAgent(model_name=MODEL_LITE)
+        # Саммари старых ходов обновляется в пуле пост-обработки, а не на пути ответа
+        self.task_agent = TaskAgent(model_name=MODEL_LITE, memory_executor=post_response_executor)
         self.detector_agent = DetectorAgent(model_name=MODEL_LITE)
         self.methodology_agent = MethodologyAgent(user_id=user_id_stub, model_name=MODEL_SMART)
 
         self.memory = DynamicMemory(user_id_stub, self.task_agent)
         self.mode = AgentMode.COPILOT
         self.last_user_input = ""
-        self.vector_collection = get_chroma_collection(f"dialogue_vector_{user_id_stub}")
         self.action_library = ActionLibrary(self.methodology_agent)
+        self.intent_matcher = get_intent_matcher()
+        self.active_technique = None # Техника текущей партнерской сессии (название метода ActionLibrary)
+        self._last_intents = (None, set()) # (последнее сообщение, сработавшие намерения)
         self.strategic_note = "" # Здесь будет храниться стратегия на сессию
+        self._strategy_future = None # Фоновая выработка стратегии (запускается лениво)
+        self._background_futures = set() # Фоновые задачи этой сессии (анализ, пост-обработка)
         print(f"Оркестратор инициализирован ({user_id_stub}).")
-        self._develop_strategy() # Вырабатываем стратегию при старте
+
+    def _ensure_strategy(self):
+        """
+        Лениво запускает выработку стратегии в фоне — один раз за сессию.
+        Пока она не готова, ответы просто строятся без тактической рекомендации.
+        """
+        if self._strategy_future is None:
+            self._strategy_future = self._schedule_post_response(self._develop_strategy)
 
     def _develop_strategy(self):
         """
         Анализирует историю сессий и формирует 'стратегическую заметку'
         для улучшения качества ответов в текущей сессии.
+        Заметка сохраняется в БД и переиспользуется, пока не появится новый анализ сессии.
         """
+        latest_analysis_id, cached_note = self.memory.get_session_strategy()
+        if latest_analysis_id is None:
+            return # Стратегию не вырабатываем, если истории нет
+        if cached_note:
+            self.strategic_note = cached_note
+            print(f"💡 Стратегическая заметка на сессию (из кэша): {self.strategic_note}")
+            return
+
         recent_analyses = self.memory.get_recent_session_analyses(limit=5)
         if not recent_analyses:
-            return # Стратегию не вырабатываем, если истории нет
+            return
 
         history_summary = "\n".join(
-            [f"- Сессия от {a.ended_at.strftime('%Y-%m-%d')}: "
-             f"Темы ({a.key_topics}), Паттерны ({a.identified_patterns}). "
-             f"Резюме: {a.session_summary}" for a in recent_analyses]
+            [f"- Сессия от {a['ended_at'].strftime('%Y-%m-%d')}: "
+             f"Темы ({a['key_topics']}), Паттерны ({a['identified_patterns']}). "
+             f"Резюме: {a['session_summary']}" for a in recent_analyses]
         )
 
         strategy_prompt = f"""
@@ -63,7 +139,11 @@ class Orchestrator:
 """
 
         try:
-            self.strategic_note = self.task_agent.process("", context_memory=strategy_prompt)
+            note = self.task_agent.complete("", strategy_prompt).strip()
+            if not note:
+                return
+            self.memory.save_session_strategy(latest_analysis_id, note)
+            self.strategic_note = note
             print(f"💡 Стратегическая заметка на сессию: {self.strategic_note}")
         except Exception as e:
             print(f"Ошибка при разработке стратегии: {e}")
@@ -98,13 +178,8 @@ class Orchestrator:
 
         return None
 
-    def get_greeting(self) -> str:
-        """
-        Генерирует приветствие в зависимости от того, новый ли это пользователь.
-        """
-        user_name = self.memory.get_user_name()
-        last_summary = self.memory.get_last_session_summary()
-
+    def _compose_greeting(self, user_name: str, last_summary: str) -> str:
+        self._ensure_strategy()
         if user_name:
             greeting = f"{user_name}, рад вас снова видеть! "
             if last_summary:
@@ -115,93 +190,135 @@ class Orchestrator:
             greeting = "Здравствуйте! Чтобы наш диалог был продуктивнее, скажите, как я могу к вам обращаться?"
 
         return greeting
+
+    def get_greeting(self) -> str:
+        """
+        Генерирует приветствие в зависимости от того, новый ли это пользователь.
+        """
+        return self._compose_greeting(self.memory.get_user_name(), self.memory.get_last_session_summary())
+
+    async def aget_greeting(self) -> str:
+        """Асинхронный вариант get_greeting."""
+        return self._compose_greeting(
+            await self.memory.aget_user_name(),
+            await self.memory.aget_last_session_summary()
+        )
     
     def _sync_agent_memories(self):
         """Передаёт известные факты в агентов (опционально)"""
         # Например: если вы храните имя пользователя, можно передать в системный промпт
         pass
 
+    def _match_intents(self, text: str) -> set:
+        """
+        Классифицирует сообщение по всем наборам триггеров за один проход.
+        Результат для последнего сообщения запоминается, чтобы проверки
+        _should_* в рамках одного хода не прогоняли текст повторно.
+        """
+        cached_text, cached_intents = self._last_intents
+        if cached_text == text:
+            return cached_intents
+        intents = self.intent_matcher.match(text)
+        self._last_intents = (text, intents)
+        return intents
+
     def _should_retrieve_memory(self, text: str) -> bool:
         """Проверяет, нужно ли извлекать память."""
-        triggers = [
-            "о чём мы говорили", "что было", "напомни", "раньше говорил",
-            "прошлый раз", "уже обсуждали", "говорили ли", "помнит", "напомни"
-        ]
-        text_lower = text.lower()
-        return any(trigger in text_lower for trigger in triggers)
+        return INTENT_RETRIEVE_MEMORY in self._match_intents(text)
 
     def _should_enter_thinking_cycle(self, text: str) -> bool:
         """
         Определяет, нужно ли переходить в режим "Партнёр" (мыслительный цикл)
         на основе ключевых фраз пользователя.
         """
-        triggers = [
-            "давай подумаем", "помоги решить", "что мне делать",
-            "не могу понять", "нужен совет", "помоги разобраться"
-        ]
-        text_lower = text.lower().strip()
-        return any(trigger in text_lower for trigger in triggers)
-
-    def _diagnose_and_select_action(self, problem_description: str) -> callable:
+        return INTENT_THINKING_CYCLE in self._match_intents(text)
+
+    DIAGNOSIS_PROMPT = (
+        "Ты — AI-диагност. Твоя задача — проанализировать запрос пользователя и выбрать "
+        "наиболее подходящую мыслительную технику для его решения. "
+        "Вот доступные тебе инструменты: "
+        "1. 'run_rubber_duck_debugging': Используй, когда пользователь застрял в технической проблеме, "
+        "баге в коде или не может ясно сформулировать последовательность действий. Идеально для дебаггинга. "
+        "2. 'run_five_whys': Используй, когда проблема кажется поверхностной, и нужно докопаться до "
+        "глубинной, корневой причины. Отлично подходит для организационных или личных проблем. "
+        "3. 'run_constrained_brainstorming': Используй, когда пользователь жалуется на отсутствие идей, "
+        "творческий ступор или 'паралич чистого листа'. "
+        "В ответ ты должен вернуть ТОЛЬКО название функции, которую нужно вызвать. Например: 'run_five_whys'."
+    )
+
+    def _resolve_action_name(self, raw_response: str) -> str:
         """
-        Использует LLM для анализа проблемы и выбора наилучшего действия
-        из ActionLibrary.
-        """
-        system_prompt = (
-            "Ты — AI-диагност. Твоя задача — проанализировать запрос пользователя и выбрать "
-            "наиболее подходящую мыслительную технику для его решения. "
-            "Вот доступные тебе инструменты: "
-            "1. 'run_rubber_duck_debugging': Используй, когда пользователь застрял в технической проблеме, "
-            "баге в коде или не может ясно сформулировать последовательность действий. Идеально для дебаггинга. "
-            "2. 'run_five_whys': Используй, когда проблема кажется поверхностной, и нужно докопаться до "
-            "глубинной, корневой причины. Отлично подходит для организационных или личных проблем. "
-            "3. 'run_constrained_brainstorming': Используй, когда пользователь жалуется на отсутствие идей, "
-            "творческий ступор или 'паралич чистого листа'. "
-            "В ответ ты должен вернуть ТОЛЬКО название функции, которую нужно вызвать. Например: 'run_five_whys'."
-        )
+        Проверяет, что LLM вернул название существующей техники.
+        Если нет — используем "утенка" по умолчанию.
+        """
+        action_name = raw_response.strip()
+        if action_name.startswith("run_") and callable(getattr(self.action_library, action_name, None)):
+            return action_name
+        return "run_rubber_duck_debugging"
 
+    def _select_action_name(self, problem_description: str) -> str:
+        """Просит LLM выбрать технику и возвращает ее название в ActionLibrary."""
         # Мы используем TaskAgent как "мозг" для этой задачи
-        raw_response = self.task_agent.process(problem_description, context_memory=system_prompt)
+        raw_response = self.task_agent.complete(problem_description, self.DIAGNOSIS_PROMPT, call_type="diagnosis")
+        return self._resolve_action_name(raw_response)
 
-        # Извлекаем название функции из ответа
-        action_name = raw_response.strip()
+    async def _aselect_action_name(self, problem_description: str) -> str:
+        raw_response = await self.task_agent.acomplete(problem_description, self.DIAGNOSIS_PROMPT, call_type="diagnosis")
+        return self._resolve_action_name(raw_response)
+
+    def _current_action_name(self, problem_description: str) -> str:
+        """
+        Возвращает активную технику партнерской сессии. Диагностика выполняется
+        только в начале сессии; сбрасывает технику _reset_active_technique.
+        """
+        if self.active_technique is None:
+            self.active_technique = self._select_action_name(problem_description)
+        return self.active_technique
+
+    async def _acurrent_action_name(self, problem_description: str) -> str:
+        if self.active_technique is None:
+            self.active_technique = await self._aselect_action_name(problem_description)
+        return self.active_technique
+
+    def _reset_active_technique(self):
+        """Следующее сообщение в режиме "Партнер" снова пройдет диагностику."""
+        self.active_technique = None
 
+    def _diagnose_and_select_action(self, problem_description: str) -> callable:
+        """
+        Использует LLM для анализа проблемы и выбора наилучшего действия
+        из ActionLibrary. Выбранная техника сохраняется до конца партнерской сессии.
+        """
         # Получаем саму функцию из ActionLibrary
-        action_function = getattr(self.action_library, action_name, None)
+        return getattr(self.action_library, self._current_action_name(problem_description))
 
-        if action_function and callable(action_function):
-            return action_function
-        else:
-            # Если LLM вернул что-то не то, используем "утенка" по умолчанию
-            return self.action_library.run_rubber_duck_debugging
+    async def _adiagnose_and_select_action(self, problem_description: str) -> callable:
+        """
+        Асинхронный вариант _diagnose_and_select_action.
+        Возвращает асинхронного двойника техники (`arun_*`).
+        """
+        return getattr(self.action_library, "a" + await self._acurrent_action_name(problem_description))
 
     def _normalize_text(self, text: str) -> str:
         """Убирает лишние символы, приводит к нижнему регистру."""
-        return re.sub(r'[^\w\s]', '', text.lower().strip())
+        return normalize(text)
 
     def _should_report_memory(self, text: str) -> bool:
-        text_norm = self._normalize_text(text)
-        triggers = [
-            "расскажи про меня",
-            "что ты обо мне знаешь",
-            "что ты обо мне помнишь",
-            "что ты помнишь",
-            "что ты знаешь",
-            "напомни",
-            "о чём мы говорили",
-            "что было",
-            "уже обсуждали",
-            "что обо мне"
-        ]
-        return any(trigger in text_norm for trigger in triggers)
+        return INTENT_REPORT_MEMORY in self._match_intents(text)
+
+    def _user_message_significance(self, text: str):
+        """
+        Запрос отчета о памяти — команда, которую оркестратор обрабатывает сам:
+        фактов о пользователе в ней нет, скорер значимости она не проходит.
+        None — решение за DynamicMemory.
+        """
+        return False if self._should_report_memory(text) else None
 
     def _run_analysis_in_background(self, text: str):
         """
-        Запускает психолингвистический анализ в фоновом потоке
+        Выполняет психолингвистический анализ (в общем пуле analysis_pool)
         и сохраняет результаты в базу данных.
         """
-        # Ждем 2 секунды, чтобы основной TaskAgent успел отработать (для API)
-        time.sleep(2)
         try:
             analysis_data = self.detector_agent.analyze(text)
             if 'cognitive_biases' in analysis_data and isinstance(analysis_data.get('cognitive_biases'), list):
@@ -224,33 +341,47 @@ class Orchestrator:
         """
         Определяет, нужно ли резко сменить контекст (например, юзер на работе или злится).
         """
-        triggers = [
-            "на работе", "офис", "заебал", "придурок", "идиот",
-            "хватит", "стоп", "не то", "говно", "ссанина"
-        ]
-        return any(trigger in text.lower() for trigger in triggers)
+        return INTENT_SWITCH_CONTEXT in self._match_intents(text)
 
-    def process_input(self, text: str) -> str:
-        self.memory.save_interaction(text, is_user=True)
-        self.last_user_input = text
-
-        # 🚀 **Новый пайплайн обработки (Optimistic UI)** 🚀
-
-        # 1. Запуск асинхронного психолингвистического анализа
-        # (Запускаем сразу, поток сам сделает паузу через time.sleep(2))
+    def _start_background_analysis(self, text: str):
+        """
+        Ставит психолингвистический анализ в общую ограниченную очередь, не дожидаясь его.
+        Число одновременных запросов к API ограничено размером пула, а не паузой.
+        """
         if len(text.split()) > 7:  # Порог на минимальную длину сообщения
-            analysis_thread = threading.Thread(target=self._run_analysis_in_background, args=(text,))
-            analysis_thread.start()
+            self._track_background(analysis_pool.submit(self._run_analysis_in_background, text))
 
-        # NEW: Context Switch Check
+    def _apply_context_switch(self, text: str):
+        """Сбрасывает "инерцию" диалога, если пользователь резко сменил контекст."""
         if self._should_switch_context(text):
+            # Смена темы — активную технику нужно выбрать заново
+            self._reset_active_technique()
             # Очищаем кратковременную память агента, чтобы сбросить "инерцию" тусовки
             self.task_agent.clear_memory()
             # Добавляем системное сообщение о смене контекста
-            self.task_agent.memory.chat_memory.add_ai_message(
+            self.task_agent.memory.add_ai_message(
                 "[SYSTEM ALERT: Пользователь сменил контекст (работа/негатив). Сбрось предыдущий план. Адаптируйся под текущую ситуацию.]"
             )
 
+    def _finish_partner_turn(self, response: str) -> str:
+        # ПРОВЕРКА НА ВЫХОД ИЗ ТЕХНИКИ
+        if STOP_MARKER in response:
+            self.switch_mode(AgentMode.COPILOT)
+            response = STOP_TECHNIQUE_REPLY
+        return response
+
+    def process_input(self, text: str) -> str:
+        self.memory.save_interaction(text, is_user=True, significant=self._user_message_significance(text))
+        self.last_user_input = text
+
+        # 🚀 **Новый пайплайн обработки (Optimistic UI)** 🚀
+
+        # 1. Запуск фонового психолингвистического анализа (через очередь пула)
+        self._start_background_analysis(text)
+
+        # NEW: Context Switch Check
+        self._apply_context_switch(text)
+
         # 2. Проверка на запрос о памяти
         if self._should_report_memory(text):
             user_summary = self.memory.get_user_profile_summary()
@@ -269,55 +400,227 @@ class Orchestrator:
         if self.mode == AgentMode.COPILOT:
             response = self.handle_copilot_mode(text)
         elif self.mode == AgentMode.PARTNER:
-            response = self.handle_partner_mode(text)
-            # ПРОВЕРКА НА ВЫХОД ИЗ ТЕХНИКИ
-            if "[STOP_TECHNIQUE]" in response:
-                self.switch_mode(AgentMode.COPILOT)
-                response = "Хорошо, без проблем. Возвращаемся в обычный режим. Чем еще могу помочь?"
+            response = self._finish_partner_turn(self.handle_partner_mode(text))
         else:
             response = "Ошибка: неизвестный режим работы."
 
         # 5. Сохранение и вывод
         self.memory.save_interaction(response, is_user=False)
-        self._infer_and_save_user_traits(text, response)
+        self._run_post_response_stage(text, response)
         return response
 
+    async def aprocess_input(self, text: str) -> str:
+        """
+        Асинхронный вариант process_input. Все обращения к LLM идут через ainvoke,
+        к SQLite — через aiosqlite, поэтому ожидающий ответа пользователь
+        не занимает поток.
+        """
+        await self.memory.asave_interaction(text, is_user=True, significant=self._user_message_significance(text))
+        self.last_user_input = text
+
+        self._start_background_analysis(text)
+        self._apply_context_switch(text)
+
+        if self._should_report_memory(text):
+            user_summary = await self.memory.aget_user_profile_summary()
+            response = f"Я помню следующее о тебе:\n\n{user_summary}"
+            await self.memory.asave_interaction(response, is_user=False)
+            return response
+
+        if self._should_enter_thinking_cycle(text):
+            self.switch_mode(AgentMode.PARTNER)
+            response = await self.ahandle_partner_mode(text)
+            await self.memory.asave_interaction(response, is_user=False)
+            return response
+
+        if self.mode == AgentMode.COPILOT:
+            response = await self.ahandle_copilot_mode(text)
+        elif self.mode == AgentMode.PARTNER:
+            response = self._finish_partner_turn(await self.ahandle_partner_mode(text))
+        else:
+            response = "Ошибка: неизвестный режим работы."
+
+        await self.memory.asave_interaction(response, is_user=False)
+        self._run_post_response_stage(text, response)
+        return response
+
+    def process_input_stream(self, text: str):
+        """
+        Потоковый вариант process_input: генератор, отдающий ответ частями
+        по мере генерации. Ответ сохраняется и тогда, когда поток прерван
+        (сохраняется полученная часть); пост-обработка — когда поток дочитан.
+        """
+        self.memory.save_interaction(text, is_user=True, significant=self._user_message_significance(text))
+        self.last_user_input = text
+
+        self._start_background_analysis(text)
+        self._apply_context_switch(text)
+
+        if self._should_report_memory(text):
+            user_summary = self.memory.get_user_profile_summary()
+            response = f"Я помню следующее о тебе:\n\n{user_summary}"
+            self.memory.save_interaction(response, is_user=False)
+            yield response
+            return
+
+        # Поток текущего режима; ответ собирается и сохраняется в _relay_turn (общий релей с async-версией)
+        relay, post_process = _StopMarkerFilter(hide_marker=False), True
+        if self._should_enter_thinking_cycle(text):
+            self.switch_mode(AgentMode.PARTNER)
+            chunks, post_process = self.action_library.stream_technique(self._current_action_name(text), text), False
+        elif self.mode == AgentMode.COPILOT:
+            enriched_context = self._enrich_context(text)
+            chunks = self.task_agent.stream(text, context_memory=enriched_context)
+        elif self.mode == AgentMode.PARTNER:
+            chunks = self.action_library.stream_technique(self._current_action_name(text), text)
+            relay = _StopMarkerFilter()
+        else:
+            chunks = iter(["Ошибка: неизвестный режим работы."])
+
+        yield from self._relay_turn(text, chunks, relay, post_process)
+
+    async def aprocess_input_stream(self, text: str):
+        """Асинхронный потоковый вариант process_input (для Telegram)."""
+        await self.memory.asave_interaction(text, is_user=True, significant=self._user_message_significance(text))
+        self.last_user_input = text
+
+        self._start_background_analysis(text)
+        self._apply_context_switch(text)
+
+        if self._should_report_memory(text):
+            user_summary = await self.memory.aget_user_profile_summary()
+            response = f"Я помню следующее о тебе:\n\n{user_summary}"
+            await self.memory.asave_interaction(response, is_user=False)
+            yield response
+            return
+
+        relay, post_process = _StopMarkerFilter(hide_marker=False), True
+        if self._should_enter_thinking_cycle(text):
+            self.switch_mode(AgentMode.PARTNER)
+            chunks, post_process = self.action_library.astream_technique(await self._acurrent_action_name(text), text), False
+        elif self.mode == AgentMode.COPILOT:
+            enriched_context = await self._aenrich_context(text)
+            chunks = self.task_agent.astream(text, context_memory=enriched_context)
+        elif self.mode == AgentMode.PARTNER:
+            chunks = self.action_library.astream_technique(await self._acurrent_action_name(text), text)
+            relay = _StopMarkerFilter()
+        else:
+            chunks = _single_chunk("Ошибка: неизвестный режим работы.")
+
+        # Если потребитель бросил поток, закрываем релей явно: его finally сохранит ответ сразу
+        turn = self._arelay_turn(text, chunks, relay, post_process)
+        try:
+            async for chunk in turn:
+                yield chunk
+        finally:
+            await turn.aclose()
+
+    def _relay_turn(self, text: str, chunks, relay: _StopMarkerFilter, post_process: bool = True):
+        """
+        Пробрасывает части ответа через relay. Ответ сохраняется в finally: если
+        потребитель перестал читать поток, в историю попадает то, что успело прийти.
+        Пост-обработка — только для дочитанного ответа.
+        """
+        try:
+            for chunk in chunks:
+                visible = relay.feed(chunk)
+                if visible:
+                    yield visible
+            tail = self._finish_relay(relay)
+            if tail:
+                yield tail
+        finally:
+            if relay.response:
+                self.memory.save_interaction(relay.response, is_user=False)
+        if post_process:
+            self._run_post_response_stage(text, relay.response)
+
+    async def _arelay_turn(self, text: str, chunks, relay: _StopMarkerFilter, post_process: bool = True):
+        """Асинхронный вариант _relay_turn."""
+        try:
+            async for chunk in chunks:
+                visible = relay.feed(chunk)
+                if visible:
+                    yield visible
+            tail = self._finish_relay(relay)
+            if tail:
+                yield tail
+        finally:
+            if relay.response:
+                await self.memory.asave_interaction(relay.response, is_user=False)
+        if post_process:
+            self._run_post_response_stage(text, relay.response)
+
+    def _finish_relay(self, relay: _StopMarkerFilter) -> str:
+        """Остаток ответа после конца потока; маркер [STOP_TECHNIQUE] возвращает в режим Копилота."""
+        tail = relay.finish()
+        if relay.stopped:
+            self.switch_mode(AgentMode.COPILOT)
+        return tail
+
+    def _run_post_response_stage(self, user_input: str, agent_response: str):
+        """
+        Пост-обработка хода: работа, результат которой пользователь не видит
+        (вывод черт и т.п.), уходит в фоновый пул уже после готовности ответа.
+        """
+        self._schedule_post_response(self._infer_and_save_user_traits, user_input, agent_response)
+
+    def _schedule_post_response(self, fn, *args):
+        return self._track_background(post_response_executor.submit(fn, *args))
+
+    def _track_background(self, future):
+        self._background_futures.add(future)
+        future.add_done_callback(self._background_futures.discard)
+        return future
+
+    def pending_background_tasks(self) -> int:
+        """Число еще не завершенных фоновых задач этой сессии."""
+        return sum(1 for f in list(self._background_futures) if not f.done())
+
+    def wait_for_background_tasks(self, timeout: float = None) -> bool:
+        """Дожидается фоновых задач этой сессии. Возвращает False по таймауту."""
+        _, not_done = wait(list(self._background_futures), timeout=timeout)
+        return not not_done
+
+    TRAITS_PROMPT = (
+        "Ты — AI-аналитик, специализирующийся на психологии. Твоя задача — "
+        "проанализировать диалог и сделать выводы о пользователе. "
+        "Основывайся только на предоставленном тексте. "
+        "Верни свои выводы в виде списка JSON-объектов. Каждый объект должен иметь "
+        "три ключа: 'trait_type' (тип черты: 'preference', 'interest', 'communication_style'), "
+        "'trait_description' (описание черты) и 'confidence' (твоя уверенность в выводе от 0 до 100). "
+        "Если выводов нет, верни пустой список []."
+    )
+
+    def _save_inferred_traits(self, raw_response: str):
+        """Извлекает JSON-список черт из ответа LLM и усиливает соответствующие гипотезы."""
+        # Извлекаем JSON из ответа
+        json_part = raw_response[raw_response.find('['):raw_response.rfind(']')+1]
+        inferred_traits = json.loads(json_part)
+
+        for trait in inferred_traits:
+            if all(k in trait for k in ['trait_type', 'trait_description', 'confidence']):
+                # Пониженный порог для создания гипотезы
+                if trait['confidence'] > 50:
+                    self.memory.reinforce_user_trait(
+                        trait_type=trait['trait_type'],
+                        trait_description=trait['trait_description'],
+                        confidence=trait['confidence']
+                    )
+
     def _infer_and_save_user_traits(self, user_input: str, agent_response: str):
         """
         Анализирует последний обмен сообщениями, чтобы вывести и сохранить
         черты пользователя (предпочтения, интересы и т.д.).
         """
-        system_prompt = (
-            "Ты — AI-аналитик, специализирующийся на психологии. Твоя задача — "
-            "проанализировать диалог и сделать выводы о пользователе. "
-            "Основывайся только на предоставленном тексте. "
-            "Верни свои выводы в виде списка JSON-объектов. Каждый объект должен иметь "
-            "три ключа: 'trait_type' (тип черты: 'preference', 'interest', 'communication_style'), "
-            "'trait_description' (описание черты) и 'confidence' (твоя уверенность в выводе от 0 до 100). "
-            "Если выводов нет, верни пустой список []."
-        )
-
         # Мы используем TaskAgent как "мозг" для этой задачи
         # В будущем это может быть отдельный, специализированный агент
         dialogue_snippet = f"Пользователь: «{user_input}»\nАгент: «{agent_response}»"
 
         try:
-            # Используем TaskAgent для вывода
-            raw_response = self.task_agent.process(dialogue_snippet, context_memory=system_prompt)
-
-            # Извлекаем JSON из ответа
-            json_part = raw_response[raw_response.find('['):raw_response.rfind(']')+1]
-            inferred_traits = json.loads(json_part)
-
-            for trait in inferred_traits:
-                if all(k in trait for k in ['trait_type', 'trait_description', 'confidence']):
-                    # Пониженный порог для создания гипотезы
-                    if trait['confidence'] > 50:
-                        self.memory.reinforce_user_trait(
-                            trait_type=trait['trait_type'],
-                            trait_description=trait['trait_description'],
-                            confidence=trait['confidence']
-                        )
+            # Служебный запрос: без персоны и без записи в память диалога
+            raw_response = self.task_agent.complete(dialogue_snippet, self.TRAITS_PROMPT)
+            self._save_inferred_traits(raw_response)
         except (json.JSONDecodeError, IndexError) as e:
             # Ошибки парсинга JSON — это нормально, если LLM ответил не в том формате
             # print(f"Не удалось извлечь черты из ответа: {raw_response}. Ошибка: {e}")
@@ -326,29 +629,25 @@ class Orchestrator:
             print(f"Произошла ошибка при выводе черт пользователя: {e}")
 
 
-    def _enrich_context(self, query: str) -> str:
+    def _compose_context(self, relevant_memories: list, profile_summary: str) -> str:
         """
-        Собирает и обогащает контекст для передачи в LLM.
-        Включает стратегическую заметку, релевантные диалоги (RAG) и сводку профиля.
+        Объединяет стратегическую заметку, релевантные диалоги (RAG) и сводку профиля.
         """
+        self._ensure_strategy()
         full_context = ""
 
-        # 1. Стратегическая заметка (если есть)
+        # 1. Стратегическая заметка (если уже готова)
         if self.strategic_note:
             full_context += f"**Тактическая рекомендация на эту сессию:** {self.strategic_note}\n\n"
 
         # 2. RAG из ChromaDB
-        relevant_memories = self.memory.search_memories(query, n_results=3)
         rag_context = ""
         if relevant_memories:
             rag_context = "Вот релевантные фрагменты из прошлых диалогов:\n" + "\n".join(
                 [f"- «{m}»" for m in relevant_memories]
             )
 
-        # 3. Сводка из SQLite
-        profile_summary = self.memory.get_user_profile_summary()
-
-        # 4. Объединение
+        # 3. Объединение со сводкой из SQLite
         if profile_summary:
             full_context += f"**Информация о пользователе:**\n{profile_summary}\n\n"
         if rag_context:
@@ -356,6 +655,23 @@ class Orchestrator:
 
         return full_context
 
+    def _enrich_context(self, query: str) -> str:
+        """
+        Собирает и обогащает контекст для передачи в LLM.
+        Включает стратегическую заметку, релевантные диалоги (RAG) и сводку профиля.
+        """
+        relevant_memories = self.memory.search_memories(query, n_results=3)
+        profile_summary = self.memory.get_user_profile_summary()
+        return self._compose_context(relevant_memories, profile_summary)
+
+    async def _aenrich_context(self, query: str) -> str:
+        """Асинхронный вариант _enrich_context: RAG и профиль собираются параллельно."""
+        relevant_memories, profile_summary = await asyncio.gather(
+            self.memory.asearch_memories(query, n_results=3),
+            self.memory.aget_user_profile_summary()
+        )
+        return self._compose_context(relevant_memories, profile_summary)
+
     def handle_copilot_mode(self, text: str) -> str:
         """
         Обрабатывает режим "Копилот": прямой ответ на запрос пользователя.
@@ -367,6 +683,10 @@ class Orchestrator:
         response = self.task_agent.process(text, context_memory=enriched_context)
         return response
 
+    async def ahandle_copilot_mode(self, text: str) -> str:
+        enriched_context = await self._aenrich_context(text)
+        return await self.task_agent.aprocess(text, context_memory=enriched_context)
+
     def handle_partner_mode(self, text: str) -> str:
         """
         Обрабатывает режим "Партнёр": запускает мыслительный цикл.
@@ -380,10 +700,15 @@ class Orchestrator:
         response = action_to_run(text)
 
         return response
+
+    async def ahandle_partner_mode(self, text: str) -> str:
+        action_to_run = await self._adiagnose_and_select_action(text)
+        return await action_to_run(text)
     
     def switch_mode(self, new_mode: AgentMode):
-        """Переключает режим работы Оркестратора."""
+        """Переключает режим работы Оркестратора. Любая смена режима сбрасывает активную технику."""
         self.mode = new_mode
+        self._reset_active_technique()
         if new_mode == AgentMode.COPILOT:
             # При выходе из режима "Партнер" можно очистить память агента методологий
             self.methodology_agent.clear_memory()
@@ -403,12 +728,13 @@ class Orchestrator:
         и сохраняет результат в базу данных.
         """
         # 1. Получаем историю диалога
-        messages = self.task_agent.memory.chat_memory.messages
-        if len(messages) < 4:
+        memory = self.task_agent.memory
+        if len(memory.messages) < 4 and not memory.summary:
             print("Недостаточно сообщений для анализа сессии.")
             return
 
-        dialogue_history = "\n".join([f"{m.type}: {m.content}" for m in messages])
+        # Старая часть длинной сессии представлена саммари
+        dialogue_history = memory.transcript()
 
         # 2. Формулируем промпт для LLM
         analysis_prompt = f"""
@@ -423,7 +749,7 @@ class Orchestrator:
 
         try:
             # 3. Вызываем LLM и парсим ответ
-            raw_response = self.task_agent.process("", context_memory=analysis_prompt)
+            raw_response = self.task_agent.complete("", analysis_prompt)
 
             # --- ФИКС: Очистка JSON ---
             # Ищем, где начинается первая { и где заканчивается последняя }
@@ -460,16 +786,14 @@ class Orchestrator:
         """
         print("\n📊 АНАЛИЗ КОГНИТИВНЫХ ПАТТЕРНОВ (динамика за 30 дней):")
 
-        # Получаем все уникальные паттерны, которые когда-либо наблюдались у пользователя
-        all_patterns = self.memory.get_user_patterns()
-        unique_pattern_names = sorted(list({p.pattern_name for p in all_patterns}))
+        # Веса всех паттернов за окно считаются одним агрегирующим запросом
+        pattern_weights = self.memory.get_pattern_weights(window_days=30)
 
-        if not unique_pattern_names:
+        if not pattern_weights:
             print("Паттерны пока не наблюдались.")
             return
 
-        for pattern_name in unique_pattern_names:
-            weight = self.memory.get_pattern_weight_over_time(pattern_name, window_days=30)
+        for pattern_name, weight in pattern_weights.items():
             if weight > 0:
                 # Получаем человекочитаемое имя
                 readable_name = next((rus_name for rus_name, internal_name in RUSSIAN_TO_INTERNAL_BIAS_MAP.items() if internal_name == pattern_name), pattern_name)
@@ -488,4 +812,6 @@ class Orchestrator:
         Вызывается из main.py при штатном выходе или Ctrl+C.
         """
         print("\nЗавершение работы... Сохранение данных сессии.")
+        # Даем фоновой пост-обработке последних ходов записать результаты
+        self.wait_for_background_tasks(timeout=30)
         self._analyze_and_save_session()
@@ -0,0 +1,165 @@
+import os
+import sys
+import time
+import resource
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import wait as wait_futures
+from orchestrator.background import session_close_pool
+
+# Сколько оркестраторов держим в памяти одновременно и сколько секунд простоя допускаем
+SESSION_MAX_SIZE = int(os.environ.get("SESSION_MAX_SIZE", "200"))
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", "1800"))
+
+
+def current_rss_mb() -> float:
+    """Текущий резидентный объем памяти процесса (МБ)."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return round(resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 1)
+    except (OSError, ValueError, IndexError):
+        # Нет /proc: берем пиковое значение (ru_maxrss в байтах на macOS, в КБ в остальных)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+
+class SessionManager:
+    """
+    LRU-кэш оркестраторов с вытеснением по простою.
+
+    При превышении max_size вытесняется давно не использовавшаяся сессия,
+    а сессии, простаивающие дольше idle_ttl, вытесняются при очередном обращении
+    или плановой очистке (evict_idle). Для вытесненных сессий end_session
+    (анализ и сохранение сессии) выполняется в фоновом пуле.
+
+    Сессия, у которой идет ход (см. turn), не вытесняется: лимит max_size
+    может быть временно превышен, вытеснение произойдет после завершения хода.
+    """
+    def __init__(self, factory, max_size: int = SESSION_MAX_SIZE, idle_ttl: float = SESSION_IDLE_TTL,
+                 executor=session_close_pool, clock=time.monotonic):
+        self.factory = factory
+        self.max_size = max(1, max_size)
+        self.idle_ttl = idle_ttl
+        self.executor = executor
+        self.clock = clock
+
+        self._sessions = OrderedDict()  # key -> [оркестратор, время последнего обращения, ходов в работе]
+        self._lock = threading.Lock()
+        self._evicted_lru = 0
+        self._evicted_idle = 0
+
+    def get(self, key):
+        """Возвращает оркестратор пользователя, при необходимости создавая его."""
+        return self._acquire(key, hold=False)
+
+    @contextmanager
+    def turn(self, key):
+        """
+        Оркестратор пользователя на время хода (в том числе потокового ответа):
+        пока блок не завершен, сессия не вытесняется.
+        """
+        orchestrator = self._acquire(key, hold=True)
+        try:
+            yield orchestrator
+        finally:
+            with self._lock:
+                entry = self._sessions.get(key)
+                if entry is not None and entry[0] is orchestrator:
+                    entry[1] = self.clock()
+                    entry[2] -= 1
+                    # Порядок OrderedDict — порядок давности: _collect_evictions на нем останавливается
+                    self._sessions.move_to_end(key)
+                # Отложенные на время хода вытеснения
+                evicted = self._collect_evictions()
+            self._close(evicted)
+
+    def _acquire(self, key, hold: bool):
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is not None:
+                entry[1] = self.clock()
+                entry[2] += hold
+                self._sessions.move_to_end(key)
+                return entry[0]
+
+        # Создание оркестратора может быть долгим — не держим блокировку
+        print(f"Создаю новую сессию для user_id: {key}")
+        orchestrator = self.factory(key)
+
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                entry = [orchestrator, self.clock(), 0]
+                self._sessions[key] = entry
+            else:
+                entry[1] = self.clock()
+                self._sessions.move_to_end(key)
+            entry[2] += hold
+            evicted = self._collect_evictions(protected=key)
+
+        self._close(evicted)
+        return entry[0]
+
+    def evict_idle(self) -> int:
+        """Вытесняет сессии, простаивающие дольше idle_ttl. Возвращает их число."""
+        with self._lock:
+            evicted = self._collect_evictions()
+        self._close(evicted)
+        return len(evicted)
+
+    def _collect_evictions(self, protected=None) -> list:
+        # Вызывается под блокировкой. Самые старые сессии — в начале OrderedDict;
+        # сессии с ходом в работе и только что запрошенную (protected) не трогаем.
+        evicted = []
+        now = self.clock()
+        for key, (orchestrator, last_used, active_turns) in list(self._sessions.items()):
+            if active_turns or key == protected:
+                continue
+            if len(self._sessions) > self.max_size:
+                self._evicted_lru += 1
+            elif self.idle_ttl and now - last_used > self.idle_ttl:
+                self._evicted_idle += 1
+            else:
+                break
+            del self._sessions[key]
+            evicted.append((key, orchestrator))
+        return evicted
+
+    def _close(self, evicted: list):
+        for key, orchestrator in evicted:
+            print(f"Сессия {key} вытеснена из памяти, анализ сессии — в фоне.")
+            self.executor.submit(orchestrator.end_session)
+
+    def close_all(self, wait: bool = True):
+        """Завершает все сессии (при остановке бота)."""
+        with self._lock:
+            evicted = [entry[0] for entry in self._sessions.values()]
+            self._sessions.clear()
+        futures = [self.executor.submit(orchestrator.end_session) for orchestrator in evicted]
+        if wait:
+            wait_futures(futures)
+
+    def stats(self) -> dict:
+        """Число сессий в памяти, счетчики вытеснений и RSS процесса."""
+        with self._lock:
+            resident = len(self._sessions)
+            active_turns = sum(entry[2] for entry in self._sessions.values())
+        return {
+            "resident_sessions": resident,
+            "max_size": self.max_size,
+            "idle_ttl": self.idle_ttl,
+            "evicted_lru": self._evicted_lru,
+            "evicted_idle": self._evicted_idle,
+            "active_turns": active_turns,
+            "rss_mb": current_rss_mb(),
+        }
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._sessions
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
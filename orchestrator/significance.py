@@ -0,0 +1,108 @@
+import os
+import re
+import math
+
+# Порог значимости локального скорера и ширина "пограничной" зоны вокруг него
+SIGNIFICANCE_THRESHOLD = float(os.environ.get("SIGNIFICANCE_THRESHOLD", "0.45"))
+SIGNIFICANCE_BORDERLINE = float(os.environ.get("SIGNIFICANCE_BORDERLINE", "0.07"))
+# Пограничные сообщения дооцениваются LLM (как раньше — все сообщения)
+SIGNIFICANCE_LLM_FALLBACK = os.environ.get("SIGNIFICANCE_LLM_FALLBACK", "false").lower() in ("1", "true", "yes")
+# Штраф за почти дословный повтор уже сохраненной памяти (требует запроса к ChromaDB)
+SIGNIFICANCE_NOVELTY = os.environ.get("SIGNIFICANCE_NOVELTY", "false").lower() in ("1", "true", "yes")
+
+TOKEN_RE = re.compile(r"[A-Za-zА-Яа-яЁё0-9]+(?:-[A-Za-zА-Яа-яЁё0-9]+)*")
+
+# Служебные и слишком общие слова — не несут информации сами по себе
+STOPWORDS = {
+    "и", "а", "но", "или", "да", "нет", "не", "ни", "же", "ли", "бы", "то", "это", "этот", "эта", "эти",
+    "в", "во", "на", "с", "со", "к", "ко", "по", "о", "об", "от", "до", "из", "за", "для", "у", "при", "про",
+    "что", "как", "так", "там", "тут", "вот", "уже", "еще", "ещё", "очень", "все", "всё", "весь", "вся",
+    "он", "она", "оно", "они", "мы", "вы", "ты", "его", "ее", "её", "их", "тебя", "тебе", "вас", "нам",
+    "я", "мне", "меня", "мой", "моя", "моё", "мое", "мои", "себя", "свой", "своя",
+    "был", "была", "было", "были", "быть", "есть", "будет", "может", "надо", "нужно", "можно",
+    "если", "когда", "чтобы", "потому", "тоже", "только", "просто", "даже", "ну", "вообще", "сейчас",
+}
+
+# Реплики, которые почти никогда не стоит помнить
+FILLERS = {
+    "ок", "окей", "ага", "угу", "ясно", "понятно", "хорошо", "ладно", "спасибо", "благодарю", "пожалуйста",
+    "привет", "здравствуй", "здравствуйте", "пока", "знаю", "наверное", "может", "возможно", "ха", "хаха",
+    "норм", "нормально", "круто", "класс", "давай", "конечно", "точно", "согласен", "согласна",
+}
+
+QUESTION_WORDS = {"почему", "зачем", "как", "что", "когда", "где", "кто", "какой", "какая", "какие", "сколько", "куда", "откуда"}
+
+# Основы слов с сильной эмоциональной окраской
+EMOTION_STEMS = (
+    "тревож", "страш", "боюсь", "боюс", "злюсь", "злит", "бесит", "рад", "счаст", "груст", "печал", "устал",
+    "обид", "стыд", "вину", "винова", "одинок", "паник", "люблю", "ненави", "пережива", "волну", "отчая",
+    "депресс", "плач", "нервн", "раздраж", "довол", "горжусь", "разочар",
+)
+
+FIRST_PERSON = {"я", "мне", "меня", "мной", "мой", "моя", "моё", "мое", "мои", "моих", "моим", "мы", "нас", "наш", "наша"}
+
+# Вес признаков; сумма весов — 1.0
+WEIGHTS = {
+    "length": 0.30,
+    "density": 0.15,
+    "question": 0.15,
+    "emotion": 0.15,
+    "personal": 0.25,
+}
+
+
+class SignificanceScorer:
+    """
+    Локальная оценка информационной значимости сообщения (0.0–1.0) без обращения к LLM.
+
+    Признаки: число содержательных слов, лексическая плотность, вопрос,
+    эмоциональные маркеры, личные факты (местоимения первого лица, числа,
+    имена собственные). Опционально — штраф за повтор уже сохраненной памяти.
+    """
+    def __init__(self, threshold: float = SIGNIFICANCE_THRESHOLD, borderline: float = SIGNIFICANCE_BORDERLINE):
+        self.threshold = threshold
+        self.borderline = borderline
+
+    @staticmethod
+    def features(text: str) -> dict:
+        tokens = TOKEN_RE.findall(text)
+        words = [t.lower() for t in tokens]
+        content = [w for w in words if w not in STOPWORDS and w not in FILLERS]
+        if len(words) < 3 or not content:
+            return {name: 0.0 for name in WEIGHTS}
+
+        # Имена собственные: слова с заглавной буквы не в начале предложения
+        sentence_starts = {m.end() for m in re.finditer(r"(^|[.!?…]\s*)", text)}
+        proper_names = sum(
+            1 for m in TOKEN_RE.finditer(text)
+            if m.start() not in sentence_starts and m.group()[0].isupper()
+        )
+        has_specifics = proper_names > 0 or any(ch.isdigit() for ch in text)
+
+        return {
+            "length": min(1.0, math.log1p(len(content)) / math.log1p(12)),
+            "density": len(content) / len(words),
+            "question": 1.0 if "?" in text or words[0] in QUESTION_WORDS else 0.0,
+            "emotion": 1.0 if "!" in text or any(w.startswith(EMOTION_STEMS) for w in words) else 0.0,
+            "personal": 0.5 * any(w in FIRST_PERSON for w in words) + 0.5 * has_specifics,
+        }
+
+    def score(self, text: str, max_similarity: float = None) -> float:
+        """
+        Оценка значимости. max_similarity — наибольшее сходство с уже сохраненной
+        памятью (0..1); почти дословный повтор получает половину оценки.
+        """
+        features = self.features(text)
+        score = sum(WEIGHTS[name] * value for name, value in features.items())
+        if max_similarity is not None and max_similarity > 0.9:
+            score *= 0.5
+        return round(score, 3)
+
+    def is_significant(self, score: float) -> bool:
+        return score >= self.threshold
+
+    def is_borderline(self, score: float) -> bool:
+        return abs(score - self.threshold) < self.borderline
+
+
+significance_scorer = SignificanceScorer()
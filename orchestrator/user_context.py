@@ -0,0 +1,164 @@
+import os
+import threading
+from collections import OrderedDict
+from sqlalchemy.orm import Session, joinedload
+from database.models import User, CognitivePattern, UserTrait
+
+# Сколько снимков контекста держим в памяти процесса (по одному на пользователя)
+CONTEXT_SNAPSHOT_CACHE_SIZE = int(os.environ.get("CONTEXT_SNAPSHOT_CACHE_SIZE", "1000"))
+
+# Человекочитаемые названия паттернов для резюме профиля
+BIAS_NAMES = {
+    "black_and_white_thinking": "черно-белое мышление",
+    "catastrophizing": "катастрофизация",
+    "overgeneralization": "чрезмерное обобщение",
+    "personalization": "персонализация"
+}
+
+
+class UserContextSnapshot:
+    """
+    Материализованный контекст пользователя: все, что нужно для приветствия,
+    команды /memory и обогащения промпта, собранное за один заход в БД.
+
+    Снимок неизменяем: DynamicMemory при записи заменяет его копией
+    с изменениями (with_changes), поэтому читатели из других потоков
+    никогда не видят его наполовину обновленным.
+    """
+    def __init__(self, name: str = None, last_session_summary: str = None, patterns: tuple = (),
+                 message_count: int = 0, traits: tuple = (), emotional_tone: str = None,
+                 communication_style: str = None):
+        self.name = name
+        self.last_session_summary = last_session_summary
+        self.patterns = tuple(patterns)  # уникальные названия паттернов в порядке появления
+        self.message_count = message_count
+        self.traits = tuple(traits)  # пары (trait_type, trait_description)
+        self.emotional_tone = emotional_tone
+        self.communication_style = communication_style
+
+    @classmethod
+    def load(cls, session: Session, user_id: int) -> "UserContextSnapshot":
+        """Собирает снимок в рамках одной сессии БД."""
+        user = session.get(User, user_id, options=[joinedload(User.profile)])
+        profile = user.profile if user else None
+
+        patterns = [
+            row[0] for row in session.query(CognitivePattern.pattern_name)
+            .filter_by(user_id=user_id).distinct()
+        ]
+        message_count = user.dialogue_count if user else 0
+        traits = session.query(UserTrait.trait_type, UserTrait.trait_description).filter(
+            UserTrait.user_id == user_id
+        ).all()
+
+        return cls(
+            name=profile.name if profile else None,
+            last_session_summary=profile.last_session_summary if profile else None,
+            patterns=patterns,
+            message_count=message_count,
+            traits=[(trait_type, description) for trait_type, description in traits],
+            emotional_tone=profile.last_emotional_tone if profile else None,
+            communication_style=profile.dominant_communication_style if profile else None,
+        )
+
+    def with_changes(self, **changes) -> "UserContextSnapshot":
+        """Возвращает копию снимка с измененными полями."""
+        fields = dict(self.__dict__)
+        fields.update(changes)
+        return UserContextSnapshot(**fields)
+
+    def with_pattern(self, pattern_name: str) -> "UserContextSnapshot":
+        if pattern_name in self.patterns:
+            return self
+        return self.with_changes(patterns=self.patterns + (pattern_name,))
+
+    def with_trait(self, trait_type: str, trait_description: str) -> "UserContextSnapshot":
+        if any(description == trait_description for _, description in self.traits):
+            return self
+        return self.with_changes(traits=self.traits + ((trait_type, trait_description),))
+
+    def profile_summary(self) -> str:
+        """Краткое резюме того, что известно о пользователе."""
+        summary_parts = []
+
+        if self.name:
+            summary_parts.append(f"Тебя зовут {self.name}.")
+
+        if self.last_session_summary:
+            summary_parts.append(f"В прошлый раз мы говорили о: {self.last_session_summary}")
+
+        if self.patterns:
+            human_biases = [BIAS_NAMES.get(b, b) for b in self.patterns]
+            summary_parts.append(f"Я отмечал у тебя паттерны: {', '.join(human_biases)}.")
+
+        if self.message_count > 0:
+            summary_parts.append(f"Мы уже обменялись {self.message_count} сообщениями.")
+
+        if self.traits:
+            summary_parts.append(
+                "Наблюдаемые черты: " + "; ".join(
+                    f"[{trait_type.capitalize()}] {description}" for trait_type, description in self.traits
+                ) + "."
+            )
+
+        if self.emotional_tone:
+            summary_parts.append(f"Твой последний эмоциональный тон был '{self.emotional_tone}'.")
+        if self.communication_style:
+            summary_parts.append(f"Твой доминирующий стиль общения — '{self.communication_style}'.")
+
+        return " ".join(summary_parts) if summary_parts else "Пока что я мало о тебе знаю."
+
+
+class ContextSnapshotStore:
+    """
+    Общий для процесса кэш снимков контекста по user_id.
+
+    Все экземпляры DynamicMemory одного пользователя (например, новая сессия
+    и фоновый end_session вытесненной) читают и обновляют один и тот же снимок,
+    поэтому запись через любой из них сразу видна остальным.
+
+    Версия пользователя растет при каждом изменении: снимок, загруженный из БД
+    до записи, не кэшируется (store сверяет версию). Снимки вытесняются по LRU,
+    версии хранятся для всех пользователей (одно число на пользователя).
+    """
+    def __init__(self, max_entries: int = CONTEXT_SNAPSHOT_CACHE_SIZE):
+        self.max_entries = max(1, max_entries)
+        self._snapshots = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> tuple:
+        """(снимок или None, версия) — версию нужно передать в store после загрузки."""
+        with self._lock:
+            snapshot = self._snapshots.get(user_id)
+            if snapshot is not None:
+                self._snapshots.move_to_end(user_id)
+            return snapshot, self._versions.get(user_id, 0)
+
+    def store(self, user_id: int, snapshot: UserContextSnapshot, version: int) -> UserContextSnapshot:
+        # Если во время загрузки была запись, снимок мог устареть — не кэшируем его
+        with self._lock:
+            if self._versions.get(user_id, 0) == version:
+                self._snapshots[user_id] = snapshot
+                self._snapshots.move_to_end(user_id)
+                while len(self._snapshots) > self.max_entries:
+                    self._snapshots.popitem(last=False)
+        return snapshot
+
+    def update(self, user_id: int, change=None):
+        """
+        Применяет change(snapshot) -> snapshot к снимку пользователя, если он загружен.
+        Без change снимок сбрасывается и будет перечитан при следующем обращении.
+        """
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            snapshot = self._snapshots.get(user_id)
+            if snapshot is None:
+                return
+            if change is None:
+                del self._snapshots[user_id]
+            else:
+                self._snapshots[user_id] = change(snapshot)
+
+
+context_snapshots = ContextSnapshotStore()
@@ -4,20 +4,21 @@ os.environ["HF_HUB_DISABLE_SYMLINKS_WARNING"] = "1"
 
 print("⏳ Загрузка моделей в Docker-образ...")
 
-# 1. Загрузка для ChromaDB (ONNX версия)
+# Модель эмбеддингов (ONNX all-MiniLM-L6-v2) — общая для всех коллекций (см. database/embedding_service.py).
+# Chroma скачивает ее при первом вызове, поэтому считаем один эмбеддинг.
 try:
-    from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
-    DefaultEmbeddingFunction()
-    print("✅ ChromaDB модель (ONNX) загружена.")
+    from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+    ONNXMiniLM_L6_V2()(["прогрев модели"])
+    print("✅ Модель эмбеддингов (ONNX) загружена.")
 except Exception as e:
-    print(f"⚠️ Ошибка загрузки Chroma модели: {e}")
+    print(f"⚠️ Ошибка загрузки модели эмбеддингов: {e}")
 
-# 2. Загрузка для SentenceTransformers (PyTorch версия)
+# Словарь токенизатора для локального подсчета токенов памяти диалога (agents/conversation_memory.py)
 try:
-    from sentence_transformers import SentenceTransformer
-    SentenceTransformer("all-MiniLM-L6-v2")
-    print("✅ SentenceTransformer модель загружена.")
+    import tiktoken
+    tiktoken.get_encoding("cl100k_base")
+    print("✅ Словарь tiktoken загружен.")
 except Exception as e:
-    print(f"⚠️ Ошибка загрузки SentenceTransformer: {e}")
+    print(f"⚠️ Ошибка загрузки словаря tiktoken: {e}")
 
 print("🎉 Все модели успешно 'запечены' в образ.")
@@ -2,8 +2,16 @@ import os
 import logging
 import asyncio
 from telegram import Update
+from telegram.constants import ChatAction
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, filters
 from orchestrator.orchestrator import Orchestrator, AgentMode
+from orchestrator.background import shutdown_background_pools
+from database.write_buffer import close_write_buffer
+from database.embedding_cache import get_embedding_cache
+from agents.llm_clients import http_stats, close_http_clients, aclose_http_clients
+from agents.response_cache import get_response_cache
+from orchestrator.session_manager import SessionManager
 
 # В начале файла telegram_bot.py
 
@@ -17,22 +25,56 @@ logging.basicConfig(
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("telegram").setLevel(logging.WARNING)
 
-# Глобальный словарь сессий: {telegram_user_id: OrchestratorInstance}
-# В продакшене лучше использовать Redis, но для прототипа словарь в памяти подойдет.
-user_sessions = {}
-
-def get_orchestrator(user_id: int) -> Orchestrator:
-    """Ленивая инициализация Оркестратора для конкретного юзера."""
-    if user_id not in user_sessions:
-        # Используем ID телеграма как уникальный stub
-        print(f"Создаю новую сессию для user_id: {user_id}")
-        user_sessions[user_id] = Orchestrator(user_id_stub=str(user_id))
-    return user_sessions[user_id]
+# Потоковая выдача ответа: сообщение редактируется по мере генерации.
+# Telegram ограничивает частоту правок, поэтому правим не чаще STREAM_EDIT_INTERVAL секунд.
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.environ.get("STREAM_EDIT_INTERVAL", "1.5"))
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Сессии пользователей: {telegram_user_id: OrchestratorInstance}.
+# LRU-кэш с вытеснением по простою (SESSION_MAX_SIZE, SESSION_IDLE_TTL),
+# чтобы память процесса не росла бесконечно. Для вытесненных сессий
+# анализ (end_session) выполняется в фоне.
+sessions = SessionManager(lambda user_id: Orchestrator(user_id_stub=str(user_id)))
+SESSION_SWEEP_INTERVAL = float(os.environ.get("SESSION_SWEEP_INTERVAL", "60"))
+
+def user_session(user_id: int):
+    """
+    Оркестратор юзера (ленивая инициализация) на время обработки апдейта:
+    пока ход идет, в том числе потоковый ответ, сессия не вытесняется.
+    """
+    # Используем ID телеграма как уникальный stub
+    return sessions.turn(user_id)
+
+async def sweep_sessions():
+    """Периодически вытесняет простаивающие сессии и пишет в лог метрики памяти."""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        evicted = sessions.evict_idle()
+        stats = sessions.stats()
+        embeddings = get_embedding_cache().stats()
+        http = http_stats()
+        responses = get_response_cache().stats()
+        logging.info(
+            f"Сессий в памяти: {stats['resident_sessions']}/{stats['max_size']}, "
+            f"вытеснено по простою: {evicted}, RSS: {stats['rss_mb']} МБ, "
+            f"кэш эмбеддингов: {embeddings['hit_rate']:.0%} попаданий ({embeddings['size']} векторов), "
+            f"HTTP к LLM: {http['requests']} запросов, {http['new_connections']} новых соединений "
+            f"({http['reuse_rate']:.0%} переиспользовано), "
+            f"кэш ответов LLM: {responses['hit_rate']:.0%} попаданий ({responses['size']} ответов)"
+        )
+
+async def post_init(application):
+    application.create_task(sweep_sessions())
+
+async def post_shutdown(application):
+    # Асинхронный пул закрывается в цикле бота; синхронный нужен фоновым задачам до конца
+    await aclose_http_clients()
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    orc = get_orchestrator(update.effective_user.id)
-    # Генерируем приветствие, используя логику Оркестратора
-    greeting = orc.get_greeting()
+    with user_session(update.effective_user.id) as orc:
+        # Генерируем приветствие, используя логику Оркестратора
+        greeting = await orc.aget_greeting()
     await update.message.reply_text(greeting)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -46,38 +88,95 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(help_text)
 
 async def switch_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    orc = get_orchestrator(update.effective_user.id)
     command = update.message.text.lower()
 
-    if '/partner' in command:
-        orc.switch_mode(AgentMode.PARTNER)
-        msg = "Режим: ПАРТНЕР. Я буду задавать вопросы и использовать техники мышления."
-    elif '/copilot' in command:
-        orc.switch_mode(AgentMode.COPILOT)
-        msg = "Режим: КОПИЛОТ. Отвечаю прямо и по делу."
+    with user_session(update.effective_user.id) as orc:
+        if '/partner' in command:
+            orc.switch_mode(AgentMode.PARTNER)
+            msg = "Режим: ПАРТНЕР. Я буду задавать вопросы и использовать техники мышления."
+        elif '/copilot' in command:
+            orc.switch_mode(AgentMode.COPILOT)
+            msg = "Режим: КОПИЛОТ. Отвечаю прямо и по делу."
 
     await update.message.reply_text(msg)
 
 async def show_memory(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    orc = get_orchestrator(update.effective_user.id)
-    # Используем метод получения саммари профиля
-    summary = orc.memory.get_user_profile_summary()
+    with user_session(update.effective_user.id) as orc:
+        # Используем метод получения саммари профиля
+        summary = await orc.memory.aget_user_profile_summary()
     await update.message.reply_text(f"🧠 Моя память о вас:\n\n{summary}")
 
 async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    orc = get_orchestrator(update.effective_user.id)
-    orc.reset_all_memory()
+    with user_session(update.effective_user.id) as orc:
+        orc.reset_all_memory()
     await update.message.reply_text("🗑 Оперативная память очищена. Начинаем с чистого листа.")
 
+async def _edit_reply(message, text: str, wait_on_limit: bool = False) -> bool:
+    """Правит сообщение с ответом. Возвращает False, если Telegram отказал."""
+    try:
+        await message.edit_text(text)
+        return True
+    except RetryAfter as e:
+        if not wait_on_limit:
+            # Упёрлись в лимит правок — пропускаем эту правку, покажем текст следующей
+            return False
+        # Финальную правку терять нельзя: ждем, сколько просит Telegram
+        await asyncio.sleep(e.retry_after if isinstance(e.retry_after, (int, float)) else e.retry_after.total_seconds())
+        return await _edit_reply(message, text)
+    except BadRequest as e:
+        # "Message is not modified" и подобное — не ошибка для потокового вывода
+        logging.debug(f"Правка сообщения пропущена: {e}")
+        return False
+
+async def stream_reply(update: Update, chunks):
+    """
+    Отправляет ответ по мере генерации: первое сообщение — с первыми токенами,
+    дальше — правки не чаще STREAM_EDIT_INTERVAL. Хвост длиннее лимита Telegram
+    досылается отдельными сообщениями в конце.
+    """
+    loop = asyncio.get_running_loop()
+    message = None
+    text = ""
+    shown = ""
+    last_edit = 0.0
+
+    async for chunk in chunks:
+        text += chunk
+        visible = text[:TELEGRAM_MESSAGE_LIMIT]
+        if not visible.strip() or visible == shown:
+            continue
+        if message is None:
+            message = await update.message.reply_text(visible)
+            shown, last_edit = visible, loop.time()
+        elif loop.time() - last_edit >= STREAM_EDIT_INTERVAL:
+            if await _edit_reply(message, visible):
+                shown = visible
+            last_edit = loop.time()
+
+    # Финальное состояние: полный текст первой части и остаток отдельными сообщениями
+    head, tail = text[:TELEGRAM_MESSAGE_LIMIT], text[TELEGRAM_MESSAGE_LIMIT:]
+    if message is None:
+        if head.strip():
+            await update.message.reply_text(head)
+    elif head != shown:
+        await _edit_reply(message, head, wait_on_limit=True)
+    for start in range(0, len(tail), TELEGRAM_MESSAGE_LIMIT):
+        await update.message.reply_text(tail[start:start + TELEGRAM_MESSAGE_LIMIT])
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = update.message.text
-    orc = get_orchestrator(user_id)
 
-    # Важно: process_input — синхронная функция (блокирующая), а бот асинхронный.
-    # Чтобы бот не "замирал" для других юзеров во время генерации ответа,
-    # запускаем обработку в отдельном потоке.
-    response = await asyncio.to_thread(orc.process_input, text)
+    with user_session(user_id) as orc:
+        if STREAM_RESPONSES:
+            # Пока модель "думает", показываем индикатор набора текста
+            await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
+            await stream_reply(update, orc.aprocess_input_stream(text))
+            return
+
+        # aprocess_input полностью асинхронный (ainvoke + aiosqlite), поэтому
+        # ожидание ответа LLM не занимает поток и не блокирует других юзеров.
+        response = await orc.aprocess_input(text)
 
     await update.message.reply_text(response)
 
@@ -86,7 +185,7 @@ if __name__ == '__main__':
     if not token:
         raise ValueError("Переменная окружения TELEGRAM_TOKEN не установлена!")
 
-    application = ApplicationBuilder().token(token).build()
+    application = ApplicationBuilder().token(token).post_init(post_init).post_shutdown(post_shutdown).build()
 
     # Регистрация хендлеров
     application.add_handler(CommandHandler('start', start))
@@ -100,3 +199,10 @@ if __name__ == '__main__':
 
     print("Бот запущен...")
     application.run_polling()
+
+    # Сохраняем анализ активных сессий и дожидаемся фоновой работы перед выходом
+    sessions.close_all(wait=False)
+    shutdown_background_pools(wait=True)
+    close_write_buffer()
+    close_http_clients()
+    get_response_cache().close()
@@ -0,0 +1,78 @@
+import uuid
+import unittest
+from unittest.mock import MagicMock, AsyncMock, patch
+from langchain_core.messages import AIMessage
+from database.db_connector import session_scope, async_session_scope, async_engine
+from database.models import DialogueEntry
+from orchestrator.orchestrator import Orchestrator
+
+
+def _fake_chat(answer: str) -> MagicMock:
+    chat = MagicMock()
+    chat.ainvoke = AsyncMock(return_value=AIMessage(content=answer))
+    chat.invoke.return_value = AIMessage(content="[]")
+    return chat
+
+
+class TestAsyncPipeline(unittest.IsolatedAsyncioTestCase):
+    """Асинхронный путь хода: ainvoke вместо invoke и запись в SQLite через aiosqlite."""
+
+    def setUp(self):
+        self.chat = _fake_chat("Асинхронный ответ копилота.")
+        with patch('agents.task_agent.get_chat_model', return_value=self.chat), \
+             patch('agents.detector_agent.get_chat_model', return_value=self.chat), \
+             patch('agents.methodology_agent.get_chat_model', return_value=self.chat):
+            self.orchestrator = Orchestrator(user_id_stub=f"async_{uuid.uuid4().hex[:8]}")
+        # Без буфера write-behind реплики пишутся напрямую через aiosqlite
+        self.orchestrator.memory.write_buffer = None
+        # Память техник в ChromaDB подменяем: офлайн модель эмбеддингов недоступна
+        self.methodology_collection = MagicMock()
+        self.methodology_collection.query.return_value = {"documents": [["Прошлый раз говорили о дедлайнах."]]}
+        self.orchestrator.methodology_agent.collection = self.methodology_collection
+
+    async def asyncTearDown(self):
+        self.orchestrator.wait_for_background_tasks(timeout=10)
+        # Соединения aiosqlite привязаны к циклу событий теста
+        await async_engine.dispose()
+
+    def _dialogue(self) -> list:
+        with session_scope() as session:
+            return [
+                (entry.is_user, entry.content)
+                for entry in session.query(DialogueEntry)
+                .filter_by(user_id=self.orchestrator.memory.user_id)
+                .order_by(DialogueEntry.id)
+            ]
+
+    async def test_aprocess_input_uses_ainvoke_and_aiosqlite(self):
+        """Тест: aprocess_input отвечает через ainvoke и сохраняет обе реплики через aiosqlite."""
+        with patch('orchestrator.dynamic_memory.async_session_scope', wraps=async_session_scope) as async_scope:
+            response = await self.orchestrator.aprocess_input("Привет, как дела?")
+
+        self.assertEqual(response, "Асинхронный ответ копилота.")
+        self.chat.ainvoke.assert_awaited()
+        self.assertGreaterEqual(async_scope.call_count, 2)  # две записи реплик (+ чтение снимка контекста)
+        self.assertEqual(self._dialogue(), [(True, "Привет, как дела?"), (False, "Асинхронный ответ копилота.")])
+
+    async def test_aprocess_remembers_turn(self):
+        """Тест: TaskAgent.aprocess получает ответ через ainvoke и добавляет ход в память диалога."""
+        answer = await self.orchestrator.task_agent.aprocess("Как начать утро?")
+        self.assertEqual(answer, "Асинхронный ответ копилота.")
+        self.assertEqual([m.content for m in self.orchestrator.task_agent.memory.messages],
+                         ["Как начать утро?", "Асинхронный ответ копилота."])
+
+    async def test_aexecute_uses_ainvoke(self):
+        """Тест: MethodologyAgent.aexecute получает ответ через ainvoke и сохраняет ход в историю."""
+        agent = self.orchestrator.methodology_agent
+        answer = await agent.aexecute("Ты — партнер по мышлению.", "Почему я откладываю дела?")
+        self.assertEqual(answer, "Асинхронный ответ копилота.")
+        self.chat.invoke.assert_not_called()
+        self.assertEqual(agent.message_history[-1], ("ai", "Асинхронный ответ копилота."))
+        # Найденный контекст попадает в промпт, ход сохраняется в память техник
+        prompt = " ".join(str(m.content) for m in self.chat.ainvoke.await_args.args[0])
+        self.assertIn("Прошлый раз говорили о дедлайнах.", prompt)
+        self.methodology_collection.add.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import threading
+import unittest
+from orchestrator.background import WorkerPool, OVERFLOW_DROP, OVERFLOW_DEFER
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def _blocking_job(self, result=None):
+        self.started.set()
+        self.release.wait(5)
+        return result
+
+    def test_concurrency_is_bounded(self):
+        """Тест: одновременно выполняется не больше max_workers задач."""
+        pool = WorkerPool(max_workers=2, name="test-bounded", max_queue=10)
+        futures = [pool.submit(self._blocking_job, i) for i in range(5)]
+        self.started.wait(5)
+
+        stats = pool.stats()
+        self.assertLessEqual(stats["workers"], 2)
+        self.assertEqual(stats["active"] + stats["queue_depth"], 5)
+
+        self.release.set()
+        self.assertTrue(pool.wait(timeout=5))
+        self.assertEqual([f.result() for f in futures], list(range(5)))
+        self.assertEqual(pool.stats()["completed"], 5)
+        pool.shutdown()
+
+    def test_drop_policy_cancels_overflow(self):
+        """Тест: при политике drop лишние задачи отбрасываются и считаются в метриках."""
+        pool = WorkerPool(max_workers=1, name="test-drop", max_queue=1, overflow=OVERFLOW_DROP)
+        pool.submit(self._blocking_job)
+        self.started.wait(5)
+        queued = pool.submit(self._blocking_job)
+        dropped = pool.submit(self._blocking_job)
+
+        self.assertTrue(dropped.cancelled())
+        self.assertFalse(queued.cancelled())
+        self.assertEqual(pool.stats()["dropped"], 1)
+
+        self.release.set()
+        self.assertTrue(pool.wait(timeout=5))
+        pool.shutdown()
+
+    def test_defer_policy_runs_after_queue_drains(self):
+        """Тест: отложенные задачи выполняются после основной очереди."""
+        pool = WorkerPool(max_workers=1, name="test-defer", max_queue=1, overflow=OVERFLOW_DEFER)
+        order = []
+        pool.submit(self._blocking_job)
+        self.started.wait(5)
+        pool.submit(order.append, "queued")
+        deferred = pool.submit(order.append, "deferred")
+
+        self.assertEqual(pool.stats()["deferred"], 1)
+        self.assertFalse(deferred.cancelled())
+
+        self.release.set()
+        self.assertTrue(pool.wait(timeout=5))
+        self.assertEqual(order, ["queued", "deferred"])
+        self.assertEqual(pool.stats()["deferred_total"], 1)
+        pool.shutdown()
+
+    def test_failed_job_does_not_kill_worker(self):
+        """Тест: исключение в задаче учитывается в метриках, а пул продолжает работу."""
+        pool = WorkerPool(max_workers=1, name="test-failed", max_queue=5)
+        failing = pool.submit(lambda: 1 / 0)
+        ok = pool.submit(lambda: "ok")
+
+        self.assertTrue(pool.wait(timeout=5))
+        self.assertIsInstance(failing.exception(), ZeroDivisionError)
+        self.assertEqual(ok.result(), "ok")
+        self.assertEqual(pool.stats()["failed"], 1)
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import knowledge_base.bias_store as bias_store_module
+import numpy as np
+from knowledge_base.bias_index import BiasIndex
+from knowledge_base.bias_store import CognitiveBiasStore
+
+BIASES = [
+    {"name": "Катастрофизация", "description": "Ожидание худшего исхода."},
+    {"name": "Чтение мыслей", "description": "Уверенность, что знаешь, что думают другие."},
+    {"name": "Черно-белое мышление", "description": "Все или ничего."},
+]
+
+
+class FakeEmbeddingService:
+    """Вектор текста — число вхождений ключевых слов; запоминает вызовы."""
+    KEYWORDS = ["худш", "думают", "ничего"]
+    model_key = "fake"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_many(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[text.lower().count(k) + 0.01 for k in self.KEYWORDS] for text in texts], dtype=np.float32)
+
+
+class TestBiasIndex(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "bias_index")
+        self.service = FakeEmbeddingService()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_top_k_matches_brute_force(self):
+        """Тест: top-k совпадает с полной сортировкой косинусного сходства."""
+        rng = np.random.default_rng(0)
+        index = BiasIndex(BiasIndex._normalize(rng.normal(size=(50, 8))), [{"name": str(i), "description": ""} for i in range(50)])
+        queries = rng.normal(size=(4, 8))
+
+        expected = np.argsort(-(BiasIndex._normalize(queries) @ index.matrix.T), axis=1)[:, :5].tolist()
+        self.assertEqual(index.top_k_many(queries, k=5), expected)
+        self.assertEqual(index.query(queries[1], k=5), index.query_many(queries, k=5)[1])
+
+    def test_store_builds_once_and_memory_maps(self):
+        """Тест: каталог компилируется один раз, затем индекс читается через mmap без эмбеддингов."""
+        with patch("knowledge_base.bias_store.COGNITIVE_BIASES", BIASES):
+            CognitiveBiasStore(index_path=self.path, embedding_service=self.service)
+            self.assertEqual(len(self.service.calls), 1)
+
+            store = CognitiveBiasStore(index_path=self.path, embedding_service=self.service)
+        self.assertEqual(len(self.service.calls), 1)
+        self.assertIsInstance(store.index.matrix, np.memmap)
+
+        self.assertEqual(store.query_biases("Я уверен, что они думают обо мне плохо", n_results=1)[0]["name"],
+                         "Чтение мыслей")
+        batch = store.query_biases_many(["Будет только худшее", "", "Либо все, либо ничего"], n_results=1)
+        self.assertEqual([[b["name"] for b in biases] for biases in batch],
+                         [["Катастрофизация"], [], ["Черно-белое мышление"]])
+
+    def test_changed_catalogue_is_synced_incrementally(self):
+        """Тест: пересчитываются только добавленные и измененные записи, удаленные исчезают из индекса."""
+        with patch("knowledge_base.bias_store.COGNITIVE_BIASES", BIASES):
+            CognitiveBiasStore(index_path=self.path, embedding_service=self.service)
+
+        edited = [
+            {"name": "Катастрофизация", "description": "Ожидание самого худшего исхода."},  # изменена
+            BIASES[1],                                                                       # без изменений
+            {"name": "Долженствование", "description": "Жесткие правила «я должен»."},       # добавлена
+        ]                                                                                    # третья удалена
+        with patch("knowledge_base.bias_store.COGNITIVE_BIASES", edited):
+            store = CognitiveBiasStore(index_path=self.path, embedding_service=self.service)
+            self.assertEqual(len(self.service.calls[-1]), 2)
+            self.assertEqual([b["name"] for b in store.index.entries], [b["name"] for b in edited])
+
+            # Повторный старт с тем же каталогом ничего не эмбеддит
+            CognitiveBiasStore(index_path=self.path, embedding_service=self.service)
+        self.assertEqual(len(self.service.calls), 2)
+        self.assertEqual(store.query_biases("Все будет только хуже, худший вариант", n_results=1)[0]["name"],
+                         "Катастрофизация")
+
+    def test_truncated_index_is_rebuilt(self):
+        """Тест: обрезанный .npy (например, недокопированный) пересобирается, временных файлов не остается."""
+        with patch("knowledge_base.bias_store.COGNITIVE_BIASES", BIASES):
+            CognitiveBiasStore(index_path=self.path, embedding_service=self.service)
+            with open(f"{self.path}.npy", "r+b") as f:
+                f.truncate(100)
+
+            store = CognitiveBiasStore(index_path=self.path, embedding_service=self.service)
+        self.assertEqual(len(self.service.calls), 2)
+        self.assertEqual(len(store.index), len(BIASES))
+        self.assertEqual(sorted(os.listdir(self.dir)), ["bias_index.json", "bias_index.npy"])
+
+    def test_store_failure_is_not_retried_by_every_agent(self):
+        """Тест: ошибка сборки общего хранилища запоминается, новые агенты не повторяют ее сразу."""
+        with patch.object(bias_store_module, "_bias_store", None), \
+             patch.object(bias_store_module, "_bias_store_error", None), \
+             patch.object(bias_store_module, "CognitiveBiasStore", side_effect=OSError("модель недоступна")) as store_cls:
+            for _ in range(3):
+                with self.assertRaises(OSError):
+                    bias_store_module.get_bias_store()
+            self.assertEqual(store_cls.call_count, 1)
+
+            with patch.object(bias_store_module, "BIAS_STORE_RETRY_INTERVAL", 0):
+                with self.assertRaises(OSError):
+                    bias_store_module.get_bias_store()
+            self.assertEqual(store_cls.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
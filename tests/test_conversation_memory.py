@@ -0,0 +1,114 @@
+import os
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+from langchain_core.messages import AIMessage
+from agents.conversation_memory import ConversationMemory, count_tokens
+from agents.task_agent import TaskAgent
+
+
+class TestConversationMemory(unittest.TestCase):
+    def setUp(self):
+        self.llm = MagicMock()
+        self.llm.invoke.side_effect = lambda messages: AIMessage(content=f"резюме №{self.llm.invoke.call_count}")
+
+    def test_old_turns_are_folded_in_batches(self):
+        """Тест: последние ходы хранятся дословно, старые сворачиваются в саммари пачками."""
+        memory = ConversationMemory(llm=self.llm, max_tokens=100_000, keep_turns=2, fold_turns=2)
+        for i in range(3):
+            memory.add_turn(f"вопрос {i}", f"ответ {i}")
+        self.llm.invoke.assert_not_called()
+
+        memory.add_turn("вопрос 3", "ответ 3")
+        self.llm.invoke.assert_called_once()
+        # В промпт саммари попадают только свернутые реплики
+        prompt = self.llm.invoke.call_args.args[0][-1].content
+        self.assertIn("вопрос 1", prompt)
+        self.assertNotIn("вопрос 2", prompt)
+
+        self.assertEqual([m.content for m in memory.messages], ["вопрос 2", "ответ 2", "вопрос 3", "ответ 3"])
+        context = memory.context_messages()
+        self.assertIn("резюме №1", context[0].content)
+        self.assertEqual(len(context), 5)
+
+    def test_token_budget_is_respected(self):
+        """Тест: размер памяти не растет с числом ходов и не превышает бюджет."""
+        memory = ConversationMemory(llm=self.llm, max_tokens=200, keep_turns=50, fold_turns=1, summary_max_tokens=40)
+        for i in range(100):
+            memory.add_turn(f"Длинная реплика пользователя номер {i} " * 3, f"Развернутый ответ ассистента {i} " * 3)
+            self.assertLessEqual(memory.token_count(), 200)
+        self.assertEqual(memory.messages[-1].content, "Развернутый ответ ассистента 99 " * 3)
+
+    def test_fallback_summary_without_llm(self):
+        """Тест: без LLM старые реплики остаются в саммари в сокращенном виде."""
+        memory = ConversationMemory(llm=None, max_tokens=100_000, keep_turns=1, fold_turns=1)
+        memory.add_turn("Меня зовут Оля", "Приятно познакомиться")
+        memory.add_turn("Что дальше?", "Давай подумаем")
+        self.assertIn("Меня зовут Оля", memory.summary)
+        self.assertIn("Меня зовут Оля", memory.transcript())
+        self.assertGreater(count_tokens(memory.summary), 0)
+
+    def test_turns_are_kept_when_summarizer_fails(self):
+        """Тест: если саммари не получено, свернутые ходы не теряются и сворачиваются при следующей попытке."""
+        self.llm.invoke.side_effect = RuntimeError("LLM недоступен")
+        memory = ConversationMemory(llm=self.llm, max_tokens=100_000, keep_turns=1, fold_turns=1)
+        memory.add_turn("Меня зовут Оля", "Приятно познакомиться")
+        memory.add_turn("Что дальше?", "Давай подумаем")
+
+        self.llm.invoke.assert_called_once()
+        self.assertEqual(memory.summary, "")
+        self.assertEqual(memory.messages[0].content, "Меня зовут Оля")
+
+        self.llm.invoke.side_effect = [AIMessage(content=""), AIMessage(content="Пользователя зовут Оля.")]
+        memory.add_turn("Еще вопрос", "Ответ")
+        self.assertEqual(memory.messages[0].content, "Меня зовут Оля")
+        memory.add_turn("И еще", "Ответ")
+        self.assertEqual(memory.summary, "Пользователя зовут Оля.")
+        self.assertEqual([m.content for m in memory.messages], ["И еще", "Ответ"])
+
+    def test_fold_runs_in_executor(self):
+        """Тест: с executor ход добавляется без ожидания LLM, саммари обновляется в фоне."""
+        release = threading.Event()
+
+        def slow_summary(messages):
+            release.wait(5)
+            return AIMessage(content="резюме")
+        self.llm.invoke.side_effect = slow_summary
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            memory = ConversationMemory(llm=self.llm, max_tokens=100_000, keep_turns=1, fold_turns=1, executor=executor)
+            memory.add_turn("вопрос 0", "ответ 0")
+            memory.add_turn("вопрос 1", "ответ 1")
+            # Свертка еще идет: ходы на месте, следующий ход не ждет и не запускает вторую свертку
+            memory.add_turn("вопрос 2", "ответ 2")
+            self.assertEqual(len(memory.messages), 6)
+
+            release.set()
+            self.assertTrue(memory.wait_for_fold(timeout=5))
+        self.llm.invoke.assert_called_once()
+        self.assertEqual(memory.summary, "резюме")
+        self.assertEqual([m.content for m in memory.messages], ["вопрос 1", "ответ 1", "вопрос 2", "ответ 2"])
+
+
+class TestUtilityChannel(unittest.TestCase):
+    def test_utility_calls_do_not_touch_dialogue(self):
+        """Тест: служебные запросы идут в отдельную модель и не попадают в промпты копилота."""
+        copilot, utility = MagicMock(), MagicMock()
+        copilot.invoke.return_value = AIMessage(content="Ответ")
+        utility.invoke.return_value = AIMessage(content="0.9")
+        with patch.dict(os.environ, {"OPENROUTER_API_KEY": "test"}), \
+             patch('agents.task_agent.get_chat_model', side_effect=[copilot, utility]):
+            agent = TaskAgent()
+
+        self.assertEqual(agent.complete("Меня зовут Оля", "Оцени значимость"), "0.9")
+        agent.process("Привет")
+
+        self.assertEqual([m.content for m in agent.memory.messages], ["Привет", "Ответ"])
+        copilot_prompt = " ".join(m.content for m in copilot.invoke.call_args.args[0])
+        self.assertNotIn("Оцени значимость", copilot_prompt)
+        self.assertNotIn("0.9", copilot_prompt)
+
+
+if __name__ == '__main__':
+    unittest.main()
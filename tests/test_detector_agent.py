@@ -0,0 +1,52 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from langchain_core.messages import AIMessage
+from agents.detector_agent import DetectorAgent
+
+BIASES = [{"name": "Катастрофизация"}, {"name": "Чтение мыслей"}, {"name": "Сверхобобщение"}]
+
+
+class TestBiasVerification(unittest.TestCase):
+    def setUp(self):
+        self.llm = MagicMock()
+        with patch('agents.detector_agent.get_chat_model', return_value=self.llm), \
+             patch('agents.detector_agent.get_bias_store', return_value=MagicMock()):
+            self.detector = DetectorAgent(verify_mode="batch")
+
+    def test_batch_verifies_all_candidates_in_one_call(self):
+        """Тест: все гипотезы проверяются одним запросом, вердикты применяются по номерам."""
+        self.llm.invoke.return_value = AIMessage(
+            content='```json\n{"verdicts": [{"id": 2, "verdict": false}, {"id": 1, "verdict": true}, {"id": 3, "verdict": "TRUE"}]}\n```'
+        )
+        verified = self.detector._verify_biases("Все всегда идет плохо", BIASES)
+        self.assertEqual([b["name"] for b in verified], ["Катастрофизация", "Сверхобобщение"])
+        self.llm.invoke.assert_called_once()
+
+    def test_incomplete_batch_falls_back_to_single_checks(self):
+        """Тест: если в пакетном ответе нет вердикта для гипотезы, гипотезы проверяются по одной."""
+        responses = {"Катастрофизация": "TRUE", "Чтение мыслей": "FALSE", "Сверхобобщение": "TRUE"}
+
+        def invoke(messages):
+            prompt = messages[-1].content
+            if "verdicts" in prompt:
+                return AIMessage(content='{"verdicts": [{"id": 1, "verdict": true}]}')
+            return AIMessage(content=next(v for name, v in responses.items() if name in prompt))
+
+        self.llm.invoke.side_effect = invoke
+        verified = self.detector._verify_biases("Все всегда идет плохо", BIASES)
+        self.assertEqual([b["name"] for b in verified], ["Катастрофизация", "Сверхобобщение"])
+        self.assertEqual(self.llm.invoke.call_count, 1 + len(BIASES))
+
+    def test_concurrent_mode_checks_each_candidate(self):
+        """Тест: в режиме concurrent каждая гипотеза проверяется отдельным параллельным запросом."""
+        self.llm.invoke.side_effect = lambda messages: AIMessage(
+            content="FALSE" if "Чтение мыслей" in messages[-1].content else "TRUE"
+        )
+        self.detector.verify_mode = "concurrent"
+        verified = self.detector._verify_biases("Все всегда идет плохо", BIASES)
+        self.assertEqual([b["name"] for b in verified], ["Катастрофизация", "Сверхобобщение"])
+        self.assertEqual(self.llm.invoke.call_count, len(BIASES))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import uuid
+import datetime
+import unittest
+from unittest.mock import MagicMock, patch
+import database.db_connector  # инициализирует подключения и модели до DynamicMemory
+from database.models import CognitivePattern, DialogueEntry, User, UserProfile
+from orchestrator.dynamic_memory import DynamicMemory
+
+
+class TestUserContextSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.user_stub = f"snapshot_{uuid.uuid4().hex[:8]}"
+        self.memory = DynamicMemory(self.user_stub, MagicMock())
+
+    def test_warm_snapshot_skips_database(self):
+        """Тест: на теплом кэше приветствие и /memory не обращаются к БД."""
+        self.memory.get_user_profile_summary()  # прогрев
+
+        with patch('orchestrator.dynamic_memory.session_scope', side_effect=AssertionError("обращение к БД")):
+            self.assertIsNone(self.memory.get_user_name())
+            self.assertIsNone(self.memory.get_last_session_summary())
+            self.assertEqual(self.memory.get_user_profile_summary(), "Пока что я мало о тебе знаю.")
+
+    def test_writes_update_snapshot(self):
+        """Тест: записи обновляют снимок, и он совпадает с тем, что лежит в БД."""
+        self.memory.get_user_profile_summary()  # прогрев
+
+        self.memory.save_user_name("Оля")
+        self.memory.save_cognitive_pattern("catastrophizing", 80, "Все пропало")
+        self.memory.reinforce_user_trait("интерес", f"Любит шахматы ({self.user_stub})", 70)
+        self.memory.save_psycholinguistic_features("Тревога", "Эмоциональный")
+
+        with patch('orchestrator.dynamic_memory.session_scope', side_effect=AssertionError("обращение к БД")):
+            self.assertEqual(self.memory.get_user_name(), "Оля")
+            cached_summary = self.memory.get_user_profile_summary()
+
+        self.assertIn("катастрофизация", cached_summary)
+        self.assertIn("Тревога", cached_summary)
+        # Свежий экземпляр читает снимок из БД — результат должен совпасть
+        fresh = DynamicMemory(self.user_stub, MagicMock())
+        self.assertEqual(fresh.get_user_profile_summary(), cached_summary)
+
+    def test_session_analysis_invalidates_snapshot(self):
+        """Тест: сохранение анализа сессии сбрасывает снимок."""
+        self.memory.get_user_profile_summary()
+        self.memory.save_session_analysis("Итоги", ["тема"], ["паттерн"])
+        self.assertIsNone(self.memory.context_snapshots.get(self.memory.user_id)[0])
+
+    def test_snapshot_is_shared_between_instances(self):
+        """Тест: запись через вытесненный экземпляр (фоновый end_session) видна новой сессии того же пользователя."""
+        evicted = self.memory
+        evicted.get_user_profile_summary()
+        current = DynamicMemory(self.user_stub, MagicMock())
+        current.get_user_profile_summary()  # прогрев новой сессии
+
+        evicted.save_cognitive_pattern("personalization", 70, "Это все из-за меня")
+        evicted.save_session_summary("Обсуждали чувство вины")
+
+        summary = current.get_user_profile_summary()
+        self.assertIn("персонализация", summary)
+        self.assertIn("Обсуждали чувство вины", summary)
+
+
+
+class TestPatternWeights(unittest.TestCase):
+    def setUp(self):
+        self.memory = DynamicMemory(f"weights_{uuid.uuid4().hex[:8]}", MagicMock())
+        now = datetime.datetime.utcnow()
+        self.observations = [("catastrophizing", 0), ("catastrophizing", 7), ("catastrophizing", 45),
+                             ("personalization", 14), ("personalization", 14)]
+        with database.db_connector.session_scope() as session:
+            for pattern_name, days_ago in self.observations:
+                session.add(CognitivePattern(
+                    user_id=self.memory.user_id, pattern_name=pattern_name, confidence_score=80,
+                    context="", observed_at=now - datetime.timedelta(days=days_ago, hours=1)
+                ))
+
+    def _expected_weight(self, pattern_name, window_days=None):
+        return round(sum(
+            0.9 ** (days_ago / 7) for name, days_ago in self.observations
+            if name == pattern_name and (window_days is None or days_ago <= window_days)
+        ), 2)
+
+    def test_weights_for_all_patterns_in_one_call(self):
+        """Тест: веса всех паттернов в окне совпадают с поштучным расчетом."""
+        weights = self.memory.get_pattern_weights(window_days=30)
+        self.assertEqual(weights, {
+            "catastrophizing": self._expected_weight("catastrophizing", 30),
+            "personalization": self._expected_weight("personalization", 30),
+        })
+        self.assertEqual(self.memory.get_pattern_weight_over_time("personalization", window_days=10), 0.0)
+
+    def test_pattern_weight_covers_all_time(self):
+        """Тест: get_pattern_weight учитывает наблюдения вне окна."""
+        self.assertEqual(self.memory.get_pattern_weight("catastrophizing"), self._expected_weight("catastrophizing"))
+
+
+
+class TestDialogueCompaction(unittest.TestCase):
+    def setUp(self):
+        self.task_agent = MagicMock()
+        self.task_agent.complete.return_value = "0.0"  # реплики незначимы — ChromaDB не трогаем
+        self.memory = DynamicMemory(f"compaction_{uuid.uuid4().hex[:8]}", self.task_agent)
+        for i in range(6):
+            self.memory.save_interaction(f"Реплика {i}", is_user=False)
+
+    def _dialogue_count(self):
+        with database.db_connector.session_scope() as session:
+            return session.query(User.dialogue_count).filter(User.id == self.memory.user_id).scalar()
+
+    def test_llm_call_runs_outside_transaction(self):
+        """Тест: во время вызова LLM база открыта для записи, саммари и удаление коммитятся вместе."""
+        def summarize(*args, **kwargs):
+            # Запись из "другого пользователя" не должна ждать компактизацию
+            self.memory.save_psycholinguistic_features("Спокойный", "Аналитический")
+            return "Краткое саммари"
+        self.task_agent.complete.side_effect = summarize
+
+        self.assertEqual(self._dialogue_count(), 6)
+        self.assertEqual(self.memory.summarize_old_dialogues(window_size=4, summarization_threshold=5), 4)
+
+        self.assertEqual(self._dialogue_count(), 2)
+        with database.db_connector.session_scope() as session:
+            profile = session.query(UserProfile).filter_by(user_id=self.memory.user_id).one()
+            self.assertIn("Краткое саммари", profile.long_term_summary)
+            remaining = session.query(DialogueEntry).filter_by(user_id=self.memory.user_id).count()
+        self.assertEqual(remaining, 2)
+
+    def test_compaction_is_scheduled_in_background(self):
+        """Тест: save_interaction не суммаризирует сам, а ставит задачу в фоновый пул."""
+        with patch('orchestrator.dynamic_memory.COMPACTION_THRESHOLD', 5), \
+             patch('orchestrator.dynamic_memory.compaction_pool') as mock_pool:
+            self.memory.save_interaction("Еще одна реплика", is_user=True)
+        mock_pool.submit.assert_called_once_with(self.memory.summarize_old_dialogues)
+        self.assertEqual(self._dialogue_count(), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from database.embedding_cache import EmbeddingCache
+from database.embedding_service import EmbeddingService, EMBEDDING_BACKENDS
+
+
+class CountingBackend:
+    """Детерминированные векторы; запоминает, какие тексты реально эмбеддились."""
+    name = "counting"
+    calls = []
+
+    def __init__(self, threads: int = 0):
+        pass
+
+    def embed(self, texts):
+        CountingBackend.calls.append(list(texts))
+        return np.array([np.full(4, len(text), dtype=np.float32) for text in texts])
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        CountingBackend.calls = []
+        EMBEDDING_BACKENDS[CountingBackend.name] = CountingBackend
+
+    def tearDown(self):
+        EMBEDDING_BACKENDS.pop(CountingBackend.name)
+
+    def _service(self, cache, batch_size=32):
+        return EmbeddingService(backend=CountingBackend.name, batch_size=batch_size, cache=cache)
+
+    def test_repeated_texts_are_embedded_once(self):
+        """Тест: повторный текст берется из кэша, модель считает только новые тексты."""
+        service = self._service(EmbeddingCache(max_entries=10))
+
+        first = service.embed_many(["Я боюсь провала", "Я боюсь провала", "Новый текст"])
+        second = service.embed("Я боюсь провала")
+
+        self.assertEqual(CountingBackend.calls, [["Я боюсь провала", "Новый текст"]])
+        self.assertEqual(first.shape, (3, 4))
+        np.testing.assert_array_equal(first[0], second)
+        stats = service.cache.stats()
+        self.assertEqual((stats["memory_hits"], stats["misses"]), (1, 3))
+
+    def test_embed_many_splits_into_batches(self):
+        """Тест: embed_many отдает модели батчи не больше batch_size."""
+        service = self._service(cache=None, batch_size=2)
+        self.assertEqual(service.embed_many(["а", "бб", "ввв"]).shape, (3, 4))
+        self.assertEqual(CountingBackend.calls, [["а", "бб"], ["ввв"]])
+
+    def test_lru_eviction_and_disk_tier(self):
+        """Тест: вытесненный из LRU вектор поднимается с диска, в том числе после перезапуска."""
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        try:
+            cache = EmbeddingCache(max_entries=1, disk_path=path)
+            service = self._service(cache)
+            service.embed("первый")
+            service.embed("второй")  # вытесняет "первый" из памяти
+            service.embed("первый")
+            self.assertEqual(len(CountingBackend.calls), 2)
+            self.assertEqual(cache.stats()["disk_hits"], 1)
+            cache.close()
+
+            restarted = self._service(EmbeddingCache(max_entries=10, disk_path=path))
+            restarted.embed("второй")
+            self.assertEqual(len(CountingBackend.calls), 2)
+            restarted.cache.close()
+        finally:
+            os.remove(path)
+
+    def test_disk_tier_is_read_from_many_threads(self):
+        """Тест: потоки читают дисковый уровень через свои соединения, без общей блокировки на SQLite."""
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        try:
+            writer = EmbeddingCache(max_entries=10, disk_path=path)
+            keys = [EmbeddingCache.key("model", f"текст {i}") for i in range(8)]
+            writer.put_many(keys, [np.full(4, i, dtype=np.float32) for i in range(8)])
+            writer.close()
+
+            restarted = EmbeddingCache(max_entries=10, disk_path=path)
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                vectors = list(pool.map(lambda key: restarted.get_many([key])[0], keys))
+            for i, vector in enumerate(vectors):
+                np.testing.assert_array_equal(vector, np.full(4, i, dtype=np.float32))
+            self.assertEqual(restarted.stats()["disk_hits"], 8)
+            restarted.close()
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import json
+import os
+import tempfile
+import unittest
+from orchestrator.intent_matcher import (
+    IntentMatcher, DEFAULT_TRIGGERS,
+    INTENT_THINKING_CYCLE, INTENT_REPORT_MEMORY, INTENT_RETRIEVE_MEMORY, INTENT_SWITCH_CONTEXT
+)
+
+
+class TestIntentMatcher(unittest.TestCase):
+    def setUp(self):
+        self.matcher = IntentMatcher(DEFAULT_TRIGGERS)
+
+    def test_returns_all_fired_intents(self):
+        """Тест: за один проход возвращаются все сработавшие намерения."""
+        intents = self.matcher.match("Давай подумаем, что было на работе?")
+        self.assertEqual(intents, {
+            INTENT_THINKING_CYCLE, INTENT_REPORT_MEMORY, INTENT_RETRIEVE_MEMORY, INTENT_SWITCH_CONTEXT
+        })
+        self.assertEqual(self.matcher.match("Привет! Как дела?"), set())
+
+    def test_overlapping_phrases(self):
+        """Тест: фраза внутри другой фразы и совпадения через суффиксные ссылки."""
+        matcher = IntentMatcher({"long": ["что ты обо мне знаешь"], "short": ["обо мне"], "tail": ["мне зна"]})
+        self.assertEqual(matcher.match("А что ты обо мне знаешь?"), {"long", "short", "tail"})
+        self.assertEqual(matcher.match("что ты обо мне"), {"short"})
+
+    def test_triggers_loaded_from_file(self):
+        """Тест: наборы из JSON-файла переопределяют встроенные и добавляют новые."""
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+            json.dump({INTENT_SWITCH_CONTEXT: ["я в метро"], "gratitude": ["спасибо"]}, f, ensure_ascii=False)
+        try:
+            matcher = IntentMatcher.from_file(f.name)
+        finally:
+            os.remove(f.name)
+
+        self.assertEqual(matcher.match("Спасибо, я в метро"), {INTENT_SWITCH_CONTEXT, "gratitude"})
+        self.assertNotIn(INTENT_SWITCH_CONTEXT, matcher.match("Я на работе"))
+        self.assertIn(INTENT_THINKING_CYCLE, matcher.match("Помоги решить задачу"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from unittest.mock import patch
+import httpx
+from agents import llm_clients
+from agents.llm_clients import ConnectionStats, get_chat_model, get_http_client, get_async_http_client
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSharedHttpPool(unittest.TestCase):
+    @patch.dict(os.environ, {"OPENROUTER_API_KEY": "test"})
+    def test_chat_models_share_one_pool(self):
+        """Тест: клиенты разных моделей и температур используют общие HTTP-клиенты процесса."""
+        detector = get_chat_model("detector-model", temperature=0.1)
+        copilot = get_chat_model("copilot-model", temperature=0.7, default_headers={"X-Title": "test"})
+        for chat in (detector, copilot):
+            self.assertIs(chat.root_client._client, get_http_client())
+            self.assertIs(chat.root_async_client._client, get_async_http_client())
+
+    def test_connection_reuse_is_counted(self):
+        """Тест: повторные запросы идут по keep-alive соединению и учитываются как переиспользованные."""
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        stats = ConnectionStats()
+        try:
+            with httpx.Client(event_hooks={"response": [stats.record]}) as client:
+                for _ in range(5):
+                    client.get(f"http://127.0.0.1:{server.server_port}/").read()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot["requests"], 5)
+        self.assertEqual(snapshot["new_connections"], 1)
+        self.assertAlmostEqual(snapshot["reuse_rate"], 0.8)
+
+    def tearDown(self):
+        llm_clients.close_http_clients()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+import sqlalchemy
+import database.db_connector  # инициализирует подключения и модели
+from database.models import Base
+from database.migrations import upgrade_schema, get_schema_version, SCHEMA_VERSION
+
+COMPOSITE_INDEXES = [
+    "ix_dialogue_entries_user_timestamp",
+    "ix_cognitive_patterns_user_pattern_observed",
+    "ix_cognitive_patterns_user_observed_pattern",
+    "ix_session_analyses_user_ended",
+    "ix_user_traits_user_description",
+]
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.engine = sqlalchemy.create_engine(f"sqlite:///{self.db_path}")
+
+        # База "как до миграций": таблицы есть, составных индексов, счетчика и версии нет
+        Base.metadata.create_all(bind=self.engine)
+        with self.engine.begin() as connection:
+            for index_name in COMPOSITE_INDEXES:
+                connection.exec_driver_sql(f"DROP INDEX {index_name}")
+            connection.exec_driver_sql("ALTER TABLE users DROP COLUMN dialogue_count")
+            connection.exec_driver_sql("INSERT INTO users (id, user_id_stub) VALUES (1, 'legacy')")
+            for i in range(3):
+                connection.exec_driver_sql(
+                    f"INSERT INTO dialogue_entries (user_id, is_user, content) VALUES (1, 1, 'реплика {i}')"
+                )
+            connection.exec_driver_sql("PRAGMA user_version = 0")
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.db_path)
+
+    def _query_plan(self, sql: str) -> str:
+        with self.engine.connect() as connection:
+            rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+        return "\n".join(row[-1] for row in rows)
+
+    def test_upgrades_existing_database_in_place(self):
+        """Тест: старая база получает составные индексы и актуальную версию схемы."""
+        self.assertEqual(upgrade_schema(self.engine, Base.metadata), SCHEMA_VERSION)
+
+        with self.engine.connect() as connection:
+            self.assertEqual(get_schema_version(connection), SCHEMA_VERSION)
+        indexes = {
+            index["name"]
+            for table in ("dialogue_entries", "cognitive_patterns", "session_analyses", "user_traits")
+            for index in sqlalchemy.inspect(self.engine).get_indexes(table)
+        }
+        self.assertTrue(set(COMPOSITE_INDEXES) <= indexes)
+
+        # Счетчик реплик добавлен и заполнен по существующим данным
+        with self.engine.connect() as connection:
+            dialogue_count = connection.exec_driver_sql("SELECT dialogue_count FROM users WHERE id = 1").scalar()
+        self.assertEqual(dialogue_count, 3)
+
+        # Повторный запуск ничего не ломает
+        self.assertEqual(upgrade_schema(self.engine, Base.metadata), SCHEMA_VERSION)
+
+    def test_hot_queries_use_composite_indexes(self):
+        """Тест: горячие запросы идут по составным индексам, без сортировки во временном B-дереве."""
+        upgrade_schema(self.engine, Base.metadata)
+
+        plan = self._query_plan(
+            "SELECT id, is_user, content FROM dialogue_entries WHERE user_id = 1 ORDER BY timestamp LIMIT 20"
+        )
+        self.assertIn("ix_dialogue_entries_user_timestamp", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+        plan = self._query_plan(
+            "SELECT * FROM session_analyses WHERE user_id = 1 ORDER BY ended_at DESC LIMIT 5"
+        )
+        self.assertIn("ix_session_analyses_user_ended", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+        plan = self._query_plan(
+            "SELECT count(id) FROM cognitive_patterns "
+            "WHERE user_id = 1 AND pattern_name = 'catastrophizing' AND observed_at >= '2024-01-01'"
+        )
+        self.assertIn("ix_cognitive_patterns_user_pattern_observed", plan)
+
+        # Веса за окно: поиск по диапазону observed_at, а не по всей истории пользователя
+        plan = self._query_plan(
+            "SELECT pattern_name, CAST(julianday('now') - julianday(observed_at) AS INTEGER) AS days_ago, count(id) "
+            "FROM cognitive_patterns WHERE user_id = 1 AND observed_at >= '2024-01-01' GROUP BY pattern_name, days_ago"
+        )
+        self.assertIn("ix_cognitive_patterns_user_observed_pattern (user_id=? AND observed_at>?)", plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
+import asyncio
+import datetime
+import threading
 import unittest
-from unittest.mock import MagicMock, patch
-from orchestrator.orchestrator import Orchestrator, AgentMode
+from unittest.mock import MagicMock, AsyncMock, patch
+from orchestrator.orchestrator import Orchestrator, AgentMode, STOP_TECHNIQUE_REPLY
 import json
 
 class TestOrchestrator(unittest.TestCase):
@@ -25,6 +28,7 @@ class TestOrchestrator(unittest.TestCase):
 
         # Базовый ответ от TaskAgent (чтобы не падал на json.loads в некоторых местах, если нужно)
         self.mock_task_agent.process.return_value = '[]'
+        self.mock_task_agent.complete.return_value = '[]'
 
     @patch('orchestrator.orchestrator.Orchestrator._develop_strategy')
     def test_full_thinking_cycle(self, mock_develop_strategy):
@@ -33,7 +37,7 @@ class TestOrchestrator(unittest.TestCase):
         Проверяет, что вызывается execute() вместо invoke().
         """
         # Мокируем ответ диагностического агента (TaskAgent), чтобы он выбрал технику
-        self.mock_task_agent.process.return_value = 'run_five_whys'
+        self.mock_task_agent.complete.return_value = 'run_five_whys'
 
         # Мокируем ответ методологического агента (через execute)
         self.mock_methodology_agent.execute.return_value = 'Ответ техники 5 почему.'
@@ -85,5 +89,160 @@ class TestOrchestrator(unittest.TestCase):
             emotional_tone="Тревога", communication_style="Эмоциональный"
         )
 
+    @patch('orchestrator.orchestrator.Orchestrator._develop_strategy')
+    def test_trait_inference_runs_after_reply(self, mock_develop_strategy):
+        """
+        Тест: вывод черт пользователя не задерживает ответ —
+        он выполняется в фоне уже после возврата из process_input.
+        """
+        self.mock_task_agent.process.return_value = 'Прямой ответ.'
+        release = threading.Event()
+        # Стратегия сессии тоже вырабатывается в фоне — дожидаемся ее заранее
+        self.orchestrator._ensure_strategy()
+        self.orchestrator.wait_for_background_tasks(timeout=5)
+
+        with patch.object(self.orchestrator, '_infer_and_save_user_traits',
+                          side_effect=lambda *args: release.wait(5)) as mock_infer:
+            response = self.orchestrator.process_input("Привет")
+
+            # Ответ уже готов, а пост-обработка еще идет
+            self.assertEqual(response, 'Прямой ответ.')
+            self.assertEqual(self.orchestrator.pending_background_tasks(), 1)
+
+            release.set()
+            self.assertTrue(self.orchestrator.wait_for_background_tasks(timeout=5))
+
+        mock_infer.assert_called_once_with("Привет", 'Прямой ответ.')
+        self.assertEqual(self.orchestrator.pending_background_tasks(), 0)
+
+    @patch('orchestrator.orchestrator.Orchestrator._develop_strategy')
+    def test_stream_hides_stop_marker(self, mock_develop_strategy):
+        """
+        Тест: в потоковом режиме маркер [STOP_TECHNIQUE], разбитый на части,
+        не доходит до пользователя, а режим возвращается в Копилот.
+        """
+        self.orchestrator.mode = AgentMode.PARTNER
+        self.mock_task_agent.complete.return_value = 'run_five_whys'
+        self.mock_methodology_agent.stream_execute.return_value = iter(["Ок", "ей. [STOP_", "TECHNIQUE]"])
+
+        chunks = list(self.orchestrator.process_input_stream("Хочу закончить"))
+
+        self.assertNotIn("STOP", "".join(chunks))
+        self.assertTrue("".join(chunks).startswith("Окей. "))
+        self.assertEqual(self.orchestrator.mode, AgentMode.COPILOT)
+        self.orchestrator.wait_for_background_tasks(timeout=5)
+
+    def test_async_stream_hides_stop_marker(self):
+        """Тест: асинхронный поток техники скрывает маркер так же, как синхронный, и сохраняет ответ."""
+        async def chunks(*args):
+            for chunk in ["Ок", "ей. [STOP_", "TECHNIQUE]"]:
+                yield chunk
+
+        async def read_stream():
+            return [chunk async for chunk in self.orchestrator.aprocess_input_stream("Хочу закончить")]
+
+        self.orchestrator.mode = AgentMode.PARTNER
+        self.orchestrator._acurrent_action_name = AsyncMock(return_value='run_five_whys')
+        self.orchestrator.memory.asave_interaction = AsyncMock()
+        self.mock_methodology_agent.astream_execute.side_effect = chunks
+
+        reply = "".join(asyncio.run(read_stream()))
+
+        self.assertNotIn("STOP", reply)
+        self.assertTrue(reply.startswith("Окей. "))
+        self.assertEqual(self.orchestrator.mode, AgentMode.COPILOT)
+        self.orchestrator.memory.asave_interaction.assert_awaited_with(STOP_TECHNIQUE_REPLY, is_user=False)
+        self.orchestrator.wait_for_background_tasks(timeout=5)
+
+    def test_interrupted_stream_saves_partial_reply(self):
+        """Тест: если потребитель перестал читать поток, полученная часть ответа все равно сохраняется."""
+        async def chunks(*args, **kwargs):
+            for chunk in ["Первая часть. ", "Вторая часть."]:
+                yield chunk
+
+        async def read_first_chunk():
+            stream = self.orchestrator.aprocess_input_stream("Привет")
+            first = await stream.__anext__()
+            await stream.aclose()
+            return first
+
+        self.orchestrator._enrich_context = MagicMock(return_value="")
+        self.orchestrator._aenrich_context = AsyncMock(return_value="")
+        self.mock_task_agent.stream.return_value = iter(["Первая часть. ", "Вторая часть."])
+        self.mock_task_agent.astream.side_effect = chunks
+        self.orchestrator.memory.asave_interaction = AsyncMock()
+
+        stream = self.orchestrator.process_input_stream("Привет")
+        self.assertEqual(next(stream), "Первая часть. ")
+        stream.close()
+        self.orchestrator.memory.save_interaction.assert_called_with("Первая часть. ", is_user=False)
+
+        self.assertEqual(asyncio.run(read_first_chunk()), "Первая часть. ")
+        self.orchestrator.memory.asave_interaction.assert_awaited_with("Первая часть. ", is_user=False)
+        self.orchestrator.wait_for_background_tasks(timeout=5)
+
+    def test_technique_is_sticky_within_partner_session(self):
+        """
+        Тест: техника выбирается один раз за партнерскую сессию
+        и выбирается заново только после смены темы.
+        """
+        self.orchestrator.mode = AgentMode.PARTNER
+        self.mock_task_agent.complete.return_value = 'run_five_whys'
+        self.mock_methodology_agent.execute.return_value = 'Почему?'
+
+        self.orchestrator.process_input("Я опять не успел сдать отчет")
+        self.orchestrator.process_input("Потому что начал в последний момент")
+        diagnosis_calls = [c for c in self.mock_task_agent.complete.call_args_list
+                           if Orchestrator.DIAGNOSIS_PROMPT in c.args]
+        self.assertEqual(len(diagnosis_calls), 1)
+        self.assertEqual(self.orchestrator.active_technique, 'run_five_whys')
+
+        # Смена контекста сбрасывает технику
+        self.orchestrator.process_input("Стоп, я на работе")
+        diagnosis_calls = [c for c in self.mock_task_agent.complete.call_args_list
+                           if Orchestrator.DIAGNOSIS_PROMPT in c.args]
+        self.assertEqual(len(diagnosis_calls), 2)
+        self.orchestrator.wait_for_background_tasks(timeout=5)
+
+    def test_memory_report_command_is_not_scored(self):
+        """Тест: запрос отчета о памяти сохраняется в историю, но не проходит скорер значимости."""
+        self.orchestrator.memory.get_user_profile_summary.return_value = "Имя: Оля"
+
+        self.orchestrator.process_input("Что ты обо мне знаешь?")
+        self.orchestrator.memory.save_interaction.assert_any_call("Что ты обо мне знаешь?", is_user=True, significant=False)
+
+        self.orchestrator.process_input("Я боюсь провалить собеседование")
+        self.orchestrator.memory.save_interaction.assert_any_call(
+            "Я боюсь провалить собеседование", is_user=True, significant=None
+        )
+        self.orchestrator.wait_for_background_tasks(timeout=5)
+
+    def test_cached_strategy_is_reused(self):
+        """Тест: если стратегия для последнего анализа уже сохранена, LLM не вызывается."""
+        self.orchestrator.memory.get_session_strategy.return_value = (7, "Обсудить эмоции.")
+
+        self.orchestrator._develop_strategy()
+
+        self.assertEqual(self.orchestrator.strategic_note, "Обсудить эмоции.")
+        self.mock_task_agent.complete.assert_not_called()
+        self.orchestrator.memory.save_session_strategy.assert_not_called()
+
+    def test_strategy_is_developed_in_background_and_saved(self):
+        """Тест: после нового анализа стратегия вырабатывается в фоне и сохраняется в БД."""
+        self.orchestrator.memory.get_session_strategy.return_value = (8, None)
+        self.orchestrator.memory.get_recent_session_analyses.return_value = [{
+            "ended_at": datetime.datetime(2024, 5, 1),
+            "key_topics": "прокрастинация",
+            "identified_patterns": "катастрофизация",
+            "session_summary": "Говорили о дедлайнах.",
+        }]
+        self.mock_task_agent.complete.return_value = "Попробовать обсудить эмоции."
+
+        self.orchestrator.get_greeting()
+        self.assertTrue(self.orchestrator.wait_for_background_tasks(timeout=5))
+
+        self.assertEqual(self.orchestrator.strategic_note, "Попробовать обсудить эмоции.")
+        self.orchestrator.memory.save_session_strategy.assert_called_once_with(8, "Попробовать обсудить эмоции.")
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,113 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from agents.response_cache import ResponseCache, cached_invoke, acached_invoke
+
+
+class _FakeLLM:
+    model_name = "fake/model"
+    temperature = 0.1
+
+    def __init__(self, answer="TRUE"):
+        self.answer = answer
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        return AIMessage(content=self.answer)
+
+    async def ainvoke(self, messages):
+        return self.invoke(messages)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(max_entries=10, ttl=60, disk_path="", calls="verify")
+        patcher = patch('agents.response_cache.get_response_cache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeated_request_is_served_from_cache(self):
+        """Тест: повтор запроса (с точностью до пробелов) не уходит в LLM, попадания учитываются."""
+        llm = _FakeLLM()
+        first = [SystemMessage(content="Output only TRUE or FALSE."), HumanMessage(content="Текст:  «я  всегда проигрываю»")]
+        again = [SystemMessage(content="Output only TRUE or FALSE."), HumanMessage(content="Текст: «я всегда проигрываю»\n")]
+
+        self.assertEqual(cached_invoke(llm, first, "verify"), "TRUE")
+        self.assertEqual(asyncio.run(acached_invoke(llm, again, "verify")), "TRUE")
+        self.assertEqual(llm.calls, 1)
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["by_call"]["verify"], {"memory_hits": 1, "disk_hits": 0, "misses": 1})
+        self.assertAlmostEqual(stats["hit_rate"], 0.5)
+
+    def test_only_enabled_and_valid_calls_are_cached(self):
+        """Тест: выключенные типы вызовов и ответы, не прошедшие проверку, не кэшируются."""
+        messages = [HumanMessage(content="Привет")]
+        llm = _FakeLLM(answer="не знаю")
+        cached_invoke(llm, messages, "analysis")
+        cached_invoke(llm, messages, "analysis")
+        cached_invoke(llm, messages, "verify", validate=lambda content: "TRUE" in content)
+        cached_invoke(llm, messages, "verify", validate=lambda content: "TRUE" in content)
+        self.assertEqual(llm.calls, 4)
+
+    def test_message_analysis_is_not_cached_by_default(self):
+        """Тест: по умолчанию кэшируются только верификация, значимость и диагностика."""
+        self.assertEqual(ResponseCache(disk_path="").calls, {"verify", "significance", "diagnosis"})
+
+    def test_ttl_and_disk_tier(self):
+        """Тест: ответ переживает перезапуск через SQLite и перестает отдаваться после TTL."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "llm_cache.db")
+            writer = ResponseCache(disk_path=path, ttl=60)
+            writer.put("verify", "key", "FALSE")
+            writer.close()
+
+            restarted = ResponseCache(disk_path=path, ttl=60)
+            self.assertEqual(restarted.get("verify", "key"), "FALSE")
+            self.assertEqual(restarted.stats()["disk_hits"], 1)
+
+            with patch('agents.response_cache.time.time', return_value=10 ** 12):
+                self.assertIsNone(restarted.get("verify", "key"))
+            restarted.close()
+
+    def test_async_disk_tier_runs_off_event_loop(self):
+        """Тест: в acached_invoke запросы к SQLite идут в пуле потоков, попадания в память — сразу."""
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(disk_path=os.path.join(directory, "llm_cache.db"), ttl=60, calls="verify")
+            llm = _FakeLLM()
+            messages = [HumanMessage(content="Текст: «я всегда проигрываю»")]
+            with patch('agents.response_cache.get_response_cache', return_value=cache), \
+                 patch('agents.response_cache.asyncio.to_thread', wraps=asyncio.to_thread) as to_thread:
+                self.assertEqual(asyncio.run(acached_invoke(llm, messages, "verify")), "TRUE")
+                disk_calls = to_thread.call_count
+                self.assertEqual(asyncio.run(acached_invoke(llm, messages, "verify")), "TRUE")
+
+            self.assertEqual(disk_calls, 2)  # промах на диске и запись ответа
+            self.assertEqual(to_thread.call_count, 2)  # повтор обслужен памятью
+            self.assertEqual(llm.calls, 1)
+            cache.close()
+
+    def test_disk_tier_is_read_from_many_threads(self):
+        """Тест: потоки читают дисковый уровень через свои соединения, без общей блокировки на SQLite."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "llm_cache.db")
+            writer = ResponseCache(disk_path=path, ttl=60)
+            for i in range(8):
+                writer.put("verify", f"key{i}", f"ответ {i}")
+            writer.close()
+
+            restarted = ResponseCache(disk_path=path, ttl=60)
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                answers = list(pool.map(lambda i: restarted.get("verify", f"key{i}"), range(8)))
+            self.assertEqual(answers, [f"ответ {i}" for i in range(8)])
+            self.assertEqual(restarted.stats()["disk_hits"], 8)
+            restarted.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from unittest.mock import MagicMock
+from orchestrator.background import WorkerPool
+from orchestrator.session_manager import SessionManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSessionManager(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.executor = WorkerPool(max_workers=1, name="test-session-close", max_queue=10)
+        self.created = {}
+
+        def factory(user_id):
+            orchestrator = MagicMock(name=f"orchestrator-{user_id}")
+            self.created[user_id] = orchestrator
+            return orchestrator
+
+        self.sessions = SessionManager(factory, max_size=2, idle_ttl=60,
+                                       executor=self.executor, clock=self.clock)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_reuses_existing_session(self):
+        """Тест: повторное обращение возвращает тот же оркестратор."""
+        self.assertIs(self.sessions.get(1), self.sessions.get(1))
+        self.assertEqual(len(self.created), 1)
+
+    def test_evicts_least_recently_used(self):
+        """Тест: при превышении max_size вытесняется давно не использовавшаяся сессия."""
+        self.sessions.get(1)
+        self.sessions.get(2)
+        self.sessions.get(1)  # 1 снова "свежая", самая старая — 2
+        self.sessions.get(3)
+
+        self.assertIn(1, self.sessions)
+        self.assertNotIn(2, self.sessions)
+        self.assertTrue(self.executor.wait(timeout=5))
+        self.created[2].end_session.assert_called_once()
+        self.created[1].end_session.assert_not_called()
+        self.assertEqual(self.sessions.stats()["evicted_lru"], 1)
+
+    def test_evicts_idle_sessions(self):
+        """Тест: сессии, простаивающие дольше idle_ttl, вытесняются при очистке."""
+        self.sessions.get(1)
+        self.clock.now = 30
+        self.sessions.get(2)
+        self.clock.now = 75
+
+        self.assertEqual(self.sessions.evict_idle(), 1)
+        self.assertNotIn(1, self.sessions)
+        self.assertIn(2, self.sessions)
+        self.assertTrue(self.executor.wait(timeout=5))
+        self.created[1].end_session.assert_called_once()
+
+        stats = self.sessions.stats()
+        self.assertEqual(stats["resident_sessions"], 1)
+        self.assertEqual(stats["evicted_idle"], 1)
+        self.assertGreater(stats["rss_mb"], 0)
+
+    def test_session_with_turn_in_progress_is_not_evicted(self):
+        """Тест: сессия с незавершенным ходом (например, потоковым ответом) не вытесняется до конца хода."""
+        with self.sessions.turn(1) as orchestrator:
+            self.assertIs(orchestrator, self.created[1])
+            self.clock.now = 120
+            self.sessions.get(2)
+            self.sessions.get(3)  # превышение max_size: вытесняется 2, а не занятая 1
+            self.assertEqual(self.sessions.evict_idle(), 0)
+            self.assertIn(1, self.sessions)
+            self.assertNotIn(2, self.sessions)
+            self.assertEqual(self.sessions.stats()["active_turns"], 1)
+
+        self.clock.now = 300
+        self.assertEqual(self.sessions.evict_idle(), 2)
+        self.assertTrue(self.executor.wait(timeout=5))
+        self.created[1].end_session.assert_called_once()
+
+    def test_long_turn_does_not_shield_idle_sessions(self):
+        """Тест: после долгого хода сессия становится самой свежей и не заслоняет простаивающие от очистки."""
+        with self.sessions.turn(1):
+            self.clock.now = 10
+            self.sessions.get(2)
+            self.clock.now = 50  # ход сессии 1 закончился позже последнего обращения к 2
+        self.clock.now = 100  # 2 простаивает 90 секунд, 1 — только 50
+
+        self.assertEqual(self.sessions.evict_idle(), 1)
+        self.assertIn(1, self.sessions)
+        self.assertNotIn(2, self.sessions)
+        self.assertTrue(self.executor.wait(timeout=5))
+
+    def test_close_all_ends_every_session(self):
+        """Тест: при остановке бота end_session вызывается для всех сессий в памяти."""
+        self.sessions.get(1)
+        self.sessions.get(2)
+        self.sessions.close_all(wait=True)
+        self.assertEqual(len(self.sessions), 0)
+        self.created[1].end_session.assert_called_once()
+        self.created[2].end_session.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import uuid
+import unittest
+from unittest.mock import MagicMock, patch
+import database.db_connector  # инициализирует подключения и модели
+from orchestrator.dynamic_memory import DynamicMemory
+from orchestrator.significance import SignificanceScorer
+
+
+class TestSignificanceScorer(unittest.TestCase):
+    def setUp(self):
+        self.scorer = SignificanceScorer(threshold=0.45, borderline=0.07)
+
+    def test_fillers_are_not_significant(self):
+        """Тест: приветствия, благодарности и короткие реплики не попадают в долгосрочную память."""
+        for text in ["ок", "Угу, ясно", "да, наверное, не знаю", "Спасибо большое, было полезно"]:
+            self.assertFalse(self.scorer.is_significant(self.scorer.score(text)), text)
+
+    def test_facts_questions_and_emotions_are_significant(self):
+        """Тест: личные факты, вопросы и сильные эмоции признаются значимыми."""
+        for text in [
+            "У меня дедлайн 15 марта по проекту для Сбербанка",
+            "Почему я все время откладываю важные дела?",
+            "Я очень боюсь, что провалю собеседование в понедельник",
+        ]:
+            self.assertTrue(self.scorer.is_significant(self.scorer.score(text)), text)
+
+    def test_repeated_memory_is_penalized(self):
+        """Тест: почти дословный повтор сохраненной реплики оценивается ниже."""
+        text = "Я очень боюсь, что провалю собеседование в понедельник"
+        self.assertLess(self.scorer.score(text, max_similarity=0.97), self.scorer.score(text, max_similarity=0.3))
+
+
+class TestSignificanceInMemory(unittest.TestCase):
+    def setUp(self):
+        self.task_agent = MagicMock()
+        self.task_agent.complete.return_value = "0.9"
+        self.memory = DynamicMemory(f"significance_{uuid.uuid4().hex[:8]}", self.task_agent)
+
+    def test_llm_is_not_called_by_default(self):
+        """Тест: без SIGNIFICANCE_LLM_FALLBACK значимость решается локально, LLM не вызывается."""
+        self.assertTrue(self.memory._is_significant("Почему я все время откладываю важные дела?"))
+        self.assertFalse(self.memory._is_significant("Привет, как дела?"))
+        self.task_agent.complete.assert_not_called()
+
+    def test_llm_fallback_only_for_borderline(self):
+        """Тест: при включенном fallback LLM дооценивает только пограничные сообщения."""
+        with patch('orchestrator.dynamic_memory.SIGNIFICANCE_LLM_FALLBACK', True), \
+             patch('orchestrator.dynamic_memory.significance_scorer', SignificanceScorer(threshold=0.45, borderline=0.07)):
+            self.assertFalse(self.memory._is_significant("Угу, ясно"))
+            self.task_agent.complete.assert_not_called()
+
+            # Оценка около 0.39 — пограничная, решение за LLM
+            self.assertTrue(self.memory._is_significant("Как перестать сравнивать себя с другими?"))
+            self.task_agent.complete.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
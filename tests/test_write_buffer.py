@@ -0,0 +1,85 @@
+import uuid
+import unittest
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+import database.db_connector  # инициализирует подключения и модели
+from database.write_buffer import WriteBehindBuffer
+from orchestrator.dynamic_memory import DynamicMemory
+from orchestrator.background import post_response_executor
+
+
+class TestWriteBehindBuffer(unittest.TestCase):
+    def setUp(self):
+        self.transactions = []
+
+        @contextmanager
+        def fake_session_scope():
+            session = []
+            yield session
+            self.transactions.append(session)
+
+        # Длинный интервал: пачку коммитит явный flush()
+        self.buffer = WriteBehindBuffer(interval_ms=60_000, max_rows=1000, session_factory=fake_session_scope)
+
+    def tearDown(self):
+        self.buffer.close()
+
+    def test_operations_are_committed_in_one_batch(self):
+        """Тест: накопленные операции коммитятся одной транзакцией, Future получают результаты."""
+        futures = [self.buffer.submit(lambda session, i: session.append(i) or i * 10, i) for i in range(5)]
+        self.assertFalse(any(f.done() for f in futures))
+
+        self.assertEqual(self.buffer.flush(), 5)
+        self.assertEqual(self.transactions, [[0, 1, 2, 3, 4]])
+        self.assertEqual([f.result() for f in futures], [0, 10, 20, 30, 40])
+        self.assertEqual(self.buffer.stats()["batches"], 1)
+
+    def test_failed_operation_does_not_lose_batch(self):
+        """Тест: ошибка одной операции не откатывает остальные записи пачки."""
+        ok = self.buffer.submit(lambda session: session.append("ok"))
+        failing = self.buffer.submit(lambda session: 1 / 0)
+
+        self.buffer.flush()
+        self.assertIsNone(ok.result())
+        self.assertIsInstance(failing.exception(), ZeroDivisionError)
+        self.assertIn(["ok"], self.transactions)
+        self.assertEqual(self.buffer.stats()["failed"], 1)
+
+
+class TestWriteBehindMemory(unittest.TestCase):
+    def test_reads_see_buffered_writes(self):
+        """Тест: чтение паттернов и контекста видит записи, еще не закоммиченные буфером."""
+        memory = DynamicMemory(f"write_behind_{uuid.uuid4().hex[:8]}", MagicMock())
+        memory.write_buffer = WriteBehindBuffer(interval_ms=60_000)
+        try:
+            memory.save_cognitive_pattern("catastrophizing", 80, "Все пропало")
+            memory.save_interaction("Ответ агента", is_user=False)
+            self.assertEqual(memory.write_buffer.stats()["queued"], 2)
+
+            self.assertIn("catastrophizing", memory.get_pattern_weights(window_days=30))
+            self.assertIn("1 сообщениями", memory.get_user_profile_summary())
+        finally:
+            memory.write_buffer.close()
+
+    def test_user_message_does_not_force_flush(self):
+        """Тест: реплика пользователя не коммитит пачку сама, векторная запись идет после коммита."""
+        memory = DynamicMemory(f"write_behind_{uuid.uuid4().hex[:8]}", MagicMock())
+        memory.write_buffer = WriteBehindBuffer(interval_ms=60_000)
+        try:
+            with patch.object(memory, "_is_significant", return_value=True), \
+                    patch.object(memory, "_add_to_vector_memory") as add_to_vector:
+                memory.save_interaction("Я решил сменить профессию", is_user=True)
+                self.assertEqual(memory.write_buffer.stats()["queued"], 1)
+                add_to_vector.assert_not_called()
+
+                memory.write_buffer.flush()
+                post_response_executor.wait(timeout=5)
+                entry_id, text, _ = add_to_vector.call_args.args
+                self.assertIsInstance(entry_id, int)
+                self.assertEqual(text, "Я решил сменить профессию")
+        finally:
+            memory.write_buffer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()